@@ -1,9 +0,0 @@
-# Backup original handler.py and replace with database-aware version
-cp src/signalhub/handler.py src/signalhub/handler.py.backup
-cp src/signalhub/handler_updated.py src/signalhub/handler.py
-
-# Backup original app.py and replace with database-aware version  
-cp src/signalhub/app.py src/signalhub/app.py.backup
-cp src/signalhub/app_updated.py src/signalhub/app.py
-
-# The files are now updated to use database settings!
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""Micro-benchmark: HTML alert body to notification text.
+
+Compares the single-pass extractor with the per-message regex stripping
+it replaced (``regex``, tags only) and with a multi-pass regex pipeline
+producing comparable text (``regex_full``: drops script/style, decodes
+entities, collapses whitespace). Each corpus file is also measured
+repeated 20 times, like a long log-style report, where stopping at the
+text budget pays off. The corpus files are synthetic look-alikes of
+UniFi, Synology and NUT alert mail.
+
+    PYTHONPATH=src python benchmarks/bench_html.py [-n 2000]
+"""
+import re
+import sys
+import json
+import timeit
+import argparse
+from html import unescape
+from pathlib import Path
+
+from signalhub.htmltext import html_to_text
+
+CORPUS = Path(__file__).parent / "corpus"
+TAG_RE = re.compile(r'<[^<]+?>')
+SKIP_RE = re.compile(r'<(script|style|head)\b.*?</\1\s*>|<!--.*?-->', re.S | re.I)
+BLOCK_RE = re.compile(r'</?(?:p|div|br|tr|li|table|h[1-6])\b[^>]*>', re.I)
+SPACE_RE = re.compile(r'[^\S\n]+')
+LINES_RE = re.compile(r'\s*\n\s*')
+
+
+def regex_strip(html, limit=1024):
+    return TAG_RE.sub('', html)[:limit]
+
+
+def regex_full(html, limit=1024):
+    text = BLOCK_RE.sub('\n', SKIP_RE.sub('', html))
+    text = unescape(TAG_RE.sub('', text))
+    return LINES_RE.sub('\n', SPACE_RE.sub(' ', text)).strip()[:limit]
+
+
+CANDIDATES = (("regex", regex_strip), ("regex_full", regex_full), ("htmltext", html_to_text))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--number", type=int, default=2000)
+    args = parser.parse_args(argv)
+    results = []
+    for path in sorted(CORPUS.glob("*.html")):
+        source = path.read_text(encoding="utf-8")
+        for repeat in (1, 20):
+            html = source * repeat
+            number = max(1, args.number // repeat)
+            row = {"file": path.name, "repeat": repeat, "bytes": len(html)}
+            for name, func in CANDIDATES:
+                seconds = timeit.timeit(lambda: func(html), number=number)
+                row[f"{name}_us"] = round(seconds / number * 1e6, 2)
+            row["text_chars"] = len(html_to_text(html))
+            results.append(row)
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
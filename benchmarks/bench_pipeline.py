@@ -0,0 +1,369 @@
+"""Load test: concurrent SMTP clients -> SignalHub -> fake Pushover API.
+
+Starts the real server (``signalhub.app.serve``, or the worker pool with
+``--smtp-workers``) in a subprocess with a throwaway database and spool,
+and a local fake Pushover API with configurable latency and error rate.
+``--clients`` SMTP connections then send ``--messages`` messages drawn
+from a mix of plain text of several sizes, HTML alerts from ``corpus/``
+and multipart mail with a JPEG-sized attachment. Reports accepted
+messages/sec, accept latency (MAIL FROM to the reply to the message data)
+and delivery latency (MAIL FROM to the fake API accepting the push) as
+JSON tagged with the git commit, so runs can be compared across commits
+with ``compare.py``.
+
+    PYTHONPATH=src python benchmarks/bench_pipeline.py [--messages 2000] [--output FILE]
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from collections import Counter
+from email.message import EmailMessage
+from pathlib import Path
+
+from aiohttp import web
+
+from signalhub.config import Config
+
+CORPUS = Path(__file__).parent / "corpus"
+SEQ_RE = re.compile(r"\[bench (\d+)\]")
+WORDS = ("disk", "volume", "degraded", "battery", "online", "offline", "link", "camera",
+         "motion", "backup", "failed", "completed", "temperature", "warning", "host")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def pick(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 3)
+    return {"p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": round(values[-1] * 1000, 3)}
+
+
+# -- message mix -----------------------------------------------------------
+
+def _words(size, rng):
+    text = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        text.append(word)
+        length += len(word) + 1
+    return " ".join(text)
+
+
+def _to_wire(msg):
+    # SMTP wants CRLF line endings and dot-stuffing
+    data = msg.as_bytes().replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+    return re.sub(rb"(?m)^\.", b"..", data)
+
+
+def build_templates(sizes, attachment_kb, seed=1):
+    """Wire-format messages keyed by kind; ``@@SEQ@@`` marks the subject id."""
+    rng = random.Random(seed)
+    templates = {}
+    for size in sizes:
+        msg = EmailMessage()
+        msg["Subject"] = "[bench @@SEQ@@] plain alert"
+        msg.set_content(_words(size, rng))
+        templates[f"plain_{size}"] = _to_wire(msg)
+    for path in sorted(CORPUS.glob("*.html")):
+        msg = EmailMessage()
+        msg["Subject"] = "[bench @@SEQ@@] html alert [PRIO=1]"
+        msg.set_content(path.read_text(encoding="utf-8"), subtype="html")
+        templates[f"html_{path.stem}"] = _to_wire(msg)
+    msg = EmailMessage()
+    msg["Subject"] = "[bench @@SEQ@@] motion detected"
+    msg.set_content(_words(200, rng))
+    msg.add_attachment(rng.randbytes(attachment_kb * 1024), maintype="image", subtype="jpeg",
+                       filename="snapshot.jpg")
+    templates["attachment"] = _to_wire(msg)
+    return templates
+
+
+def parse_mix(spec, templates):
+    """``plain=6,html=3,attachment=1`` -> weighted template names."""
+    names, weights = [], []
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        matching = [name for name in templates if name == kind or name.startswith(kind + "_")]
+        if not matching:
+            raise SystemExit(f"unknown message kind {kind!r}")
+        for name in matching:
+            names.append(name)
+            weights.append(float(weight or 1) / len(matching))
+    return names, weights
+
+
+# -- fake Pushover ---------------------------------------------------------
+
+class FakePushover:
+    """Answers like api.pushover.net after ``latency`` seconds (+- jitter)."""
+
+    def __init__(self, latency, jitter, error_rate, seed=2):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.delivered = {}
+        self.requests = 0
+        self.errors = 0
+        self.runner = None
+        self.port = None
+
+    async def handle(self, request):
+        form = await request.post()
+        self.requests += 1
+        delay = self.latency * (1 + self.jitter * (2 * self.rng.random() - 1))
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"status": 0, "errors": ["injected"]}, status=500)
+        m = SEQ_RE.search(form.get("title", ""))
+        if m:
+            self.delivered.setdefault(int(m.group(1)), time.perf_counter())
+        return web.json_response({"status": 1, "request": "bench"})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/1/messages.json", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        self.port = free_port()
+        await web.TCPSite(self.runner, "127.0.0.1", self.port).start()
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+# -- SMTP load generator ---------------------------------------------------
+
+class SMTPClient:
+    """Minimal SMTP client keeping one connection open for many messages."""
+
+    async def connect(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        await self._reply()
+        await self._command(b"EHLO bench.local")
+
+    async def _reply(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError("server closed the connection")
+            if line[3:4] != b"-":
+                return int(line[:3])
+
+    async def _command(self, line):
+        self.writer.write(line + b"\r\n")
+        return await self._reply()
+
+    async def send(self, mail_from, rcpt_to, data):
+        code = await self._command(b"MAIL FROM:<" + mail_from + b">")
+        if code != 250:
+            return code
+        code = await self._command(b"RCPT TO:<" + rcpt_to + b">")
+        if code != 250:
+            await self._command(b"RSET")
+            return code
+        code = await self._command(b"DATA")
+        if code != 354:
+            return code
+        self.writer.write(data + b"\r\n.\r\n")
+        return await self._reply()
+
+    async def close(self):
+        try:
+            await self._command(b"QUIT")
+        except (ConnectionError, OSError):
+            pass
+        self.writer.close()
+
+
+async def run_clients(args, port, templates, names, weights):
+    rng = random.Random(3)
+    plan = rng.choices(names, weights, k=args.messages)
+    next_seq = iter(range(args.messages))
+    started = {}
+    accept = []
+    replies = Counter()
+    errors = Counter()
+
+    async def client():
+        smtp = SMTPClient()
+        await smtp.connect("127.0.0.1", port)
+        for seq in next_seq:
+            data = templates[plan[seq]].replace(b"@@SEQ@@", str(seq).encode(), 1)
+            t0 = started[seq] = time.perf_counter()
+            try:
+                code = await smtp.send(b"bench@lab.local", b"alerts@home.local", data)
+            except (ConnectionError, OSError) as e:
+                errors[type(e).__name__] += 1
+                started.pop(seq)
+                smtp = SMTPClient()
+                await smtp.connect("127.0.0.1", port)
+                continue
+            replies[code] += 1
+            if code == 250:
+                accept.append(time.perf_counter() - t0)
+            else:
+                started.pop(seq)
+        await smtp.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.clients)))
+    return started, accept, replies, errors, time.perf_counter() - t0
+
+
+# -- server process --------------------------------------------------------
+
+def _run_server(config, db_path, log_path):
+    os.environ["API_DB_PATH"] = db_path
+    # Send the server's (and any worker's) log lines to the log file
+    fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+    os.dup2(fd, 2)
+    from signalhub.api.db import init_db
+    from signalhub.app import serve, serve_workers
+    from signalhub.logs import setup_logging
+    init_db()
+    setup_logging(config)
+    if config.smtp_workers > 1:
+        serve_workers(config)
+    else:
+        serve(config)
+
+
+async def wait_for_smtp(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            smtp = SMTPClient()
+            await smtp.connect("127.0.0.1", port)
+            await smtp.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise SystemExit(f"SMTP server did not come up on port {port}")
+
+
+async def bench(args):
+    templates = build_templates(args.sizes, args.attachment_kb)
+    names, weights = parse_mix(args.mix, templates)
+    fake = FakePushover(args.latency / 1000, args.jitter, args.error_rate)
+    await fake.start()
+    tmp = tempfile.mkdtemp(prefix="signalhub-bench-")
+    smtp_port = free_port()
+    config = Config(
+        listen_port=smtp_port,
+        health_port=free_port(),
+        pushover_api_url=f"http://127.0.0.1:{fake.port}/1/messages.json",
+        pushover_token="bench-token",
+        default_user_key="bench-user",
+        rate_limit_per_minute=10 ** 9,
+        pushover_monthly_quota=10 ** 9,
+        pushover_quota_reserve=0,
+        queue_dir=os.path.join(tmp, "queue"),
+        delivery_workers=args.delivery_workers,
+        max_retries=args.max_retries,
+        retry_delay=args.retry_delay,
+        smtp_workers=args.smtp_workers,
+        log_level=args.log_level,
+    )
+    server = multiprocessing.get_context("spawn").Process(
+        target=_run_server, args=(config, os.path.join(tmp, "signalhub.db"), args.server_log))
+    server.start()
+    try:
+        await wait_for_smtp(smtp_port)
+        if args.smtp_workers > 1:
+            await asyncio.sleep(1)  # let every worker bind the port
+        started, accept, replies, errors, duration = await run_clients(
+            args, smtp_port, templates, names, weights)
+        deadline = time.monotonic() + args.drain_timeout
+        while time.monotonic() < deadline and not started.keys() <= fake.delivered.keys():
+            await asyncio.sleep(0.05)
+    finally:
+        server.terminate()
+        server.join(30)
+        await fake.stop()
+
+    delivery = [fake.delivered[seq] - t0 for seq, t0 in started.items() if seq in fake.delivered]
+    accepted = replies.get(250, 0)
+    return {
+        "benchmark": "pipeline",
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "server_log")},
+        "results": {
+            "sent": args.messages,
+            "accepted": accepted,
+            "replies": {str(code): count for code, count in sorted(replies.items())},
+            "client_errors": dict(errors),
+            "duration_s": round(duration, 3),
+            "accepted_per_s": round(accepted / duration, 1) if duration else None,
+            "accept_ms": percentiles(accept),
+            "delivered": len(delivery),
+            "undelivered": accepted - len(delivery),
+            "delivery_ms": percentiles(delivery),
+            "pushover_requests": fake.requests,
+            "pushover_errors_injected": fake.errors,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--messages", type=int, default=2000)
+    parser.add_argument("-c", "--clients", type=int, default=20, help="concurrent SMTP connections")
+    parser.add_argument("--mix", default="plain=6,html=3,attachment=1",
+                        help="weighted message kinds: plain, html, attachment (or e.g. plain_20000)")
+    parser.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=[200, 2000, 20000],
+                        help="plain body sizes in bytes")
+    parser.add_argument("--attachment-kb", type=int, default=256)
+    parser.add_argument("--latency", type=float, default=50, help="fake Pushover latency (ms)")
+    parser.add_argument("--jitter", type=float, default=0.5, help="latency +- this fraction")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of pushes answered 500")
+    parser.add_argument("--smtp-workers", type=int, default=1)
+    parser.add_argument("--delivery-workers", type=int, default=Config.delivery_workers)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--retry-delay", type=float, default=0.2, help="base retry backoff (s)")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="max wait for deliveries (s)")
+    parser.add_argument("--log-level", default="INFO")
+    parser.add_argument("--server-log", default=os.devnull)
+    parser.add_argument("-o", "--output", help="also write the JSON result to this file")
+    args = parser.parse_args(argv)
+    result = asyncio.run(bench(args))
+    text = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(text + "\n")
+    sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
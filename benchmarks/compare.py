@@ -0,0 +1,54 @@
+"""Compare two benchmark result files (e.g. from ``make bench`` on two commits).
+
+Prints every numeric result present in both files with the relative
+change; run parameters, commits and timestamps are not compared.
+
+    python benchmarks/compare.py benchmarks/results/pipeline-abc123.json benchmarks/results/pipeline-def456.json
+"""
+import sys
+import json
+import argparse
+
+SKIP = {"params", "commit", "timestamp", "python", "benchmark"}
+
+
+def flatten(value, prefix=""):
+    """Numeric leaves as ``path -> number``; list rows are keyed by their file/repeat."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if not prefix and key in SKIP:
+                continue
+            yield from flatten(item, f"{prefix}{key}.")
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            label = i
+            if isinstance(item, dict) and "file" in item:
+                label = f"{item['file']}x{item.get('repeat', 1)}"
+            yield from flatten(item, f"{prefix}{label}.")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix[:-1], value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args(argv)
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    if isinstance(before, dict) and before.get("params") != after.get("params"):
+        sys.stderr.write("warning: runs used different parameters\n")
+    old = dict(flatten(before))
+    width = max((len(key) for key in old), default=0)
+    for key, new_value in flatten(after):
+        if key not in old:
+            continue
+        old_value = old[key]
+        change = f"{(new_value - old_value) / old_value * 100:+.1f}%" if old_value else "n/a"
+        sys.stdout.write(f"{key:<{width}}  {old_value:>12}  {new_value:>12}  {change:>8}\n")
+
+
+if __name__ == "__main__":
+    main()
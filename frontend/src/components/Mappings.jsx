@@ -4,6 +4,7 @@ const API_BASE = '/api'
 
 function Mappings({ token }) {
   const [mappings, setMappings] = useState([])
+  const [templates, setTemplates] = useState([])
   const [loading, setLoading] = useState(false)
   const [message, setMessage] = useState('')
   const [error, setError] = useState('')
@@ -12,11 +13,13 @@ function Mappings({ token }) {
   const [formData, setFormData] = useState({
     rcpt_pattern: '',
     user_key: '',
-    device: ''
+    device: '',
+    template_id: ''
   })
 
   useEffect(() => {
     loadMappings()
+    loadTemplates()
   }, [])
 
   const apiCall = async (url, options = {}) => {
@@ -46,23 +49,35 @@ function Mappings({ token }) {
     }
   }
 
+  const loadTemplates = async () => {
+    try {
+      setTemplates(await apiCall('/templates/'))
+    } catch (err) {
+      setError(`Failed to load templates: ${err.message}`)
+    }
+  }
+
   const handleSubmit = async (e) => {
     e.preventDefault()
     setLoading(true)
     setMessage('')
     setError('')
+    const payload = {
+      ...formData,
+      template_id: formData.template_id === '' ? null : Number(formData.template_id)
+    }
 
     try {
       if (editingId) {
         await apiCall(`/mappings/${editingId}`, {
           method: 'PUT',
-          body: JSON.stringify(formData)
+          body: JSON.stringify(payload)
         })
         setMessage('Mapping updated successfully!')
       } else {
         await apiCall('/mappings/', {
           method: 'POST',
-          body: JSON.stringify(formData)
+          body: JSON.stringify(payload)
         })
         setMessage('Mapping created successfully!')
       }
@@ -80,7 +95,8 @@ function Mappings({ token }) {
     setFormData({
       rcpt_pattern: mapping.rcpt_pattern,
       user_key: mapping.user_key,
-      device: mapping.device || ''
+      device: mapping.device || '',
+      template_id: mapping.template_id ?? ''
     })
     setEditingId(mapping.id)
     setShowForm(true)
@@ -102,7 +118,7 @@ function Mappings({ token }) {
   }
 
   const resetForm = () => {
-    setFormData({ rcpt_pattern: '', user_key: '', device: '' })
+    setFormData({ rcpt_pattern: '', user_key: '', device: '', template_id: '' })
     setEditingId(null)
     setShowForm(false)
   }
@@ -159,6 +175,19 @@ function Mappings({ token }) {
               />
             </div>
 
+            <div className="form-group">
+              <label>Template (optional):</label>
+              <select
+                value={formData.template_id}
+                onChange={(e) => setFormData({...formData, template_id: e.target.value})}
+              >
+                <option value="">None (use email subject and body)</option>
+                {templates.map((t) => (
+                  <option key={t.id} value={t.id}>{t.name}</option>
+                ))}
+              </select>
+            </div>
+
             <div className="form-actions">
               <button type="submit" disabled={loading}>
                 {loading ? 'Saving...' : (editingId ? 'Update' : 'Create')}
@@ -182,6 +211,7 @@ function Mappings({ token }) {
                 <th>Email Pattern</th>
                 <th>User Key</th>
                 <th>Device</th>
+                <th>Template</th>
                 <th>Actions</th>
               </tr>
             </thead>
@@ -191,6 +221,7 @@ function Mappings({ token }) {
                   <td><code>{mapping.rcpt_pattern}</code></td>
                   <td><code>{mapping.user_key.substring(0, 8)}...</code></td>
                   <td>{mapping.device || <em>All devices</em>}</td>
+                  <td>{templates.find((t) => t.id === mapping.template_id)?.name || <em>None</em>}</td>
                   <td>
                     <button onClick={() => handleEdit(mapping)}>Edit</button>
                     <button onClick={() => handleDelete(mapping.id)}>Delete</button>
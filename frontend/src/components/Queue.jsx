@@ -7,10 +7,29 @@ function Queue({ token }) {
   const [loading, setLoading] = useState(false)
   const [message, setMessage] = useState('')
   const [error, setError] = useState('')
+  const [replay, setReplay] = useState(null)
+  const [statusFilter, setStatusFilter] = useState('')
+  const [nextCursor, setNextCursor] = useState(null)
+  const [stats, setStats] = useState({})
 
   useEffect(() => {
     loadQueue()
-  }, [])
+  }, [statusFilter])
+
+  // Poll the background replay until it finishes
+  useEffect(() => {
+    if (!replay || replay.status !== 'running') return
+    const timer = setTimeout(async () => {
+      try {
+        const progress = await apiCall(`/queue/replay/${replay.id}`)
+        setReplay(progress)
+        if (progress.status !== 'running') loadQueue()
+      } catch (err) {
+        setError(`Failed to load replay progress: ${err.message}`)
+      }
+    }, 2000)
+    return () => clearTimeout(timer)
+  }, [replay])
 
   const apiCall = async (url, options = {}) => {
     const response = await fetch(`${API_BASE}${url}`, {
@@ -27,11 +46,20 @@ function Queue({ token }) {
     return response.json()
   }
 
-  const loadQueue = async () => {
+  // Pages are fetched by cursor; "Load more" appends the next one
+  const loadQueue = async (cursor = null) => {
     try {
       setLoading(true)
-      const data = await apiCall('/queue/')
-      setQueueItems(data)
+      const params = new URLSearchParams({ limit: '50' })
+      if (statusFilter) params.set('status', statusFilter)
+      if (cursor) params.set('before', cursor)
+      const [data, counts] = await Promise.all([
+        apiCall(`/queue/?${params}`),
+        cursor ? Promise.resolve(stats) : apiCall('/queue/stats')
+      ])
+      setQueueItems(cursor ? [...queueItems, ...data.items] : data.items)
+      setNextCursor(data.next_cursor)
+      setStats(counts)
     } catch (err) {
       setError(`Failed to load queue: ${err.message}`)
     } finally {
@@ -57,9 +85,8 @@ function Queue({ token }) {
 
     try {
       setLoading(true)
-      await apiCall('/queue/retry-all', { method: 'POST' })
-      setMessage('All messages queued for retry!')
-      loadQueue()
+      setReplay(await apiCall('/queue/replay', { method: 'POST' }))
+      setMessage('Replay started')
     } catch (err) {
       setError(`Failed to retry messages: ${err.message}`)
     } finally {
@@ -101,18 +128,25 @@ function Queue({ token }) {
     return new Date(timestamp).toLocaleString()
   }
 
-  const getStatusIcon = (attempts, maxRetries = 3) => {
-    if (attempts === 0) return '⏳'
-    if (attempts >= maxRetries) return '❌'
-    return '🔄'
+  const STATUS_ICONS = {
+    queued: '⏳',
+    retrying: '🔄',
+    deferred: '⏸️',
+    delivered: '✅',
+    failed: '❌',
+    rejected: '⛔'
   }
 
-  const getStatusText = (attempts, maxRetries = 3) => {
-    if (attempts === 0) return 'Pending'
-    if (attempts >= maxRetries) return 'Failed'
-    return `Retrying (${attempts}/${maxRetries})`
+  const getStatusIcon = (status) => STATUS_ICONS[status] || '⏳'
+
+  const getStatusText = (status, attempts) => {
+    if (!status) return 'Pending'
+    if (status === 'retrying') return `Retrying (${attempts})`
+    return status.charAt(0).toUpperCase() + status.slice(1)
   }
 
+  const totalCount = Object.values(stats).reduce((sum, n) => sum + n, 0)
+
   return (
     <div className="page">
       <h2>📋 Message Queue</h2>
@@ -120,11 +154,24 @@ function Queue({ token }) {
 
       {message && <div className="success">{message}</div>}
       {error && <div className="error">{error}</div>}
+      {replay && (
+        <div className={replay.status === 'running' || replay.status === 'done' ? 'success' : 'error'}>
+          Replay {replay.status}: {replay.sent} sent, {replay.failed + replay.rejected} failed,
+          {' '}{replay.remaining} of {replay.total} left ({replay.per_second}/s)
+          {replay.error && ` - ${replay.error}`}
+        </div>
+      )}
 
       <div className="page-actions">
-        <button onClick={loadQueue} disabled={loading}>
+        <button onClick={() => loadQueue()} disabled={loading}>
           🔄 Refresh
         </button>
+        <select value={statusFilter} onChange={(e) => setStatusFilter(e.target.value)} disabled={loading}>
+          <option value="">All statuses</option>
+          {Object.keys(STATUS_ICONS).map((status) => (
+            <option key={status} value={status}>{status.charAt(0).toUpperCase() + status.slice(1)}</option>
+          ))}
+        </select>
         {queueItems.length > 0 && (
           <>
             <button onClick={handleRetryAll} disabled={loading}>
@@ -148,9 +195,10 @@ function Queue({ token }) {
         {queueItems.length > 0 && (
           <>
             <div className="queue-stats">
-              <span>Total: {queueItems.length}</span>
-              <span>Failed: {queueItems.filter(item => item.attempts >= 3).length}</span>
-              <span>Retrying: {queueItems.filter(item => item.attempts > 0 && item.attempts < 3).length}</span>
+              <span>Total: {totalCount}</span>
+              <span>Failed: {(stats.failed || 0) + (stats.rejected || 0)}</span>
+              <span>Retrying: {(stats.retrying || 0) + (stats.queued || 0) + (stats.deferred || 0)}</span>
+              <span>Delivered: {stats.delivered || 0}</span>
             </div>
             
             <table>
@@ -167,10 +215,10 @@ function Queue({ token }) {
               </thead>
               <tbody>
                 {queueItems.map((item) => (
-                  <tr key={item.id} className={item.attempts >= 3 ? 'failed' : ''}>
+                  <tr key={item.id} className={item.status === 'failed' || item.status === 'rejected' ? 'failed' : ''}>
                     <td>
                       <span className="status-badge">
-                        {getStatusIcon(item.attempts)} {getStatusText(item.attempts)}
+                        {getStatusIcon(item.status)} {getStatusText(item.status, item.attempts)}
                       </span>
                     </td>
                     <td><code>{item.rcpt_to}</code></td>
@@ -202,6 +250,11 @@ function Queue({ token }) {
                 ))}
               </tbody>
             </table>
+            {nextCursor && (
+              <button onClick={() => loadQueue(nextCursor)} disabled={loading}>
+                Load more
+              </button>
+            )}
           </>
         )}
       </div>
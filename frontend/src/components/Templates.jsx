@@ -11,6 +11,7 @@ function Templates({ token }) {
   const [editingId, setEditingId] = useState(null)
   const [formData, setFormData] = useState({
     name: '',
+    title: '',
     content: ''
   })
 
@@ -78,6 +79,7 @@ function Templates({ token }) {
   const handleEdit = (template) => {
     setFormData({
       name: template.name,
+      title: template.title || '',
       content: template.content
     })
     setEditingId(template.id)
@@ -100,7 +102,7 @@ function Templates({ token }) {
   }
 
   const resetForm = () => {
-    setFormData({ name: '', content: '' })
+    setFormData({ name: '', title: '', content: '' })
     setEditingId(null)
     setShowForm(false)
   }
@@ -151,6 +153,17 @@ function Templates({ token }) {
               />
             </div>
 
+            <div className="form-group">
+              <label>Notification Title (optional):</label>
+              <input
+                type="text"
+                value={formData.title}
+                onChange={(e) => setFormData({...formData, title: e.target.value})}
+                placeholder="e.g., {{subject}} ({{recipient}})"
+              />
+              <small>Leave blank to use the email subject</small>
+            </div>
+
             <div className="form-group">
               <label>Template Content:</label>
               <div className="template-variables">
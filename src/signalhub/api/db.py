@@ -1,11 +1,40 @@
 from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import inspect, text
 import os
 
 DB_PATH = os.getenv('API_DB_PATH', './signalhub.db')
 ENGINE = create_engine(f'sqlite:///{DB_PATH}', connect_args={"check_same_thread": False})
 
 def init_db():
+    from . import models  # noqa: F401  register the tables
     SQLModel.metadata.create_all(ENGINE)
+    add_missing_columns()
+    add_missing_indexes()
+
+def add_missing_columns(engine=ENGINE):
+    """Add nullable columns introduced after a table was first created.
+
+    ``create_all`` never alters existing tables, so databases from older
+    releases are brought up to date here.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}'))
+
+def add_missing_indexes(engine=ENGINE):
+    """Create indexes declared after a table was first created."""
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
 
 def get_session():
     return Session(ENGINE)
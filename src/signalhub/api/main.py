@@ -14,10 +14,12 @@ async def lifespan(app: FastAPI):
     init_db()
     bootstrap_admin()
     logging.info("FastAPI started - SMTP server managed by supervisor")
+    await queue.resume_replay()
     
     yield
     
     # Shutdown
+    await queue.stop_replay()
     logging.info("FastAPI shutting down")
 
 def check_smtp_running():
@@ -22,16 +22,24 @@ class Mapping(SQLModel, table=True):
     rcpt_pattern: str
     user_key: str
     device: Optional[str] = None
+    template_id: Optional[int] = None  # Template rendering title/message, if any
 
 class Template(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(unique=True)
     content: str
+    title: Optional[str] = None  # optional title template; subject otherwise
+    updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow)  # compiled-template cache version
 
 class QueueRecord(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    timestamp: datetime = Field(default_factory=datetime.utcnow, index=True)
     rcpt_to: str
     subject: str
     attempts: int = Field(default=0)
     last_error: Optional[str] = None
+    msg_id: Optional[str] = Field(default=None, index=True, unique=True)  # written by queuestate.QueueRecorder
+    spool_id: Optional[int] = None
+    status: Optional[str] = Field(default=None, index=True)  # queued, retrying, deferred, delivered, failed, rejected
+    next_attempt_at: Optional[datetime] = Field(default=None, index=True)
+    updated_at: Optional[datetime] = None
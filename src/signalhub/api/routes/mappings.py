@@ -10,14 +10,15 @@ router = APIRouter(prefix="/mappings")
 @router.get("/")
 def list_mappings(user=Depends(get_current_user)):
     with get_session() as s:
-        stmt = s.exec(text("SELECT id, rcpt_pattern, user_key, device FROM mapping"))
-        rows = [dict(id=r[0], rcpt_pattern=r[1], user_key=r[2], device=r[3]) for r in stmt]
+        stmt = s.exec(text("SELECT id, rcpt_pattern, user_key, device, template_id FROM mapping"))
+        rows = [dict(id=r[0], rcpt_pattern=r[1], user_key=r[2], device=r[3], template_id=r[4]) for r in stmt]
     return rows
 
 @router.post("/")
 def create_mapping(m_in: MappingIn, user=Depends(get_current_user)):
     with get_session() as s:
-        m = Mapping(rcpt_pattern=m_in.rcpt_pattern, user_key=m_in.user_key, device=m_in.device)
+        m = Mapping(rcpt_pattern=m_in.rcpt_pattern, user_key=m_in.user_key, device=m_in.device,
+                    template_id=m_in.template_id)
         s.add(m)
         s.commit()
         s.refresh(m)
@@ -32,6 +33,7 @@ def update_mapping(id: int, m_in: MappingIn, user=Depends(get_current_user)):
         m.rcpt_pattern = m_in.rcpt_pattern
         m.user_key = m_in.user_key
         m.device = m_in.device
+        m.template_id = m_in.template_id
         s.add(m)
         s.commit()
         s.refresh(m)
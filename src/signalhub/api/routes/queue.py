@@ -1,24 +1,120 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy import text
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
+from sqlmodel import select
 from ..db import get_session
 from ..models import QueueRecord
 from ..schemas import TestSendIn
 from .. import db as _db
-from signalhub.queue import replay_queue
+from signalhub.queue import open_spool
+from signalhub.replay import RUNNING, engine_for
 import os
 from ..auth import get_current_user
 
 router = APIRouter(prefix="/queue")
 
+_engine = None
+_handler = None
+
+def replay_config():
+    """The server's Config, with the queue directory the SMTP server uses."""
+    from dataclasses import replace
+    from signalhub.config import load_config
+    config = load_config()
+    if not config.queue_dir:
+        config = replace(config, queue_dir='./queue')
+    return config
+
+def get_engine(config=None):
+    """The replay engine of this API process, built on first use."""
+    global _engine, _handler
+    if _engine is None:
+        from signalhub.handler import Handler
+        from signalhub.routing import load_mappings
+        from signalhub.templating import load_templates
+        _handler = Handler(config or replay_config(), mappings=load_mappings(), templates=load_templates())
+        _engine = engine_for(_handler)
+    return _engine
+
+async def resume_replay():
+    """Called at startup: continue a replay interrupted by a restart."""
+    config = replay_config()
+    qdir = config.queue_dir
+    if not os.path.exists(os.path.join(qdir, "spool.db")):
+        return
+    if open_spool(qdir, config.spool_compression).replay_jobs(status=RUNNING):
+        get_engine(config).resume()
+
+async def stop_replay():
+    """Called at shutdown: interrupt the replay and flush the handler's state."""
+    global _engine, _handler
+    if _engine is not None:
+        await _engine.stop()
+        await _handler.stop()
+        _engine = _handler = None
+
 @router.get("/")
-def list_queue(user=Depends(get_current_user)):
+def list_queue(
+    status: Optional[str] = None,
+    rcpt_to: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    before: Optional[int] = Query(None, description="Cursor: next_cursor of the previous page"),
+    limit: int = Query(50, ge=1, le=500),
+    user=Depends(get_current_user),
+):
+    """Queue records, newest first, one page at a time.
+
+    Pages are keyed on the record id rather than offset, so every page is
+    an index range scan however deep the history goes.
+    """
+    stmt = select(QueueRecord).order_by(QueueRecord.id.desc()).limit(limit + 1)
+    if status:
+        stmt = stmt.where(QueueRecord.status == status)
+    if rcpt_to:
+        stmt = stmt.where(QueueRecord.rcpt_to == rcpt_to)
+    if since:
+        stmt = stmt.where(QueueRecord.timestamp >= since)
+    if until:
+        stmt = stmt.where(QueueRecord.timestamp < until)
+    if before:
+        stmt = stmt.where(QueueRecord.id < before)
     with _db.get_session() as s:
-        stmt = s.exec(text("SELECT id, timestamp, rcpt_to, subject, attempts, last_error FROM queuerecord"))
-        rows = list(stmt)
-    return rows
-
-@router.post("/replay")
-def replay(user=Depends(get_current_user)):
-    qdir = os.getenv('QUEUE_DIR', './queue')
-    replay_queue(qdir, None)
-    return {"ok": True}
+        rows = list(s.exec(stmt))
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {"items": rows, "next_cursor": rows[-1].id if more else None}
+
+@router.get("/stats")
+def queue_stats(user=Depends(get_current_user)):
+    """Number of queue records per status."""
+    with _db.get_session() as s:
+        rows = s.exec(select(QueueRecord.status, func.count()).group_by(QueueRecord.status))
+        return {status or "unknown": count for status, count in rows}
+
+@router.post("/replay", status_code=202)
+async def replay(user=Depends(get_current_user)):
+    """Start replaying the spool in the background (or return the run in progress)."""
+    return get_engine().start().progress()
+
+@router.get("/replay")
+def replay_progress(user=Depends(get_current_user)):
+    progress = get_engine().progress()
+    if progress is None:
+        raise HTTPException(status_code=404, detail="No replay has run yet")
+    return progress
+
+@router.get("/replay/{job_id}")
+def replay_job(job_id: int, user=Depends(get_current_user)):
+    progress = get_engine().progress(job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Replay job not found")
+    return progress
+
+@router.post("/replay/cancel")
+async def cancel_replay(user=Depends(get_current_user)):
+    job = get_engine().cancel()
+    if job is None:
+        raise HTTPException(status_code=409, detail="No replay is running")
+    return job.progress()
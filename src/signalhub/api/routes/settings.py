@@ -5,6 +5,7 @@ from ..models import Setting
 from ..schemas import SettingIn, SMTPSettings, PushoverSettings, AppSettings
 from ..auth import get_current_user
 from ..settings_service import SettingsService
+from ..settings_crypto import rotate_settings
 
 router = APIRouter(prefix="/settings")
 
@@ -25,6 +26,13 @@ def set_setting(s_in: SettingIn, user=Depends(get_current_user)):
         s.commit()
     return {"ok": True}
 
+@router.post("/rotate-key")
+def rotate_encryption_key(user=Depends(get_current_user)):
+    """Re-encrypt all encrypted settings with the primary SETTINGS_ENCRYPTION_KEY"""
+    with get_session() as s:
+        count = rotate_settings(s)
+    return {"ok": True, "rotated": count}
+
 # SMTP Settings
 @router.get("/smtp")
 def get_smtp_settings(user=Depends(get_current_user)):
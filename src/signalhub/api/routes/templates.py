@@ -1,3 +1,4 @@
+from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import text
 from ..db import get_session
@@ -10,14 +11,14 @@ router = APIRouter(prefix="/templates")
 @router.get("/")
 def list_templates(user=Depends(get_current_user)):
     with get_session() as s:
-        stmt = s.exec(text("SELECT id, name, content FROM template"))
-        rows = [dict(id=r[0], name=r[1], content=r[2]) for r in stmt]
+        stmt = s.exec(text("SELECT id, name, content, title, updated_at FROM template"))
+        rows = [dict(id=r[0], name=r[1], content=r[2], title=r[3], updated_at=r[4]) for r in stmt]
     return rows
 
 @router.post("/")
 def create_template(t_in: TemplateIn, user=Depends(get_current_user)):
     with get_session() as s:
-        t = Template(name=t_in.name, content=t_in.content)
+        t = Template(name=t_in.name, content=t_in.content, title=t_in.title)
         s.add(t)
         s.commit()
         s.refresh(t)
@@ -31,6 +32,9 @@ def update_template(id: int, t_in: TemplateIn, user=Depends(get_current_user)):
             raise HTTPException(status_code=404, detail="Template not found")
         t.name = t_in.name
         t.content = t_in.content
+        t.title = t_in.title
+        # Bumping the version makes the SMTP service recompile it
+        t.updated_at = datetime.utcnow()
         s.add(t)
         s.commit()
         s.refresh(t)
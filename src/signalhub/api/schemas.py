@@ -16,10 +16,12 @@ class MappingIn(BaseModel):
     rcpt_pattern: str
     user_key: str
     device: Optional[str] = None
+    template_id: Optional[int] = None
 
 class TemplateIn(BaseModel):
     name: str
     content: str
+    title: Optional[str] = None
 
 class TestSendIn(BaseModel):
     to: EmailStr
@@ -1,52 +1,110 @@
 import os
 import base64
-from cryptography.fernet import Fernet
-from typing import Optional
+import threading
+from collections import OrderedDict
+from cryptography.fernet import Fernet, MultiFernet
+from typing import List, Optional
+
+class KeyManager:
+    """Holds the Fernet keys and a bounded cache of decrypted values.
+
+    ``SETTINGS_ENCRYPTION_KEY`` may list several comma-separated keys: the
+    first encrypts, all of them decrypt, which allows rotating keys with
+    ``rotate_settings``. Decrypted values are cached by ciphertext, so
+    repeated reads of the same setting skip AES and HMAC.
+    """
+
+    def __init__(self, keys: List[bytes], cache_size: int = 256):
+        self.keys = keys
+        self.fernet = MultiFernet([Fernet(k) for k in keys])
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "KeyManager":
+        raw = os.getenv("SETTINGS_ENCRYPTION_KEY", "")
+        keys = [k.strip().encode() for k in raw.split(",") if k.strip()]
+        if not keys:
+            # Generate a new key (you should save this to your .env file)
+            key = Fernet.generate_key()
+            print(f"Generated new encryption key. Add to .env: SETTINGS_ENCRYPTION_KEY={key.decode()}")
+            keys = [key]
+        return cls(keys)
+
+    def encrypt(self, value: str) -> str:
+        return base64.b64encode(self.fernet.encrypt(value.encode())).decode()
+
+    def decrypt(self, encrypted_value: str) -> str:
+        with self._lock:
+            value = self._cache.get(encrypted_value)
+            if value is not None:
+                self._cache.move_to_end(encrypted_value)
+                return value
+        value = self.fernet.decrypt(base64.b64decode(encrypted_value.encode())).decode()
+        with self._lock:
+            self._cache[encrypted_value] = value
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return value
+
+    def rotate(self, encrypted_value: str) -> str:
+        """Re-encrypt a value under the primary key."""
+        token = self.fernet.rotate(base64.b64decode(encrypted_value.encode()))
+        return base64.b64encode(token).decode()
+
+_manager: Optional[KeyManager] = None
+_manager_lock = threading.Lock()
+
+def get_key_manager() -> KeyManager:
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = KeyManager.from_env()
+    return _manager
+
+def reset_key_manager():
+    """Forget the current keys so the next call re-reads the environment."""
+    global _manager
+    with _manager_lock:
+        _manager = None
 
 # Generate or load encryption key from environment
 def get_encryption_key() -> bytes:
-    key = os.getenv("SETTINGS_ENCRYPTION_KEY")
-    if not key:
-        # Generate a new key (you should save this to your .env file)
-        key = Fernet.generate_key().decode()
-        print(f"Generated new encryption key. Add to .env: SETTINGS_ENCRYPTION_KEY={key}")
-    return key.encode() if isinstance(key, str) else key
+    return get_key_manager().keys[0]
 
 def encrypt_value(value: str) -> str:
     """Encrypt a setting value."""
-    f = Fernet(get_encryption_key())
-    encrypted = f.encrypt(value.encode())
-    return base64.b64encode(encrypted).decode()
+    return get_key_manager().encrypt(value)
 
 def decrypt_value(encrypted_value: str) -> str:
     """Decrypt a setting value."""
-    f = Fernet(get_encryption_key())
-    decoded = base64.b64decode(encrypted_value.encode())
-    return f.decrypt(decoded).decode()
+    return get_key_manager().decrypt(encrypted_value)
 
 def get_setting(session, key: str, default: Optional[str] = None) -> Optional[str]:
     """Get a setting value, decrypting if necessary."""
     from .models import Setting
     from sqlmodel import select
-    
+
     stmt = select(Setting).where(Setting.key == key)
     setting = session.exec(stmt).first()
-    
+
     if not setting:
         return default
-    
+
     if setting.is_encrypted:
         return decrypt_value(setting.value)
     return setting.value
 
-def set_setting(session, key: str, value: str, category: Optional[str] = None, 
+def set_setting(session, key: str, value: str, category: Optional[str] = None,
                 encrypt: bool = False, description: Optional[str] = None):
     """Set a setting value, encrypting if necessary."""
     from .models import Setting
     from datetime import datetime
-    
+
     encrypted_value = encrypt_value(value) if encrypt else value
-    
+
     setting = Setting(
         key=key,
         value=encrypted_value,
@@ -55,6 +113,22 @@ def set_setting(session, key: str, value: str, category: Optional[str] = None,
         description=description,
         updated_at=datetime.utcnow()
     )
-    
+
     session.merge(setting)
-    session.commit()
\ No newline at end of file
+    session.commit()
+
+def rotate_settings(session) -> int:
+    """Re-encrypt every encrypted setting under the primary key."""
+    from .models import Setting
+    from sqlmodel import select
+    from datetime import datetime
+
+    manager = get_key_manager()
+    count = 0
+    for setting in session.exec(select(Setting).where(Setting.is_encrypted == True)):  # noqa: E712
+        setting.value = manager.rotate(setting.value)
+        setting.updated_at = datetime.utcnow()
+        session.add(setting)
+        count += 1
+    session.commit()
+    return count
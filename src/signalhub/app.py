@@ -3,18 +3,35 @@ import signal
 import sys
 import logging
 from aiosmtpd.controller import Controller
-from .config import load_config
+from .config import apply_settings, load_config
 from .handler import Handler
 from .health import start_health_server
+from .logs import log_event, setup_logging
+from .routing import MappingWatcher, load_mappings
+from .settings_bridge import SettingsWatcher, subscribe
+from .templating import TemplateWatcher, load_templates
+from .workers import ReusePortController, WorkerPool, publish_metrics
 
 
-def main():
-    config = load_config()
-    logging.basicConfig(level=logging.INFO, format='%(message)s')
-    loop = asyncio.get_event_loop()
+def _stop_after(loop, tasks):
+    """Cancel ``tasks`` and stop ``loop`` once they have finished cleaning up."""
+    for task in tasks:
+        task.cancel()
+    asyncio.gather(*tasks, return_exceptions=True).add_done_callback(lambda _: loop.stop())
+
 
-    handler = Handler(config)
-    controller = Controller(
+def serve(config, worker_id=None, metrics_queue=None):
+    """Run one SMTP front end until SIGINT/SIGTERM.
+
+    Standalone it also serves the health endpoints; as worker ``worker_id``
+    of a pool it shares the port and publishes counters to the parent.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    handler = Handler(config, mappings=load_mappings(), templates=load_templates())
+    controller_cls = Controller if worker_id is None else ReusePortController
+    controller = controller_cls(
         handler,
         hostname=config.listen_host,
         port=config.listen_port,
@@ -22,16 +39,51 @@ def main():
         auth_required=not config.allow_nonauth,
         authenticator=handler.authenticator if not config.allow_nonauth else None,
         tls_context=handler.tls_context if config.enable_starttls else None,
+        data_size_limit=config.data_size_limit,
     )
     controller.start()
+    asyncio.run_coroutine_threadsafe(handler.start(), controller.loop).result(timeout=10)
+
+    if metrics_queue is None:
+        metrics_task = loop.create_task(start_health_server(config, handler.metrics_snapshot))
+    else:
+        metrics_task = loop.create_task(publish_metrics(handler, worker_id, metrics_queue))
 
-    health_task = loop.create_task(start_health_server(config))
+    # Settings edited in the admin UI reach the handler via snapshot swaps;
+    # the handler only ever reads its in-memory config.
+    def on_settings(snapshot):
+        new_config = apply_settings(handler.config, snapshot)
+        controller.loop.call_soon_threadsafe(handler.update_config, new_config)
+
+    subscribe(on_settings)
+    settings_task = loop.create_task(SettingsWatcher(config.settings_poll_interval).run())
+    # Templates are recompiled on the watcher's executor thread and swapped
+    # into the handler's cache, keeping compilation off the SMTP path.
+    templates_task = loop.create_task(TemplateWatcher(handler.templates, config.settings_poll_interval).run())
+    # Mapping edits are compiled into a new Router on the watcher's thread
+    # and swapped into the handler in one step on its loop.
+    mappings_watcher = MappingWatcher(
+        lambda: handler.config,
+        lambda *change: controller.loop.call_soon_threadsafe(handler.update_mappings, *change),
+        config.settings_poll_interval,
+        handler.mappings,
+    )
+    mappings_task = loop.create_task(mappings_watcher.run())
+    stopping = []
 
     def shutdown():
-        logging.info('{"event":"shutdown","status":"initiated"}')
+        if stopping:
+            return
+        stopping.append(True)
+        log_event(logging.INFO, "shutdown", status="initiated", worker=worker_id)
+        # Delivery workers run on the controller's loop; drain them there so
+        # undelivered jobs land in the failed-send queue before it stops.
+        try:
+            asyncio.run_coroutine_threadsafe(handler.stop(), controller.loop).result(timeout=10)
+        except Exception as e:
+            log_event(logging.ERROR, "shutdown", error=str(e))
         controller.stop()
-        health_task.cancel()
-        loop.stop()
+        _stop_after(loop, [metrics_task, settings_task, templates_task, mappings_task])
 
     for sig in (signal.SIGINT, signal.SIGTERM):
         loop.add_signal_handler(sig, shutdown)
@@ -40,9 +92,43 @@ def main():
         loop.run_forever()
     except KeyboardInterrupt:
         shutdown()
+        loop.run_forever()  # until the cancelled tasks have finished
+    finally:
+        loop.close()
+        log_event(logging.INFO, "shutdown", status="complete", worker=worker_id)
+
+
+def serve_workers(config):
+    """Supervise ``config.smtp_workers`` SMTP worker processes."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    pool = WorkerPool(config, config.smtp_workers)
+    pool.start()
+    health_task = loop.create_task(start_health_server(config, pool.aggregator.totals))
+    supervise_task = loop.create_task(pool.supervise())
+
+    def shutdown():
+        log_event(logging.INFO, "shutdown", status="initiated", workers=pool.count)
+        pool.stop()
+        _stop_after(loop, [health_task, supervise_task])
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, shutdown)
+
+    try:
+        loop.run_forever()
     finally:
         loop.close()
-        logging.info('{"event":"shutdown","status":"complete"}')
+        log_event(logging.INFO, "shutdown", status="complete", workers=pool.count)
+
+
+def main():
+    config = load_config()
+    setup_logging(config)
+    if config.smtp_workers > 1:
+        serve_workers(config)
+    else:
+        serve(config)
 
 if __name__ == "__main__":
     main()
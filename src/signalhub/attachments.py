@@ -0,0 +1,98 @@
+"""Image attachments for notifications.
+
+The handler only records where the first image part sits in the raw
+message (``mimeparse.find_image``). Right before a send the part is
+decoded once, straight from a memoryview of the message (binary parts are
+passed through without a copy), under a process-wide memory budget.
+Images larger than Pushover's limit are downsized and re-encoded as JPEG
+when Pillow is installed and dropped otherwise; the notification text is
+always sent.
+"""
+import io
+import binascii
+import logging
+from typing import NamedTuple, Optional
+from .logs import log_event
+
+try:
+    from PIL import Image
+except ImportError:  # downsizing is optional
+    Image = None
+
+# Pushover accepts attachments up to 2.5 MB
+PUSHOVER_MAX_BYTES = 2621440
+
+
+class Attachment(NamedTuple):
+    filename: str
+    content_type: str
+    data: object  # bytes or memoryview
+
+
+class MemoryBudget:
+    """Caps the bytes of decoded attachments held at once."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+
+    def acquire(self, size) -> bool:
+        if self.used + size > self.limit:
+            return False
+        self.used += size
+        return True
+
+    def release(self, size):
+        self.used -= size
+
+
+def decoded_size(part):
+    """Upper bound of the decoded size of ``part``."""
+    if part.encoding == "base64":
+        return part.encoded_size * 3 // 4
+    return part.encoded_size
+
+
+def decode(part):
+    view = memoryview(part.content)[part.start:part.end]
+    if part.encoding == "base64":
+        # a2b_base64 skips the line breaks, so no joined copy is needed
+        return binascii.a2b_base64(view)
+    if part.encoding == "quoted-printable":
+        return binascii.a2b_qp(view)
+    return view
+
+
+def shrink(data, max_bytes, quality=80, attempts=5):
+    """Downsize an image to a JPEG of at most ``max_bytes``, or None."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            scale = min(1.0, (max_bytes / len(data)) ** 0.5)
+            target = (max(1, int(im.width * scale)), max(1, int(im.height * scale)))
+            # JPEGs decode straight at a reduced scale, bounding pixel memory
+            im.draft("RGB", target)
+            if im.mode not in ("RGB", "L"):
+                im = im.convert("RGB")
+            for _ in range(attempts):
+                out = io.BytesIO()
+                im.resize(target).save(out, "JPEG", quality=quality, optimize=True)
+                if out.tell() <= max_bytes:
+                    return out.getbuffer()
+                target = (max(1, int(target[0] * 0.8)), max(1, int(target[1] * 0.8)))
+    except Exception as e:
+        log_event(logging.WARNING, "attachment_shrink_failed", error=str(e))
+    return None
+
+
+def prepare(part, max_bytes=PUSHOVER_MAX_BYTES) -> Optional[Attachment]:
+    """Decode ``part`` and fit it under ``max_bytes`` (CPU bound; run off the loop)."""
+    data = decode(part)
+    if len(data) <= max_bytes:
+        return Attachment(part.filename, part.content_type, data)
+    smaller = shrink(data, max_bytes)
+    if smaller is None:
+        return None
+    name = part.filename.rsplit(".", 1)[0] + ".jpg"
+    return Attachment(name, "image/jpeg", smaller)
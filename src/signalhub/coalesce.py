@@ -0,0 +1,86 @@
+import asyncio
+from collections import Counter
+from .delivery import DeliveryJob
+
+
+def build_digest(jobs):
+    """Fold a burst of jobs for one recipient into a single summary job."""
+    subjects = Counter(job.title for job in jobs)
+    first = jobs[0]
+    if len(subjects) == 1:
+        title = f"[{len(jobs)}x] {first.title}"
+    else:
+        title = f"{len(jobs)} alerts ({len(subjects)} distinct): {first.title}"
+    lines = []
+    size = 0
+    for n, (subject, count) in enumerate(subjects.most_common()):
+        line = f"{count}x {subject}"
+        if size + len(line) + 1 > 1000:
+            lines.append(f"...and {len(subjects) - n} more")
+            break
+        lines.append(line)
+        size += len(line) + 1
+    directives = dict(first.directives)
+    priorities = [int(p) for p in (job.directives.get('prio') for job in jobs) if p and p.lstrip('-').isdigit()]
+    if priorities:
+        directives['prio'] = str(max(priorities))
+    return DeliveryJob(
+        rcpt_to=first.rcpt_to,
+        title=title[:250],
+        message="\n".join(lines)[:1024],
+        directives=directives,
+        user_key=first.user_key,
+        device=first.device,
+        route_label=first.route_label,
+        trace_id=first.trace_id,
+        parent_span=first.parent_span,
+        accepted_at=first.accepted_at,
+    )
+
+
+class Coalescer:
+    """Buffers jobs per routed recipient and emits one digest per window.
+
+    The first job for a user key/device opens a window of ``window`` seconds;
+    everything arriving before it closes (or until ``max_batch`` jobs) is
+    sent as one notification. ``emit`` receives the job to send and how
+    many received messages it stands for. A window of 0 passes jobs
+    straight through.
+    """
+
+    def __init__(self, emit, window=0, max_batch=50):
+        self.emit = emit
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._batches = {}
+        self._timers = {}
+
+    def add(self, job):
+        if self.window <= 0:
+            return self.emit(job, 1)
+        key = (job.user_key, job.device)
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = []
+            loop = asyncio.get_running_loop()
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        batch.append(job)
+        if len(batch) >= self.max_batch:
+            self._flush(key)
+        return True
+
+    def pending(self):
+        return sum(len(batch) for batch in self._batches.values())
+
+    def flush_all(self):
+        for key in list(self._batches):
+            self._flush(key)
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        jobs = self._batches.pop(key, None)
+        if not jobs:
+            return
+        self.emit(jobs[0] if len(jobs) == 1 else build_digest(jobs), len(jobs))
@@ -18,55 +18,163 @@ class Config:
     pushover_device: Optional[str] = None
     health_port: int = 8080
     rate_limit_per_minute: int = 120
+    rate_limit_per_recipient: int = 0
+    rate_limit_per_sender: int = 0
+    pushover_monthly_quota: int = 10000
+    pushover_quota_reserve: int = 100
     queue_dir: Optional[str] = None
+    spool_compression: str = "zlib"  # or "zstd" (pip install .[zstd]) or "none"
     enable_starttls: bool = False
+    delivery_workers: int = 4
+    delivery_queue_size: int = 1000
+    delivery_high_water: int = 800
+    pushover_api_url: str = "https://api.pushover.net/1/messages.json"
+    pushover_pool_size: int = 10
+    pushover_timeout: float = 10
+    pushover_latency_target: float = 2.0  # slower sends lower the concurrency limit
+    delivery_min_concurrency: int = 1
+    max_retries: int = 3
+    retry_delay: float = 300
+    replay_concurrency: int = 8
+    replay_rate_per_minute: int = 1800  # 0 = unlimited
+    replay_batch_size: int = 200
+    queue_records: bool = True  # keep queue state in the admin database for the Queue page
+    queue_records_flush_interval: float = 1.0
+    coalesce_window: float = 0
+    coalesce_max_batch: int = 50
+    data_size_limit: int = 10 * 1024 * 1024  # larger messages get a 552
+    inflight_bytes_limit: int = 256 * 1024 * 1024  # accepted bodies held in memory
+    connection_inflight_bytes_limit: int = 64 * 1024 * 1024
+    spill_threshold: int = 1024 * 1024  # larger bodies are memory-mapped from disk; 0 keeps all in RAM
+    forward_attachments: bool = True
+    attachment_max_bytes: int = 2621440  # Pushover's limit; larger images are downsized
+    attachment_source_max_bytes: int = 20 * 1024 * 1024  # larger images are not decoded
+    attachment_memory_budget: int = 64 * 1024 * 1024  # decoded attachments held at once
+    dedup_window: float = 5
+    dedup_capacity: int = 10000
+    dedup_normalize: bool = False
+    settings_poll_interval: float = 5
+    smtp_workers: int = 1
+    tracing_exporter: Optional[str] = None  # "file" or "otlp"
+    tracing_file: str = "traces.jsonl"
+    tracing_endpoint: str = "http://127.0.0.1:4318/v1/traces"
+    tracing_sample_rate: float = 1.0
+    log_level: str = "INFO"
+    log_queue_size: int = 10000  # records buffered for the log writer thread
+    log_sample_per_second: int = 20  # dedup/rate_limit lines per second; 0 logs all
 
 
 import os
 import yaml
+import logging
+from dataclasses import fields, replace
 from typing import Dict, Any, Optional
-from .settings_bridge import get_db_settings, get_setting
 
-def load_config(config_path: str = "config.yaml") -> Dict[str, Any]:
-    """Load configuration from database first, then YAML file, then environment variables"""
-    
-    # Start with database settings
-    config = get_db_settings()
-    
-    # Load YAML config if it exists
+# YAML keys under ``pushover:`` that differ from the Config field names;
+# every other section's keys are Config field names.
+PUSHOVER_KEYS = {
+    'api_token': 'pushover_token',
+    'default_user_key': 'default_user_key',
+    'default_device': 'pushover_device',
+    'recipient_map': 'recipient_map',
+}
+
+# Environment variables from .env.example; any Config field can also be
+# set through its upper-cased name (e.g. SMTP_WORKERS, DEDUP_WINDOW).
+ENV_ALIASES = {
+    'PUSHOVER_TOKEN': 'pushover_token',
+    'PUSHOVER_USER_KEY': 'default_user_key',
+    'PUSHOVER_DEVICE': 'pushover_device',
+    'SMTP_HOST': 'listen_host',
+    'SMTP_PORT': 'listen_port',
+    'SMTP_ALLOW_NOAUTH': 'allow_nonauth',
+    'SMTP_USER': 'smtp_user',
+    'SMTP_PASS': 'smtp_pass',
+    'HTTP_HEALTH_PORT': 'health_port',
+}
+
+def _cast(field_type, value: str):
+    if field_type is bool:
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    if field_type is int:
+        return int(value)
+    if field_type is float:
+        return float(value)
+    return value
+
+def _yaml_values(data: Dict[str, Any]) -> Dict[str, Any]:
+    names = {f.name for f in fields(Config)}
+    values = {}
+    for key, value in data.items():
+        if key == 'pushover' and isinstance(value, dict):
+            for sub, sub_value in value.items():
+                name = PUSHOVER_KEYS.get(sub, sub)
+                if name in names:
+                    values[name] = sub_value
+        elif isinstance(value, dict) and key not in names:
+            values.update({k: v for k, v in value.items() if k in names})
+        elif key in names:
+            values[key] = value
+    return values
+
+def _env_values(environ) -> Dict[str, Any]:
+    types = {f.name: f.type for f in fields(Config) if f.name != 'recipient_map'}
+    names = {name.upper(): name for name in types}
+    names.update(ENV_ALIASES)
+    values = {}
+    for env_name, name in names.items():
+        raw = environ.get(env_name)
+        if raw is None or raw == '':
+            continue
+        try:
+            values[name] = _cast(types[name], raw)
+        except ValueError:
+            logging.warning(f"Ignoring invalid {env_name}={raw!r}")
+    return values
+
+def load_config(config_path: str = "config.yaml", environ=None) -> Config:
+    """Build the Config from YAML, then environment variables, then database settings
+
+    ``CONFIG_FILE`` overrides ``config_path``. Settings saved in the admin UI
+    take precedence, matching what ``apply_settings`` does at runtime.
+    """
+    from .settings_bridge import current_settings
+    environ = os.environ if environ is None else environ
+    config_path = environ.get('CONFIG_FILE', config_path)
+
     yaml_config = {}
     if os.path.exists(config_path):
         try:
             with open(config_path, 'r') as f:
                 yaml_config = yaml.safe_load(f) or {}
         except Exception as e:
-            print(f"Warning: Could not load {config_path}: {e}")
-    
-    # Merge configs (database takes precedence over YAML, env vars take precedence over both)
-    merged_config = {**yaml_config, **config}
-    
-    # Override with environment variables if present
-    env_overrides = {
-        'smtp_host': get_setting('SMTP_HOST'),
-        'smtp_port': int(get_setting('SMTP_PORT', '587')),
-        'smtp_username': get_setting('SMTP_USERNAME'),
-        'smtp_password': get_setting('SMTP_PASSWORD'),
-        'smtp_use_tls': get_setting('SMTP_USE_TLS', 'true').lower() == 'true',
-        'smtp_use_ssl': get_setting('SMTP_USE_SSL', 'false').lower() == 'true',
-        'pushover_token': get_setting('PUSHOVER_TOKEN'),
-        'pushover_user': get_setting('PUSHOVER_USER_KEY'),
-        'pushover_device': get_setting('PUSHOVER_DEVICE'),
-        'queue_dir': get_setting('QUEUE_DIR', './queue'),
-        'max_retries': int(get_setting('MAX_RETRIES', '3')),
-        'retry_delay': int(get_setting('RETRY_DELAY', '300')),
-    }
-    
-    # Only override if environment/database value exists
-    for key, value in env_overrides.items():
+            logging.warning(f"Could not load {config_path}: {e}")
+
+    config = Config(**{**_yaml_values(yaml_config), **_env_values(environ)})
+    snapshot = current_settings()
+    config = apply_settings(config, snapshot)
+    queue_dir = snapshot.get('app.queue_dir')
+    if queue_dir:
+        config = replace(config, queue_dir=queue_dir)
+    return config
+
+def apply_settings(config: Config, snapshot) -> Config:
+    """Return a copy of config with the runtime-tunable database settings applied"""
+    updates = {}
+    for field_name, key, cast in (
+        ('pushover_token', 'pushover.api_token', str),
+        ('default_user_key', 'pushover.default_user_key', str),
+        ('pushover_device', 'pushover.default_device', str),
+        ('max_retries', 'app.max_retries', int),
+        ('retry_delay', 'app.retry_delay', float),
+    ):
+        value = snapshot.get(key)
         if value is not None:
-            merged_config[key] = value
-    
-    return merged_config
+            try:
+                updates[field_name] = cast(value)
+            except ValueError:
+                continue
+    return replace(config, **updates)
 
 def get_smtp_config() -> Dict[str, Any]:
     """Get SMTP configuration for use by the SMTP server"""
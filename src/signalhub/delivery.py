@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from .logs import log_event
+
+
+@dataclass
+class DeliveryJob:
+    rcpt_to: Optional[str]
+    title: str
+    message: str
+    directives: Dict[str, str]
+    user_key: str
+    device: Optional[str] = None
+    envelope: Any = None
+    spool_id: Optional[int] = None
+    attempts: int = 0
+    route_label: str = "default"
+    trace_id: Optional[str] = None
+    parent_span: Optional[str] = None  # set when the message is being traced
+    attachment: Any = None  # mimeparse.ImagePart, decoded at send time
+    accepted_at: float = field(default_factory=time.monotonic)
+
+
+class DeliveryQueue:
+    """Bounded in-process queue drained by a pool of delivery workers.
+
+    SMTP sessions only pay for ``submit``; Pushover round trips and retries
+    happen on the worker tasks. Once the backlog reaches ``high_water`` new
+    jobs are refused so the caller can shed load with a 451.
+    """
+
+    def __init__(self, deliver: Callable[[DeliveryJob], Awaitable[None]],
+                 workers: int = 4, maxsize: int = 1000, high_water: Optional[int] = None):
+        self.deliver = deliver
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self.high_water = min(high_water or maxsize, maxsize)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._inflight: List[DeliveryJob] = []
+
+    def start(self):
+        # Workers must live on the loop that runs the SMTP server, which is
+        # the aiosmtpd controller thread's loop, so start lazily from it.
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(self.maxsize)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def saturated(self) -> bool:
+        return self.depth() >= self.high_water
+
+    def submit(self, job: DeliveryJob) -> bool:
+        self.start()
+        if self.saturated():
+            return False
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def join(self):
+        if self._queue:
+            await self._queue.join()
+
+    async def stop(self) -> List[DeliveryJob]:
+        """Cancel the workers and return jobs that were never delivered."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # In-flight jobs were interrupted mid-send; hand them back too and
+        # accept a possible duplicate over a lost alert.
+        pending = list(self._inflight)
+        self._inflight.clear()
+        while self._queue and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        return pending
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self._inflight.append(job)
+            try:
+                await self.deliver(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log_event(logging.ERROR, "delivery_error", exc_info=True)
+            self._inflight.remove(job)
+            self._queue.task_done()
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on concurrent Pushover sends.
+
+    Each fast success raises the limit by ``1/limit`` (about one slot per
+    round of sends). A retryable error, a 429 or a round trip slower than
+    ``latency_target`` multiplies it by ``decrease``, at most once per
+    ``cooldown`` seconds so one outage counts once. Permanent 4xx
+    rejections say nothing about load and leave it unchanged.
+    """
+
+    def __init__(self, max_limit, min_limit=1, latency_target=2.0, decrease=0.5, cooldown=1.0):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.limit = float(self.max_limit)
+        self.inflight = 0
+        self._waiters = deque()
+        self._last_decrease = float("-inf")
+
+    async def acquire(self):
+        while self.inflight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()  # pass the slot on
+                elif waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                raise
+        self.inflight += 1
+
+    def release(self):
+        self.inflight -= 1
+        self._wake()
+
+    def record(self, rtt, congested=False, now=None):
+        """Adjust the limit after a send that took ``rtt`` seconds."""
+        if congested or rtt > self.latency_target:
+            now = time.monotonic() if now is None else now
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+                self._last_decrease = now
+        elif self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake()
+
+    def _wake(self):
+        free = int(self.limit) - self.inflight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
@@ -1,161 +1,576 @@
+import os
 import re
 import time
-import logging
 import asyncio
+import logging
 import email
-import json
-from email import policy
-from email.parser import BytesParser
-from collections import deque
-from .pushover import send_message
-from .queue import persist_failed_send
-
-class RateLimiter:
-    def __init__(self, rate_per_minute):
-        self.rate = rate_per_minute
-        self.window = deque()
-
-    def allow(self):
-        now = time.time()
-        while self.window and self.window[0] < now - 60:
-            self.window.popleft()
-        if len(self.window) < self.rate:
-            self.window.append(now)
-            return True
-        return False
+import hashlib
+from collections import OrderedDict
+from .attachments import MemoryBudget, decoded_size, prepare
+from .coalesce import Coalescer
+from .delivery import AdaptiveConcurrency, DeliveryJob, DeliveryQueue
+from .ingest import IngestBudget, declared_size, spill
+from .logs import dropped_records, log_event
+from .pushover import PERMANENT, QUOTA, RETRY, PushoverClient
+from .metrics import HandlerMetrics, snapshot
+from .mimeparse import find_image, parse_message
+from .queue import open_spool
+from .queuestate import DEFERRED, DELIVERED, QUEUED, RETRYING, QueueRecorder, record_key
+from .ratelimit import QuotaGuard, RateLimiter
+from .routing import Router
+from .retry import RetryScheduler, backoff_delay
+from .templating import TemplateCache, message_fields
+from .tracing import new_trace_id, tracer_from_config
+
+_DIGITS_RE = re.compile(r'\d+')
+_SPACE_RE = re.compile(r'\s+')
 
 class Dedup:
-    def __init__(self):
-        self.last = {}
+    """Drops repeats of a message seen within ``window`` seconds.
+
+    Keys are stored as 16-byte blake2b fingerprints in insertion order, so
+    expiry pops from the front and ``capacity`` caps memory regardless of
+    how many distinct alerts arrive. With ``normalize`` digits and
+    whitespace runs are folded so alerts differing only by timestamps or
+    counters count as duplicates.
+    """
+
+    def __init__(self, window=5, capacity=10000, normalize=False):
+        self.window = window
+        self.capacity = capacity
+        self.normalize = normalize
+        self.last = OrderedDict()
+
+    def fingerprint(self, key):
+        if self.normalize:
+            key = _SPACE_RE.sub(' ', _DIGITS_RE.sub('#', key.lower()))
+        return hashlib.blake2b(key.encode(), digest_size=16).digest()
 
     def is_dup(self, key):
         now = time.time()
-        if key in self.last and now - self.last[key] < 5:
+        last = self.last
+        while last:
+            fp, seen = next(iter(last.items()))
+            if now - seen < self.window:
+                break
+            last.popitem(last=False)
+        fp = self.fingerprint(key)
+        if fp in last:
             return True
-        self.last[key] = now
+        last[fp] = now
+        if len(last) > self.capacity:
+            last.popitem(last=False)
         return False
 
+    def forget(self, key):
+        """Undo ``is_dup`` for a message that was refused after all, so its retry is accepted."""
+        self.last.pop(self.fingerprint(key), None)
+
 class Handler:
-    def __init__(self, config):
+    def __init__(self, config, mappings=(), templates=(), tracer=None):
         self.config = config
-        self.ratelimiter = RateLimiter(config.rate_limit_per_minute)
-        self.dedup = Dedup()
+        self.tracer = tracer or tracer_from_config(config)
+        self.mappings = list(mappings)
+        self.router = Router.from_config(config, self.mappings)
+        self.templates = TemplateCache(templates)
+        self.ratelimiter = RateLimiter(
+            config.rate_limit_per_minute,
+            per_recipient=config.rate_limit_per_recipient,
+            per_sender=config.rate_limit_per_sender,
+        )
+        self.quota = QuotaGuard(config.pushover_monthly_quota, config.pushover_quota_reserve)
+        self.dedup = Dedup(
+            window=config.dedup_window,
+            capacity=config.dedup_capacity,
+            normalize=config.dedup_normalize,
+        )
+        self.pushover = PushoverClient(
+            endpoint=config.pushover_api_url,
+            pool_size=config.pushover_pool_size,
+            timeout=config.pushover_timeout,
+        )
+        self.concurrency = AdaptiveConcurrency(
+            config.delivery_workers,
+            min_limit=config.delivery_min_concurrency,
+            latency_target=config.pushover_latency_target,
+        )
+        self.attachment_budget = MemoryBudget(config.attachment_memory_budget)
+        self.ingest = IngestBudget(config.inflight_bytes_limit, config.connection_inflight_bytes_limit)
+        self.spill_dir = os.path.join(config.queue_dir, "bodies") if config.queue_dir else None
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+        self.delivery = DeliveryQueue(
+            self._deliver,
+            workers=config.delivery_workers,
+            maxsize=config.delivery_queue_size,
+            high_water=config.delivery_high_water,
+        )
+        self.coalescer = Coalescer(
+            self._emit_batch,
+            window=config.coalesce_window,
+            max_batch=config.coalesce_max_batch,
+        )
+        self.spool = open_spool(config.queue_dir, config.spool_compression) if config.queue_dir else None
+        self.queue_records = QueueRecorder(flush_interval=config.queue_records_flush_interval) \
+            if config.queue_records else None
+        self._deferring = set()
+        self.retries = RetryScheduler(
+            self.delivery.submit,
+            spool=self.spool,
+            job_from_record=self._job_from_record,
+            saturated=self.delivery.saturated,
+        )
         self.metrics = {
             'emails_received': 0,
             'pushed_ok': 0,
             'pushed_failed': 0,
+            'pushed_rejected': 0,
+            'quota_deferred': 0,
+            'attachments_sent': 0,
+            'attachments_skipped': 0,
+            'ingest_refused': 0,
+            'bodies_spilled': 0,
             'dedup_dropped': 0,
             'rate_limited': 0,
+            'quota_throttled': 0,
+            'load_shed': 0,
+            'retries_scheduled': 0,
+            'coalesced': 0,
+            'digests': 0,
         }
+        self.stats = HandlerMetrics()
         self.authenticator = self._authenticator if not config.allow_nonauth else None
         self.tls_context = None  # Set up if needed
 
+    async def handle_MAIL(self, server, session, envelope, address, mail_options):
+        # Refuse early when the declared size would not fit in memory; bodies
+        # that will be spilled to disk don't count.
+        size = declared_size(mail_options)
+        if self.config.spill_threshold and size > self.config.spill_threshold:
+            size = 0
+        reply = self.ingest.admit(session, size)
+        if reply:
+            self.metrics['ingest_refused'] += 1
+            log_event(logging.INFO, "ingest_refused", mail_from=address, bytes=size, in_flight=self.ingest.used)
+            return reply
+        envelope.mail_from = address
+        envelope.mail_options.extend(mail_options)
+        return '250 OK'
+
     async def handle_DATA(self, server, session, envelope):
+        # The trace id doubles as the message id in log lines
+        trace_id = new_trace_id()
+        tracer = self.tracer
+        root = tracer.span("smtp.data", trace_id if tracer.sampled() else None,
+                           size=len(envelope.content or b""))
+        with root:
+            reply = self._accept(session, envelope, trace_id, root.span_id)
+            root.set("smtp.reply", reply[:3])
+        return reply
+
+    def _accept(self, session, envelope, trace_id, parent_span):
+        """Parse, route and queue one message; returns the SMTP reply.
+
+        Stage spans are recorded only when ``parent_span`` is set, i.e. when
+        the message was sampled for tracing.
+        """
+        tracer = self.tracer
+        traced = trace_id if parent_span else None
         self.metrics['emails_received'] += 1
-        remote_ip = session.peer[0] if session.peer else None
         rcpt_to = envelope.rcpt_tos[0] if envelope.rcpt_tos else None
-        subject, body, directives = self._parse_message(envelope.content)
+        if self.delivery.saturated():
+            self.metrics['load_shed'] += 1
+            log_event(logging.INFO, "load_shed", msg_id=trace_id, rcpt_to=rcpt_to, depth=self.delivery.depth())
+            return '451 Delivery queue full, try later'
+        size = len(envelope.content)
+        spill_body = self.config.spill_threshold and size > self.config.spill_threshold
+        if not spill_body:
+            reply = self.ingest.admit(session, size)
+            if reply:
+                self.metrics['ingest_refused'] += 1
+                log_event(logging.INFO, "ingest_refused", msg_id=trace_id, rcpt_to=rcpt_to, bytes=size,
+                          in_flight=self.ingest.used)
+                return reply
+            self.ingest.hold(session, envelope, size)
+        started = time.perf_counter()
+        with tracer.span("parse", traced, parent_span):
+            subject, body, directives = self._parse_message(envelope.content)
+            image = find_image(envelope.content) if self.config.forward_attachments else None
+        self.stats.parse.observe(time.perf_counter() - started)
+        if spill_body:
+            with tracer.span("spill", traced, parent_span, bytes=size):
+                image = self._spill(envelope, image, session, trace_id)
         title = subject[:250] if subject else "(No Subject)"
         message = body[:1024] if body else "(No Body)"
+        # While coalescing, repeats are counted into the digest and the rate
+        # limit and quota apply to the digests instead (see _emit_batch).
+        coalescing = self.coalescer.window > 0
         dedup_key = f"{title}:{message}"
-        if self.dedup.is_dup(dedup_key):
-            self.metrics['dedup_dropped'] += 1
-            logging.info(f'{{"event":"dedup","rcpt_to":"{rcpt_to}","subject":"{title}"}}')
-            return '250 Message deduplicated'
-        if not self.ratelimiter.allow():
-            self.metrics['rate_limited'] += 1
-            logging.info(f'{{"event":"rate_limit","rcpt_to":"{rcpt_to}","subject":"{title}"}}')
+        if not coalescing:
+            with tracer.span("dedup", traced, parent_span) as span:
+                dup = self.dedup.is_dup(dedup_key)
+                span.set("duplicate", dup)
+            if dup:
+                self.metrics['dedup_dropped'] += 1
+                log_event(logging.INFO, "dedup", msg_id=trace_id, rcpt_to=rcpt_to, subject=title)
+                return '250 Message deduplicated'
+        peer = session.peer[0] if session is not None and session.peer else None
+        routes = []
+        routing = time.perf_counter()
+        with tracer.span("route", traced, parent_span) as span:
+            rule, matched = self.router.match(rcpt_to)
+            span.set("mapping", rule)
+            span.set("routes", len(matched))
+        if coalescing:
+            routes = list(matched)
+        else:
+            with tracer.span("rate_limit", traced, parent_span) as span:
+                for route in matched:
+                    limited = self.ratelimiter.check(route.user_key, (peer, envelope.mail_from))
+                    if limited:
+                        self.metrics['rate_limited'] += 1
+                        log_event(logging.INFO, "rate_limit", msg_id=trace_id, level=limited, rcpt_to=rcpt_to, peer=peer, subject=title)
+                    else:
+                        routes.append(route)
+                span.set("limited", len(matched) - len(routes))
+        self.stats.route.observe(time.perf_counter() - routing)
+        if not routes:
+            self.dedup.forget(dedup_key)
             return '451 Rate limit exceeded, try later'
-        user_key = self._route_recipient(rcpt_to)
-        token = self.config.pushover_token
-        device = self.config.pushover_device
-
-        # Log the translated message before sending to Pushover
-        log_payload = {
-            "event": "translated_message",
-            "rcpt_to": rcpt_to,
-            "title": title,
-            "message": message,
-            "directives": directives,
-            "user_key": user_key,
+        if not coalescing and not self.quota.allow(directives.get('prio')):
+            self.metrics['quota_throttled'] += 1
+            log_event(logging.INFO, "quota_throttle", msg_id=trace_id, rcpt_to=rcpt_to, remaining=self.quota.remaining)
+            self.dedup.forget(dedup_key)
+            return '451 Pushover quota nearly exhausted, try later'
+
+        # Log the translated message before handing it to the delivery workers
+        log_event(
+            logging.INFO,
+            "translated_message",
+            msg_id=trace_id,
+            rcpt_to=rcpt_to,
+            title=title,
+            message=message,
+            directives=directives,
+            user_keys=[route.user_key for route in routes],
+        )
+
+        fields = None
+        with tracer.span("enqueue", traced, parent_span) as span:
+            for route in routes:
+                job_title, job_message = title, message
+                if route.template_id is not None:
+                    if fields is None:
+                        fields = message_fields(envelope.mail_from, rcpt_to, title, message, directives)
+                    with tracer.span("template", traced, span.span_id, template_id=route.template_id):
+                        rendered = self.templates.render(route.template_id, fields)
+                    if rendered is not None:
+                        job_title = (rendered[0] or title)[:250]
+                        job_message = rendered[1][:1024] or message
+                job = DeliveryJob(
+                    rcpt_to=rcpt_to,
+                    title=job_title,
+                    message=job_message,
+                    directives=directives,
+                    user_key=route.user_key,
+                    device=route.device or self.config.pushover_device,
+                    envelope=envelope,
+                    route_label=rule,
+                    trace_id=trace_id,
+                    parent_span=parent_span,
+                    attachment=image,
+                )
+                depth = self.delivery.depth()
+                self.stats.queue_depth.observe(depth)
+                span.set("queue_depth", depth)
+                if coalescing:
+                    self.coalescer.add(job)
+                elif not self.delivery.submit(job):
+                    self.metrics['load_shed'] += 1
+                    log_event(logging.INFO, "load_shed", msg_id=trace_id, rcpt_to=rcpt_to, depth=self.delivery.depth())
+                    self.dedup.forget(dedup_key)
+                    return '451 Delivery queue full, try later'
+        return '250 Message accepted for delivery'
+
+    def _spill(self, envelope, image, session, trace_id):
+        """Move a large body to disk; jobs then read it through an mmap."""
+        try:
+            mapped = spill(envelope.content, self.spill_dir)
+        except OSError as e:
+            log_event(logging.WARNING, "spill_failed", msg_id=trace_id, error=str(e))
+            self.ingest.hold(session, envelope, len(envelope.content))
+            return image
+        self.metrics['bodies_spilled'] += 1
+        envelope.content = mapped
+        envelope.original_content = None
+        return image._replace(content=mapped) if image is not None else None
+
+    def _emit_batch(self, job, count):
+        if count > 1:
+            self.metrics['digests'] += 1
+            self.metrics['coalesced'] += count
+        # Batched messages were already accepted, so the quota, the rate
+        # limit and a full queue defer the digest instead of refusing it.
+        if not self.quota.allow(job.directives.get('prio')):
+            self.metrics['quota_throttled'] += 1
+            due = max(self.quota.reset_at, time.time() + self.config.retry_delay)
+            log_event(logging.INFO, "quota_throttle", msg_id=job.trace_id, rcpt_to=job.rcpt_to,
+                      remaining=self.quota.remaining, count=count)
+            self._defer(job, due, DEFERRED)
+            return
+        wait = self.ratelimiter.reserve(job.user_key)
+        if wait > 0:
+            self.metrics['rate_limited'] += 1
+            log_event(logging.INFO, "rate_limit", msg_id=job.trace_id, level="digest", rcpt_to=job.rcpt_to,
+                      delay=round(wait, 1), count=count)
+            self._defer(job, time.time() + wait)
+        elif not self.delivery.submit(job):
+            self._defer(job, time.time() + 1, QUEUED)
+
+    def _defer(self, job, due, status=None):
+        """Schedule ``job`` from synchronous code; the spool write runs in the background."""
+        async def schedule():
+            await self.retries.schedule(job, due)
+            if status is not None:
+                self._track(job, status, due)
+
+        task = asyncio.get_running_loop().create_task(schedule())
+        self._deferring.add(task)
+        task.add_done_callback(self._deferring.discard)
+
+    async def _deliver(self, job):
+        attachment, held = await self._load_attachment(job)
+        try:
+            await self._send(job, attachment)
+        finally:
+            if held:
+                self.attachment_budget.release(held)
+
+    async def push(self, job):
+        """Send ``job`` once and return the PushoverResponse.
+
+        Unlike queued delivery nothing is retried, counted or written to the
+        spool; the caller (the replay engine) decides what happens next.
+        """
+        attachment, held = await self._load_attachment(job)
+        try:
+            return await self._post(job, attachment)
+        finally:
+            if held:
+                self.attachment_budget.release(held)
+
+    def _post(self, job, attachment=None):
+        return self.pushover.post(
+            job.user_key,
+            job.title,
+            job.message,
+            self.config.pushover_token,
+            priority=job.directives.get('prio'),
+            sound=job.directives.get('sound'),
+            url=job.directives.get('url'),
+            url_title=job.directives.get('urltitle'),
+            device=job.device,
+            attachment=attachment,
+        )
+
+    async def _load_attachment(self, job):
+        """Decode the job's image within the memory budget; returns ``(attachment, bytes held)``."""
+        part = job.attachment
+        if part is None:
+            return None, 0
+        size = decoded_size(part)
+        if size > self.config.attachment_source_max_bytes:
+            reason = "too_large"
+        elif not self.attachment_budget.acquire(size):
+            reason = "memory_budget"
+        else:
+            try:
+                if size <= 256 * 1024:
+                    attachment = prepare(part, self.config.attachment_max_bytes)
+                else:
+                    attachment = await asyncio.get_running_loop().run_in_executor(
+                        None, prepare, part, self.config.attachment_max_bytes)
+            except Exception as e:
+                attachment = None
+                log_event(logging.WARNING, "attachment_failed", msg_id=job.trace_id, error=str(e))
+            if attachment is not None:
+                return attachment, size
+            self.attachment_budget.release(size)
+            reason = "not_shrinkable"
+        # The notification still goes out, just without the image
+        self.metrics['attachments_skipped'] += 1
+        log_event(logging.INFO, "attachment_skipped", msg_id=job.trace_id, reason=reason, bytes=size)
+        return None, 0
+
+    async def _send(self, job, attachment):
+        await self.concurrency.acquire()
+        try:
+            sent = time.perf_counter()
+            traced = job.trace_id if job.parent_span else None
+            with self.tracer.span("pushover.send", traced, job.parent_span,
+                                  attempt=job.attempts + 1, mapping=job.route_label) as span:
+                resp = await self._post(job, attachment)
+                span.set("http.status", resp.status)
+                span.set("outcome", resp.outcome)
+            rtt = time.perf_counter() - sent
+        finally:
+            self.concurrency.release()
+        self.concurrency.record(rtt, congested=resp.outcome in (RETRY, QUOTA))
+        self.stats.pushover_rtt.observe(rtt, job.route_label)
+        if resp.app_remaining is not None:
+            self.quota.update(resp.app_remaining, resp.app_reset)
+        status, body_resp = resp.status, resp.body
+        if resp.ok:
+            self.metrics['pushed_ok'] += 1
+            self.stats.delivery_latency.observe(time.monotonic() - job.accepted_at, job.route_label)
+            self.stats.attempts.observe(job.attempts + 1, job.route_label, "delivered")
+            if resp.app_remaining is None:
+                self.quota.record_sent()
+            if attachment is not None:
+                self.metrics['attachments_sent'] += 1
+            if job.spool_id is not None:
+                await asyncio.to_thread(self.spool.ack, job.spool_id)
+            if job.attempts or job.spool_id is not None:
+                self._track(job, DELIVERED)
+            log_event(logging.INFO, "push_ok", msg_id=job.trace_id, rcpt_to=job.rcpt_to, subject=job.title, status=status)
+            return
+        if resp.outcome == QUOTA:
+            # Nothing is accepted before the monthly reset; hold the job
+            # until then without counting it as a failed attempt.
+            self.quota.update(0, resp.app_reset)
+            self.metrics['quota_deferred'] += 1
+            log_event(logging.WARNING, "push_quota_exhausted", msg_id=job.trace_id, rcpt_to=job.rcpt_to,
+                      reset_at=self.quota.reset_at)
+            due = max(self.quota.reset_at, time.time() + self.config.retry_delay)
+            await self.retries.schedule(job, due, str(body_resp))
+            self._track(job, DEFERRED, due, str(body_resp))
+            return
+        job.attempts += 1
+        # log failure details
+        log_event(
+            logging.ERROR,
+            "push_attempt_failed",
+            msg_id=job.trace_id,
+            rcpt_to=job.rcpt_to,
+            subject=job.title,
+            status=status,
+            outcome=resp.outcome,
+            response=str(body_resp),
+            retry=job.attempts,
+        )
+        if resp.outcome == PERMANENT or job.attempts > self.config.max_retries:
+            outcome = "rejected" if resp.outcome == PERMANENT else "failed"
+            self.metrics['pushed_rejected' if resp.outcome == PERMANENT else 'pushed_failed'] += 1
+            self.stats.attempts.observe(job.attempts, job.route_label, outcome)
+            log_event(logging.INFO, "push_" + outcome, msg_id=job.trace_id, rcpt_to=job.rcpt_to, subject=job.title, status=status)
+            # Exhausted and rejected jobs stay in the spool for a manual
+            # replay; rejected ones are marked exhausted so they are not resumed.
+            if self.spool is not None:
+                attempts, job.attempts = job.attempts, max(job.attempts, self.config.max_retries + 1)
+                await asyncio.to_thread(self.retries.persist, job, time.time(), str(body_resp))
+                job.attempts = attempts
+            self._track(job, outcome, error=str(body_resp))
+            return
+        self.metrics['retries_scheduled'] += 1
+        due = time.time() + backoff_delay(job.attempts, self.config.retry_delay)
+        await self.retries.schedule(job, due, str(body_resp))
+        self._track(job, RETRYING, due, str(body_resp))
+
+    def _track(self, job, status, next_attempt_at=None, error=None):
+        """Record ``job``'s queue state for the admin UI."""
+        if self.queue_records is not None:
+            key = record_key(job.trace_id, job.user_key, job.device)
+            self.queue_records.record(key, job.rcpt_to, job.title, status, job.attempts,
+                                      next_attempt_at, error, job.spool_id)
+
+    def _job_from_record(self, record):
+        rcpt_to = record["rcpt_tos"][0] if record["rcpt_tos"] else None
+        title, message, directives = record["title"], record["message"], record["directives"]
+        if title is None:
+            # Records imported from queue.jsonl only carry the raw message
+            subject, body, directives = self._parse_message(record["content"] or b"")
+            title = subject[:250] if subject else "(No Subject)"
+            message = body[:1024] if body else "(No Body)"
+        # Count end-to-end latency from when the message was first spooled
+        age = max(0.0, time.time() - record["created_at"]) if record.get("created_at") else 0.0
+        return DeliveryJob(
+            rcpt_to=rcpt_to,
+            title=title,
+            message=message,
+            directives=directives,
+            user_key=record["user_key"] or self._route_recipient(rcpt_to),
+            device=record["device"] or self.config.pushover_device,
+            spool_id=record["id"],
+            attempts=record["attempts"],
+            route_label=self.router.match(rcpt_to)[0],
+            accepted_at=time.monotonic() - age,
+            trace_id=record.get("trace_id") or new_trace_id(),
+            parent_span=record.get("parent_span"),
+            attachment=self._record_image(record),
+        )
+
+    def _record_image(self, record):
+        if not self.config.forward_attachments or not record["content"]:
+            return None
+        if record["image"] is not False:
+            return record["image"]
+        return find_image(record["content"])
+
+    def metrics_snapshot(self):
+        """Counters, gauges and histograms as plain data (see metrics.render)."""
+        gauges = {
+            'delivery_queue_jobs': self.delivery.depth(),
+            'retry_scheduled_jobs': len(self.retries),
+            'pushover_quota_remaining': self.quota.remaining,
+            'delivery_concurrency_limit': int(self.concurrency.limit),
+            'ingest_bytes_in_flight': self.ingest.used,
+            'queue_records_dropped': self.queue_records.dropped if self.queue_records else 0,
+            'log_records_dropped': dropped_records(),
         }
-        logging.info(json.dumps(log_payload))
-
-        retries = 0
-        backoffs = [0.5, 2, 5]
-        while retries <= 3:
-            ok, status, body_resp = await asyncio.get_event_loop().run_in_executor(
-                None,
-                send_message,
-                user_key,
-                title,
-                message,
-                token,
-                directives.get('priority'),
-                directives.get('sound'),
-                directives.get('url'),
-                directives.get('url_title'),
-                device,
-            )
-            if ok:
-                self.metrics['pushed_ok'] += 1
-                logging.info(f'{{"event":"push_ok","rcpt_to":"{rcpt_to}","subject":"{title}","status":{status}}}')
-                return '250 Message accepted'
+        return snapshot(self.metrics, gauges, self.stats.histograms())
+
+    def update_config(self, config):
+        """Swap in a new config (e.g. after a settings change) between messages."""
+        self.router = Router.from_config(config, self.mappings)
+        self.config = config
+
+    def update_mappings(self, mappings, router, config):
+        """Swap in edited mappings with the Router a MappingWatcher built for ``config``."""
+        if config is not self.config:  # settings changed meanwhile
+            router = Router.from_config(self.config, mappings)
+        self.mappings = list(mappings)
+        self.router = router
+
+    async def start(self):
+        """Start delivery workers and resume retries left in the spool."""
+        self.delivery.start()
+        self.retries.start(max_attempts=self.config.max_retries)
+
+    async def stop(self):
+        """Stop background tasks, spooling anything not yet delivered."""
+        await self.retries.stop()
+        self.coalescer.flush_all()
+        await asyncio.gather(*self._deferring, return_exceptions=True)
+        for job in await self.delivery.stop():
+            if self.spool is None:
+                continue
+            if job.spool_id is not None:
+                await asyncio.to_thread(self.spool.release, job.spool_id)
             else:
-                retries += 1
-                # log failure details
-                logging.error(json.dumps({
-                    "event": "push_attempt_failed",
-                    "rcpt_to": rcpt_to,
-                    "subject": title,
-                    "status": status,
-                    "response": str(body_resp),
-                    "retry": retries,
-                }))
-                if retries > 3:
-                    self.metrics['pushed_failed'] += 1
-                    logging.info(f'{{"event":"push_failed","rcpt_to":"{rcpt_to}","subject":"{title}","status":{status}}}')
-                    if self.config.queue_dir:
-                        persist_failed_send(self.config.queue_dir, envelope, directives)
-                    return '451 Temporary failure, queued'
-                await asyncio.sleep(backoffs[retries-1])
+                await asyncio.to_thread(self.retries.persist, job, time.time())
+        await self.pushover.close()
+        if self.spool is not None:
+            await asyncio.to_thread(self.spool.sync)
+        await asyncio.get_running_loop().run_in_executor(None, self.tracer.close)
+        if self.queue_records is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.queue_records.close)
 
     def _parse_message(self, content):
-        msg = BytesParser(policy=policy.default).parsebytes(content)
-        subject = msg['subject'] or ""
-        body = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == "text/plain":
-                    body = part.get_content().strip()
-                    break
-            if not body:
-                for part in msg.walk():
-                    if part.get_content_type() == "text/html":
-                        body = re.sub('<[^<]+?>', '', part.get_content())
-                        break
-        else:
-            if msg.get_content_type() == "text/plain":
-                body = msg.get_content().strip()
-            elif msg.get_content_type() == "text/html":
-                body = re.sub('<[^<]+?>', '', msg.get_content())
-        directives = {}
-        directive_re = re.compile(r'\[(PRIO|SOUND|URL|URLTITLE)=([^\]]+)\]', re.I)
-        for m in directive_re.finditer(subject):
-            key = m.group(1).lower()
-            val = m.group(2)
-            directives[key] = val
-        return subject, body, directives
+        return parse_message(content, body_limit=1024)
 
     def _route_recipient(self, rcpt_to):
-        if not rcpt_to:
-            return self.config.default_user_key
-        rcpt_map = {k.lower(): v for k, v in self.config.recipient_map.items()}
-        val = rcpt_map.get(rcpt_to.lower())
-        # If mapping exists but is empty/None, fall back to default
-        if not val:
-            return self.config.default_user_key
-        return val
+        routes = self.router.route(rcpt_to)
+        return routes[0].user_key if routes else self.config.default_user_key
 
     def _authenticator(self, server, session, envelope, mechanism, auth_data):
         if mechanism != "LOGIN":
@@ -1,28 +1,32 @@
 import asyncio
 from aiohttp import web
+from .metrics import render
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
 
 async def healthz(request):
     return web.Response(text="ok")
 
 async def metrics(request):
-    # These would be updated from Handler instance in real app
-    counters = request.app["metrics"]
-    return web.json_response(counters)
+    body = render(request.app["metrics"]()).encode()
+    return web.Response(body=body, headers={"Content-Type": CONTENT_TYPE})
+
+async def metrics_json(request):
+    return web.json_response(request.app["metrics"]()["counters"])
 
-async def start_health_server(config):
+async def start_health_server(config, metrics_source=None):
+    """Serve /healthz and /metrics; ``metrics_source`` returns a metrics snapshot."""
     app = web.Application()
-    app["metrics"] = {
-        "emails_received": 0,
-        "pushed_ok": 0,
-        "pushed_failed": 0,
-        "dedup_dropped": 0,
-        "rate_limited": 0,
-    }
+    app["metrics"] = metrics_source or (lambda: {"counters": {}, "gauges": {}, "histograms": {}})
     app.router.add_get("/healthz", healthz)
     app.router.add_get("/metrics", metrics)
+    app.router.add_get("/metrics.json", metrics_json)
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, "0.0.0.0", config.health_port)
-    await site.start()
-    while True:
-        await asyncio.sleep(3600)
+    try:
+        site = web.TCPSite(runner, "0.0.0.0", config.health_port)
+        await site.start()
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await runner.cleanup()
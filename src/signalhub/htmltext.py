@@ -0,0 +1,79 @@
+"""Single-pass HTML-to-text extraction for HTML-only alert emails.
+
+One precompiled tokenizer walks the markup lazily with ``finditer``, so
+scanning stops as soon as the text budget is filled instead of stripping
+the whole document first.
+"""
+import re
+from html import unescape
+
+SKIP_TAGS = ("script", "style", "head", "title", "noscript", "template")
+BLOCK_TAGS = frozenset((
+    "p", "div", "br", "tr", "li", "ul", "ol", "table", "hr", "blockquote", "pre",
+    "h1", "h2", "h3", "h4", "h5", "h6", "section", "article", "header", "footer",
+))
+CELL_TAGS = frozenset(("td", "th"))
+
+_TOKEN_RE = re.compile(
+    r'(?P<text>[^<]+)'
+    r'|<!--.*?(?:-->|\Z)'
+    r'|<(?P<skip>' + "|".join(SKIP_TAGS) + r')\b.*?(?:</(?P=skip)\s*>|\Z)'
+    r'|<(?P<close>/?)(?P<tag>[a-zA-Z][a-zA-Z0-9]*)[^>]*>'
+    r'|<[!?][^>]*>'
+    r'|(?P<lt><)',
+    re.S | re.I,
+)
+
+
+def html_to_text(html, limit=1024):
+    """Return the visible text of ``html``, at most ``limit`` characters.
+
+    Script/style/head content and comments are dropped, entities are
+    decoded, whitespace runs collapse to one space and block elements
+    become line breaks.
+    """
+    parts = []
+    size = 0
+    last = "\n"
+    for m in _TOKEN_RE.finditer(html):
+        text = m.group("text")
+        if text is None:
+            tag = m.group("tag")
+            if tag is not None:
+                tag = tag.lower()
+                if tag in BLOCK_TAGS:
+                    if last == " ":
+                        parts[-1] = parts[-1][:-1]
+                        size -= 1
+                    if last != "\n":
+                        parts.append("\n")
+                        size += 1
+                        last = "\n"
+                elif tag in CELL_TAGS and not m.group("close") and last not in " \n":
+                    parts.append(" ")
+                    size += 1
+                    last = " "
+                continue
+            if m.group("lt") is None:
+                continue
+            text = "<"
+        if "&" in text:
+            text = unescape(text)
+        # str.split() collapses whitespace far faster than a \s+ regex
+        words = text.split()
+        if words:
+            chunk = " ".join(words)
+            if text[0].isspace() and last not in " \n":
+                chunk = " " + chunk
+            if text[-1].isspace():
+                chunk += " "
+        elif last not in " \n":
+            chunk = " "
+        else:
+            continue
+        parts.append(chunk)
+        size += len(chunk)
+        last = chunk[-1]
+        if size >= limit:
+            break
+    return "".join(parts).strip()[:limit]
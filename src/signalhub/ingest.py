@@ -0,0 +1,82 @@
+"""Bounds on the message bytes the SMTP front end holds in memory.
+
+aiosmtpd enforces ``data_size_limit`` while it reads DATA, answering 552
+once a message grows past it (or already at MAIL FROM when the client
+declares a larger SIZE=). After that an accepted body stays referenced by
+its delivery jobs until they finish, so :class:`IngestBudget` counts the
+bytes of live envelopes per connection and in total, and new transactions
+get a 452 while either budget is full. Bodies above the spill threshold
+are moved to an unlinked temporary file and memory-mapped instead of
+counted: the page cache can write them out under memory pressure.
+"""
+import os
+import mmap
+import tempfile
+import weakref
+
+TOO_MUCH_ON_CONNECTION = '452 4.3.1 Too much mail in flight on this connection, try later'
+TOO_MUCH_IN_FLIGHT = '452 4.3.1 Insufficient system storage, try later'
+
+
+def declared_size(mail_options):
+    """The SIZE= value from MAIL FROM parameters, or 0."""
+    for option in mail_options:
+        if option.upper().startswith("SIZE="):
+            value = option[5:]
+            return int(value) if value.isdigit() else 0
+    return 0
+
+
+class IngestBudget:
+    """Bytes of accepted message bodies still referenced, per session and overall.
+
+    Limits of 0 disable a level.
+    """
+
+    def __init__(self, global_limit=0, per_connection_limit=0):
+        self.global_limit = global_limit
+        self.per_connection_limit = per_connection_limit
+        self.used = 0
+        self._sessions = weakref.WeakKeyDictionary()
+
+    def session_used(self, session):
+        counter = self._sessions.get(session) if session is not None else None
+        return counter[0] if counter else 0
+
+    def admit(self, session, size=0):
+        """Return a 452 reply if ``size`` more bytes would exceed a budget, else None."""
+        if self.per_connection_limit and self.session_used(session) + size > self.per_connection_limit:
+            return TOO_MUCH_ON_CONNECTION
+        if self.global_limit and self.used + size > self.global_limit:
+            return TOO_MUCH_IN_FLIGHT
+        return None
+
+    def hold(self, session, envelope, size):
+        """Count ``size`` bytes until ``envelope`` is garbage collected."""
+        self.used += size
+        counter = None
+        if session is not None:
+            counter = self._sessions.get(session)
+            if counter is None:
+                counter = self._sessions[session] = [0]
+            counter[0] += size
+        weakref.finalize(envelope, self._release, counter, size)
+
+    def _release(self, counter, size):
+        self.used -= size
+        if counter is not None:
+            counter[0] -= size
+
+
+def spill(content, directory=None):
+    """Copy ``content`` to an unlinked file and return a read-only mmap of it."""
+    fd, path = tempfile.mkstemp(prefix="body-", suffix=".eml", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        # The mapping keeps the data; the name goes away (and with it any
+        # leftovers after a crash) right now.
+        os.unlink(path)
@@ -0,0 +1,148 @@
+"""Structured, non-blocking logging.
+
+Log lines are events: ``log_event(logging.INFO, "dedup", rcpt_to=...)``
+builds an :class:`Event` dict that is only serialized when a handler
+formats it. ``setup_logging`` routes every record through a bounded
+``QueueHandler`` to a listener thread, so the SMTP event loop pays for a
+dict and a ``put_nowait``; JSON encoding (orjson when installed) and the
+write happen on the listener. When the queue is full records are dropped
+and counted rather than blocking, and high-volume events (dedup,
+rate_limit) are sampled per second with the number suppressed reported on
+the next one that gets through.
+"""
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+logger = logging.getLogger("signalhub")
+
+# Events that can repeat once per message during an alert storm
+SAMPLED_EVENTS = ("dedup", "rate_limit")
+
+if orjson is not None:
+    def dumps(obj):
+        return orjson.dumps(obj, default=str).decode()
+else:
+    dumps = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=str).encode
+
+
+class Event(dict):
+    """A log record's payload; renders as one JSON object."""
+
+    def __str__(self):
+        return dumps(self)
+
+
+def log_event(level, event, /, exc_info=None, **fields):
+    """Log ``event`` with ``fields`` as a structured record."""
+    if logger.isEnabledFor(level):
+        logger.log(level, Event(event=event, **fields), exc_info=exc_info)
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats events as JSON; plain string messages pass through unchanged."""
+
+    def format(self, record):
+        msg = record.msg
+        if not isinstance(msg, Event):
+            return super().format(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            msg = Event(msg, exc=record.exc_text)
+        return dumps(msg)
+
+
+class EventSampler(logging.Filter):
+    """Passes at most ``per_second`` records of each sampled event per second."""
+
+    def __init__(self, per_second, events=SAMPLED_EVENTS):
+        super().__init__()
+        self.per_second = per_second
+        self.windows = {name: [0.0, 0, 0] for name in events}  # start, passed, suppressed
+
+    def filter(self, record):
+        msg = record.msg
+        if not isinstance(msg, Event):
+            return True
+        window = self.windows.get(msg.get("event"))
+        if window is None:
+            return True
+        now = time.monotonic()
+        if now - window[0] >= 1.0:
+            window[0] = now
+            window[1] = 0
+        if window[1] >= self.per_second:
+            window[2] += 1
+            return False
+        window[1] += 1
+        if window[2]:
+            msg["suppressed"] = window[2]
+            window[2] = 0
+        return True
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Leave events as dicts; the listener thread serializes them
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if record.args and not isinstance(record.msg, Event):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_queue_handler = None
+
+
+def dropped_records():
+    """Records dropped because the log queue was full."""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def setup_logging(config, stream=None):
+    """Route all logging through a bounded queue to a JSON writer thread.
+
+    Returns the started ``QueueListener``; it is stopped (flushing the
+    queue) at interpreter exit.
+    """
+    global _queue_handler
+    level = getattr(logging, str(config.log_level).upper(), logging.INFO)
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JSONFormatter())
+    handler = BoundedQueueHandler(queue.Queue(config.log_queue_size))
+    if config.log_sample_per_second > 0:
+        handler.addFilter(EventSampler(config.log_sample_per_second))
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+    listener = QueueListener(handler.queue, output)
+    listener.start()
+    atexit.register(listener.stop)
+    _queue_handler = handler
+    return listener
@@ -0,0 +1,180 @@
+"""Handler metrics and Prometheus text exposition.
+
+Counters stay in the plain ``Handler.metrics`` dict; histograms keep
+per-bucket counts for each label set. Both are only written from the SMTP
+event loop. ``snapshot()`` copies them with single C-level calls, so the
+health server can read them from another thread without locks, and the
+result is plain data that worker processes can ship to the parent.
+"""
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+PREFIX = "signalhub"
+
+# Seconds; parse/route are in-process, Pushover and end-to-end are network bound
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+NETWORK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+DEPTH_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+ATTEMPT_BUCKETS = (1, 2, 3, 4, 5, 10)
+_INF = 'le="+Inf"'
+
+COUNTER_HELP = {
+    'emails_received': "Messages received over SMTP",
+    'pushed_ok': "Notifications accepted by Pushover",
+    'pushed_failed': "Notifications that exhausted their retries",
+    'pushed_rejected': "Notifications rejected by Pushover with a 4xx (not retried)",
+    'quota_deferred': "Sends held until the monthly quota resets after a 429",
+    'dedup_dropped': "Messages dropped as duplicates",
+    'rate_limited': "Routes refused, or digests delayed, by a rate limit",
+    'quota_throttled': "Messages refused, or digests deferred, to protect the Pushover quota",
+    'load_shed': "Messages refused because the delivery queue was full",
+    'ingest_refused': "Transactions refused with 452 because the in-flight byte budget was full",
+    'bodies_spilled': "Large message bodies moved from memory to disk",
+    'retries_scheduled': "Failed sends scheduled for a retry",
+    'coalesced': "Messages folded into digests",
+    'attachments_sent': "Notifications sent with an image attachment",
+    'attachments_skipped': "Images not forwarded (too large or over the memory budget)",
+    'digests': "Digest notifications emitted",
+}
+
+GAUGE_HELP = {
+    'delivery_queue_jobs': "Jobs waiting in the delivery queue",
+    'retry_scheduled_jobs': "Failed sends waiting for their retry",
+    'pushover_quota_remaining': "Messages left in this month's Pushover quota",
+    'delivery_concurrency_limit': "Current adaptive limit on concurrent Pushover requests",
+    'ingest_bytes_in_flight': "Bytes of accepted message bodies held in memory",
+    'queue_records_dropped': "Queue page updates dropped because the database fell behind",
+    'log_records_dropped': "Log records dropped because the log queue was full",
+    'smtp_workers': "SMTP worker processes reporting metrics",
+}
+
+# Gauges that report account-wide state every worker sees the same way;
+# merged snapshots take their highest value instead of the sum.
+GLOBAL_GAUGES = frozenset({'pushover_quota_remaining'})
+
+
+class Histogram:
+    """Fixed-bucket histogram with optional labels."""
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        row = self.series.get(labels)
+        if row is None:
+            row = self.series[labels] = [0] * (len(self.buckets) + 2)
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def snapshot(self):
+        return {labels: list(row) for labels, row in list(self.series.items())}
+
+
+class HandlerMetrics:
+    """Latency and size histograms recorded by the Handler."""
+
+    def __init__(self):
+        self.parse = Histogram("parse_seconds", "Time to parse an incoming message", FAST_BUCKETS)
+        self.route = Histogram("route_seconds", "Time to route and rate-limit a message", FAST_BUCKETS)
+        self.pushover_rtt = Histogram(
+            "pushover_rtt_seconds", "Pushover API round trip time", NETWORK_BUCKETS, ("mapping",))
+        self.delivery_latency = Histogram(
+            "delivery_latency_seconds", "Time from SMTP accept to Pushover acceptance",
+            NETWORK_BUCKETS, ("mapping",))
+        self.queue_depth = Histogram(
+            "delivery_queue_depth", "Delivery queue depth seen by each submitted job", DEPTH_BUCKETS)
+        self.attempts = Histogram(
+            "delivery_attempts", "Send attempts per finished notification", ATTEMPT_BUCKETS,
+            ("mapping", "outcome"))
+
+    def histograms(self) -> Iterable[Histogram]:
+        return (self.parse, self.route, self.pushover_rtt, self.delivery_latency,
+                self.queue_depth, self.attempts)
+
+
+def snapshot(counters, gauges, histograms: Iterable[Histogram]):
+    """Plain-data copy of the current metric values."""
+    return {
+        "counters": dict(counters),
+        "gauges": dict(gauges),
+        "histograms": {
+            h.name: {"help": h.help, "buckets": h.buckets, "labelnames": h.labelnames,
+                     "series": h.snapshot()}
+            for h in histograms
+        },
+    }
+
+
+def merge(snapshots):
+    """Sum snapshots from several processes into one (see GLOBAL_GAUGES)."""
+    merged = {"counters": {}, "gauges": {}, "histograms": {}}
+    for snap in snapshots:
+        for section in ("counters", "gauges"):
+            target = merged[section]
+            for key, value in snap[section].items():
+                if key in target and section == "gauges" and key in GLOBAL_GAUGES:
+                    target[key] = max(target[key], value)
+                else:
+                    target[key] = target.get(key, 0) + value
+        for name, hist in snap["histograms"].items():
+            target = merged["histograms"].setdefault(name, {**hist, "series": {}})
+            for labels, row in hist["series"].items():
+                current = target["series"].get(labels)
+                if current is None:
+                    target["series"][labels] = list(row)
+                else:
+                    target["series"][labels] = [a + b for a, b in zip(current, row)]
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(snap) -> str:
+    """Render a snapshot in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for key, value in sorted(snap["counters"].items()):
+        name = f"{PREFIX}_{key}_total"
+        lines.append(f"# HELP {name} {COUNTER_HELP.get(key, key.replace('_', ' '))}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {_number(value)}")
+    for key, value in sorted(snap["gauges"].items()):
+        name = f"{PREFIX}_{key}"
+        lines.append(f"# HELP {name} {GAUGE_HELP.get(key, key.replace('_', ' '))}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_number(value)}")
+    for key, hist in sorted(snap["histograms"].items()):
+        name = f"{PREFIX}_{key}"
+        names = hist["labelnames"]
+        lines.append(f"# HELP {name} {hist['help']}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, row in sorted(hist["series"].items()):
+            cumulative = 0
+            for bound, count in zip(hist["buckets"], row):
+                cumulative += count
+                le = 'le="' + _number(float(bound)) + '"'
+                lines.append(f"{name}_bucket{_labels(names, labels, le)} {cumulative}")
+            cumulative += row[len(hist["buckets"])]
+            lines.append(f"{name}_bucket{_labels(names, labels, _INF)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {_number(row[-1])}")
+            lines.append(f"{name}_count{_labels(names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
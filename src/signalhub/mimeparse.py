@@ -0,0 +1,167 @@
+"""Size-bounded MIME parsing for handle_DATA.
+
+Only the top-level headers and the first text/plain part (or, failing
+that, the first text/html part) are decoded, and only as many bytes of
+it as the notification can hold. Other parts, including attachments,
+are stepped over by searching for the next boundary and never decoded.
+``find_image`` locates the first image part the same way and returns its
+byte range, leaving decoding to the sender.
+"""
+import re
+import binascii
+from typing import NamedTuple, Optional
+from email import policy
+from email.parser import BytesHeaderParser
+from .htmltext import html_to_text
+
+DIRECTIVE_RE = re.compile(r'\[(PRIO|SOUND|URL|URLTITLE)=([^\]]+)\]', re.I)
+_HEADER_END = re.compile(rb'\r?\n\r?\n')
+
+_top_parser = BytesHeaderParser(policy=policy.default)
+_part_parser = BytesHeaderParser(policy=policy.compat32)
+
+MAX_DEPTH = 5
+# Worst case bytes per character once transfer- and charset-encoded
+_BYTES_PER_CHAR = {"base64": 6, "quoted-printable": 12}
+# HTML carries markup, so read more source to fill the same text budget
+HTML_FACTOR = 16
+
+
+def parse_message(content, body_limit=1024):
+    """Return ``(subject, body, directives)`` decoding at most ``body_limit`` body chars."""
+    headers, body_start = _split_headers(content, 0, len(content), _top_parser)
+    subject = str(headers['subject'] or "")
+    plain, html = _find_text(content, headers, body_start, len(content), 0)
+    body = ""
+    if plain is not None:
+        body = _decode(content, plain, body_limit).strip()
+    elif html is not None:
+        body = html_to_text(_decode(content, html, body_limit * HTML_FACTOR), body_limit)
+    directives = {}
+    for m in DIRECTIVE_RE.finditer(subject):
+        directives[m.group(1).lower()] = m.group(2)
+    return subject, body[:body_limit], directives
+
+
+class ImagePart(NamedTuple):
+    """Byte range of an image part within the raw message ``content``."""
+    content: bytes
+    start: int
+    end: int
+    content_type: str
+    filename: str
+    encoding: str
+
+    @property
+    def encoded_size(self):
+        return self.end - self.start
+
+
+def find_image(content) -> Optional[ImagePart]:
+    """Return the first ``image/*`` part (inline or attachment), undecoded."""
+    headers, body_start = _split_headers(content, 0, len(content), _top_parser)
+    return _find_image(content, headers, body_start, len(content), 0)
+
+
+def _find_image(content, headers, start, end, depth):
+    ctype = headers.get_content_type()
+    if ctype.startswith("image/"):
+        cte = (headers.get('content-transfer-encoding') or "7bit").strip().lower()
+        filename = headers.get_filename() or "image." + ctype.split("/", 1)[1]
+        return ImagePart(content, start, end, ctype, str(filename), cte)
+    if not ctype.startswith("multipart/") or depth >= MAX_DEPTH:
+        return None
+    boundary = headers.get_param('boundary')
+    if not boundary:
+        return None
+    for part_start, part_end in _parts(content, ("--" + str(boundary)).encode(), start, end):
+        part_headers, body_start = _split_headers(content, part_start, part_end, _part_parser)
+        image = _find_image(content, part_headers, body_start, part_end, depth + 1)
+        if image is not None:
+            return image
+    return None
+
+
+def _split_headers(content, start, end, parser):
+    if content.startswith((b"\r\n", b"\n"), start, end):
+        # A part with no header block at all
+        return parser.parsebytes(b""), content.index(b"\n", start) + 1
+    m = _HEADER_END.search(content, start, end)
+    if m is None:
+        return parser.parsebytes(content[start:end]), end
+    return parser.parsebytes(content[start:m.start()]), m.end()
+
+
+def _find_text(content, headers, start, end, depth):
+    """Locate the first text/plain and text/html parts as ``(headers, start, end)``."""
+    ctype = headers.get_content_type()
+    disposition = (headers.get('content-disposition') or "").lower()
+    if disposition.startswith("attachment"):
+        return None, None
+    if ctype == "text/plain":
+        return (headers, start, end), None
+    if ctype == "text/html":
+        return None, (headers, start, end)
+    if not ctype.startswith("multipart/") or depth >= MAX_DEPTH:
+        return None, None
+    boundary = headers.get_param('boundary')
+    if not boundary:
+        return None, None
+    html = None
+    for part_start, part_end in _parts(content, ("--" + str(boundary)).encode(), start, end):
+        part_headers, body_start = _split_headers(content, part_start, part_end, _part_parser)
+        plain, part_html = _find_text(content, part_headers, body_start, part_end, depth + 1)
+        if plain is not None:
+            return plain, html
+        if html is None:
+            html = part_html
+    return None, html
+
+
+def _parts(content, delimiter, start, end):
+    """Yield ``(start, end)`` byte ranges of the parts between boundary lines."""
+    pos = _next_delimiter(content, delimiter, start, end)
+    while pos != -1:
+        after = pos + len(delimiter)
+        if content.startswith(b"--", after):
+            return
+        line_end = content.find(b"\n", after, end)
+        if line_end == -1:
+            return
+        part_start = line_end + 1
+        nxt = _next_delimiter(content, delimiter, part_start, end)
+        part_end = end if nxt == -1 else nxt
+        # The line break before a delimiter belongs to the delimiter
+        if content.endswith(b"\r\n", part_start, part_end):
+            part_end -= 2
+        elif content.endswith(b"\n", part_start, part_end):
+            part_end -= 1
+        yield part_start, part_end
+        pos = nxt
+
+
+def _next_delimiter(content, delimiter, start, end):
+    pos = content.find(delimiter, start, end)
+    while pos > 0 and content[pos - 1] not in b"\n":
+        pos = content.find(delimiter, pos + 1, end)
+    return pos
+
+
+def _decode(content, part, limit):
+    headers, start, end = part
+    cte = (headers.get('content-transfer-encoding') or "7bit").strip().lower()
+    charset = headers.get_content_charset() or "utf-8"
+    budget = limit * _BYTES_PER_CHAR.get(cte, 4)
+    raw = content[start:min(end, start + budget)]
+    if cte == "base64":
+        raw = b"".join(raw.split())
+        raw = binascii.a2b_base64(raw[:len(raw) - len(raw) % 4])
+    elif cte == "quoted-printable":
+        if start + budget < end:
+            # Don't cut an escape or soft line break in half
+            raw = raw[:raw.rfind(b"\n") + 1] or raw
+        raw = binascii.a2b_qp(raw)
+    try:
+        return raw.decode(charset, errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
@@ -1,9 +1,53 @@
 import urllib.request
 import urllib.parse
 import json
+from typing import NamedTuple, Optional
+import aiohttp
 
-def send_message(user_key, title, message, token, priority=None, sound=None, url=None, url_title=None, device=None, timeout=10):
-    endpoint = "https://api.pushover.net/1/messages.json"
+API_URL = "https://api.pushover.net/1/messages.json"
+
+# Outcomes of a send attempt
+OK = "ok"
+RETRY = "retry"          # network error or 5xx: try again later
+PERMANENT = "permanent"  # 4xx: the request itself is bad (e.g. invalid user key)
+QUOTA = "quota"          # 429: the app's monthly limit is used up until the reset
+
+
+class PushoverResponse(NamedTuple):
+    ok: bool
+    status: int
+    body: str
+    outcome: str
+    app_limit: Optional[int] = None
+    app_remaining: Optional[int] = None
+    app_reset: Optional[int] = None
+
+
+def classify(status, body):
+    """Map an API response to OK, RETRY, PERMANENT or QUOTA.
+
+    Pushover asks clients not to retry 4xx responses: they mean a
+    parameter was rejected and will be rejected again.
+    """
+    if status == 200:
+        try:
+            return OK if json.loads(body).get("status") == 1 else RETRY
+        except (ValueError, AttributeError):
+            return RETRY
+    if status == 429:
+        return QUOTA
+    if 400 <= status < 500:
+        return PERMANENT
+    return RETRY
+
+
+def _int_header(headers, name):
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def build_payload(user_key, title, message, token, priority=None, sound=None, url=None, url_title=None, device=None):
     data = {
         "token": token,
         "user": user_key,
@@ -23,8 +67,12 @@ def send_message(user_key, title, message, token, priority=None, sound=None, url
         data["url_title"] = url_title
     if device:
         data["device"] = device
+    return data
+
+def send_message(user_key, title, message, token, priority=None, sound=None, url=None, url_title=None, device=None, timeout=10):
+    data = build_payload(user_key, title, message, token, priority, sound, url, url_title, device)
     encoded = urllib.parse.urlencode(data).encode()
-    req = urllib.request.Request(endpoint, data=encoded)
+    req = urllib.request.Request(API_URL, data=encoded)
     try:
         with urllib.request.urlopen(req, timeout=timeout) as resp:
             body = resp.read().decode()
@@ -32,3 +80,71 @@ def send_message(user_key, title, message, token, priority=None, sound=None, url
             return ok, resp.status, body
     except Exception as e:
         return False, 0, str(e)
+
+class PushoverClient:
+    """Async Pushover client reusing keep-alive connections across sends.
+
+    The session is created lazily so it binds to the loop that first sends,
+    which for the SMTP server is the aiosmtpd controller loop.
+    """
+
+    def __init__(self, endpoint=API_URL, pool_size=10, timeout=10, dns_ttl=300, keepalive=60):
+        self.endpoint = endpoint
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def send(self, user_key, title, message, token, priority=None, sound=None, url=None, url_title=None, device=None):
+        """Send a notification; returns ``(ok, status, body)``."""
+        resp = await self.post(user_key, title, message, token, priority, sound, url, url_title, device)
+        return resp.ok, resp.status, resp.body
+
+    async def post(self, user_key, title, message, token, priority=None, sound=None, url=None, url_title=None, device=None,
+                   attachment=None):
+        """Send a notification and return the classified :class:`PushoverResponse`.
+
+        ``attachment`` (an ``attachments.Attachment``) is streamed from memory
+        as a multipart file field.
+        """
+        data = build_payload(user_key, title, message, token, priority, sound, url, url_title, device)
+        if attachment is not None:
+            form = aiohttp.FormData()
+            for key, value in data.items():
+                form.add_field(key, str(value))
+            form.add_field("attachment", attachment.data, filename=attachment.filename,
+                           content_type=attachment.content_type)
+            data = form
+        try:
+            async with self._get_session().post(self.endpoint, data=data) as resp:
+                body = await resp.text()
+                outcome = classify(resp.status, body)
+                headers = resp.headers
+                return PushoverResponse(
+                    outcome == OK, resp.status, body, outcome,
+                    _int_header(headers, "X-Limit-App-Limit"),
+                    _int_header(headers, "X-Limit-App-Remaining"),
+                    _int_header(headers, "X-Limit-App-Reset"),
+                )
+        except Exception as e:
+            return PushoverResponse(False, 0, str(e) or type(e).__name__, RETRY)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -1,28 +1,384 @@
 import os
 import json
 import time
+import sqlite3
+import logging
+import threading
+import zlib
+import struct
+from .logs import log_event
+from .mimeparse import ImagePart
 
-def persist_failed_send(queue_dir, envelope, directives):
-    os.makedirs(queue_dir, exist_ok=True)
-    record = {
-        "timestamp": time.time(),
-        "rcpt_tos": envelope.rcpt_tos,
-        "mail_from": envelope.mail_from,
-        "content": envelope.content.decode(errors="replace"),
-        "directives": directives,
-    }
-    with open(os.path.join(queue_dir, "queue.jsonl"), "a") as f:
-        f.write(json.dumps(record) + "\n")
-
-def replay_queue(queue_dir, send_func):
-    path = os.path.join(queue_dir, "queue.jsonl")
-    if not os.path.exists(path):
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+SPOOL_FILE = "spool.db"
+LEGACY_FILE = "queue.jsonl"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spool (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    rcpt_tos TEXT NOT NULL,
+    mail_from TEXT,
+    content BLOB,
+    directives TEXT NOT NULL,
+    title TEXT,
+    message TEXT,
+    user_key TEXT,
+    device TEXT,
+    last_error TEXT,
+    trace_id TEXT,
+    parent_span TEXT,
+    codec TEXT,
+    image BLOB
+);
+CREATE INDEX IF NOT EXISTS spool_due ON spool (next_attempt_at);
+CREATE TABLE IF NOT EXISTS replay_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL,
+    upto_id INTEGER NOT NULL,
+    checkpoint INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    rejected INTEGER NOT NULL DEFAULT 0,
+    started_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL,
+    error TEXT
+);
+"""
+
+COLUMNS = (
+    "id", "created_at", "next_attempt_at", "attempts", "rcpt_tos", "mail_from",
+    "content", "directives", "title", "message", "user_key", "device", "last_error",
+    "trace_id", "parent_span", "codec", "image",
+)
+REPLAY_COLUMNS = (
+    "id", "status", "upto_id", "checkpoint", "total", "sent", "failed", "rejected",
+    "started_at", "updated_at", "finished_at", "error",
+)
+# Columns added after the first release, created on open if missing
+ADDED_COLUMNS = (("trace_id", "TEXT"), ("parent_span", "TEXT"), ("codec", "TEXT"), ("image", "BLOB"))
+
+# Bodies shorter than this are stored as they are
+COMPRESS_MIN_BYTES = 512
+# start, end and the lengths of content type, filename and encoding
+_IMAGE_HEADER = struct.Struct("!IIHHH")
+
+
+def compress(content, codec):
+    """Return ``(codec, data)``; the codec is None when compressing did not pay off."""
+    if codec == "none" or content is None or len(content) < COMPRESS_MIN_BYTES:
+        return None, content
+    if codec == "zstd" and zstandard is not None:
+        data = zstandard.ZstdCompressor(level=3).compress(content)
+    else:
+        codec = "zlib"
+        data = zlib.compress(content, 1)
+    if len(data) >= len(content):
+        return None, content
+    return codec, data
+
+
+def decompress(data, codec):
+    if codec is None:
+        return data
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("spool record is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"unknown spool codec {codec!r}")
+
+
+def pack_image(part):
+    """Length-prefixed location of an image part within the raw message.
+
+    An empty value records that the message has no image, which replay
+    tells apart from rows written before locations were stored (NULL).
+    """
+    if part is None:
+        return b""
+    fields = [part.content_type.encode(), part.filename.encode(), part.encoding.encode()]
+    return _IMAGE_HEADER.pack(part.start, part.end, *map(len, fields)) + b"".join(fields)
+
+
+def unpack_image(data, content):
+    start, end, *lengths = _IMAGE_HEADER.unpack_from(data)
+    fields, offset = [], _IMAGE_HEADER.size
+    for length in lengths:
+        fields.append(bytes(data[offset:offset + length]).decode())
+        offset += length
+    return ImagePart(content, start, end, *fields)
+
+
+class Spool:
+    """Durable delivery spool backed by SQLite in WAL mode.
+
+    Records are leased before sending and acked (deleted) once delivered, so
+    replay only ever touches pending rows. With ``synchronous=NORMAL`` commits
+    are not fsynced individually; the WAL is synced at checkpoints, which
+    writes force at most every ``sync_interval`` seconds. The retry
+    scheduler also calls ``sync`` on that interval, and ``compact`` once
+    the retries drain.
+
+    Raw messages are stored compressed with ``compression`` ("zlib", "zstd"
+    or "none") next to the title, message, user key and image location the
+    handler already parsed, so replay only has to decompress.
+    """
+
+    def __init__(self, path, sync_interval=1.0, compression="zlib"):
+        self.path = path
+        self.sync_interval = sync_interval
+        if compression == "zstd" and zstandard is None:
+            log_event(logging.WARNING, "spool_zstd_unavailable", fallback="zlib")
+            compression = "zlib"
+        self.compression = compression
+        self._lock = threading.Lock()
+        self._last_sync = time.monotonic()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(spool)")}
+        for name, col_type in ADDED_COLUMNS:
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE spool ADD COLUMN {name} {col_type}")
+
+    def enqueue(self, rcpt_tos, mail_from, content, directives, title=None, message=None,
+                user_key=None, device=None, next_attempt_at=None, attempts=0, last_error=None,
+                trace_id=None, parent_span=None, image=False):
+        """Store a message; ``image`` is its ImagePart, None if it has none, False if not looked up."""
+        now = time.time()
+        if isinstance(content, str):
+            content = content.encode()
+        # Compress outside the lock; it is the expensive part for large bodies
+        codec, content = compress(content, self.compression)
+        image = pack_image(image) if image is not False else None
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO spool (created_at, next_attempt_at, attempts, rcpt_tos, mail_from,"
+                " content, directives, title, message, user_key, device, last_error, trace_id,"
+                " parent_span, codec, image) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (now, next_attempt_at if next_attempt_at is not None else now, attempts,
+                 json.dumps(list(rcpt_tos or [])), mail_from, content, json.dumps(directives or {}),
+                 title, message, user_key, device, last_error, trace_id, parent_span, codec, image),
+            )
+            self._maybe_sync()
+            return cur.lastrowid
+
+    def lease(self, limit=100, lease_seconds=60, now=None, ids=None):
+        """Claim up to ``limit`` due records (or the due subset of ``ids``).
+
+        Leased records are invisible to other callers until acked, nacked,
+        released or the lease expires (e.g. the process died mid-send).
+        """
+        now = time.time() if now is None else now
+        query = f"SELECT {', '.join(COLUMNS)} FROM spool WHERE next_attempt_at <= ? AND lease_until <= ?"
+        params = [now, now]
+        if ids is not None:
+            query += f" AND id IN ({', '.join('?' * len(ids))})"
+            params.extend(ids)
+            limit = len(ids)
+        query += " ORDER BY next_attempt_at LIMIT ?"
+        params.append(limit)
+        return self._claim(query, params, now + lease_seconds)
+
+    def lease_range(self, after_id, upto_id, limit=100, lease_seconds=60, now=None):
+        """Claim up to ``limit`` unleased records with ``after_id < id <= upto_id``, due or not.
+
+        Records come in id order, so the last id of a batch is a resumable
+        position for a walk over the spool.
+        """
+        now = time.time() if now is None else now
+        query = (f"SELECT {', '.join(COLUMNS)} FROM spool WHERE id > ? AND id <= ? AND lease_until <= ?"
+                 " ORDER BY id LIMIT ?")
+        return self._claim(query, (after_id, upto_id, now, limit), now + lease_seconds)
+
+    def _claim(self, query, params, lease_until):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(query, params).fetchall()
+                self._conn.executemany(
+                    "UPDATE spool SET lease_until = ? WHERE id = ?",
+                    [(lease_until, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [self._to_record(row) for row in rows]
+
+    def ack(self, record_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM spool WHERE id = ?", (record_id,))
+            self._maybe_sync()
+
+    def nack(self, record_id, next_attempt_at, error=None, attempts=None):
+        """Return a record for a later attempt, counting one more (or ``attempts``) tries."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE spool SET attempts = COALESCE(?, attempts + 1), next_attempt_at = ?,"
+                " lease_until = 0, last_error = ? WHERE id = ?",
+                (attempts, next_attempt_at, error, record_id),
+            )
+            self._maybe_sync()
+
+    def release(self, record_id):
+        with self._lock:
+            self._conn.execute("UPDATE spool SET lease_until = 0 WHERE id = ?", (record_id,))
+
+    def due_entries(self, max_attempts=None, ids=None):
+        """Return ``(id, due)`` for records (of ``ids``) still eligible for retry.
+
+        ``due`` is the later of the next attempt and the end of any lease.
+        """
+        query = "SELECT id, MAX(next_attempt_at, lease_until) FROM spool"
+        clauses, params = [], []
+        if max_attempts is not None:
+            clauses.append("attempts <= ?")
+            params.append(max_attempts)
+        if ids is not None:
+            clauses.append(f"id IN ({', '.join('?' * len(ids))})")
+            params.extend(ids)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def pending_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def last_id(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM spool").fetchone()[0]
+
+    def count_range(self, after_id, upto_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM spool WHERE id > ? AND id <= ?", (after_id, upto_id)).fetchone()[0]
+
+    def save_replay(self, job):
+        """Insert (``id`` None) or update a replay job's progress; returns its id."""
+        names = [name for name in REPLAY_COLUMNS if name != "id"]
+        values = [job[name] for name in names]
+        with self._lock:
+            if job.get("id") is None:
+                cur = self._conn.execute(
+                    f"INSERT INTO replay_jobs ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                    values)
+                job_id = cur.lastrowid
+            else:
+                self._conn.execute(
+                    f"UPDATE replay_jobs SET {', '.join(n + ' = ?' for n in names)} WHERE id = ?",
+                    values + [job["id"]])
+                job_id = job["id"]
+            self._maybe_sync()
+            return job_id
+
+    def replay_jobs(self, job_id=None, status=None, limit=20):
+        """Replay jobs as dicts, newest first."""
+        query = f"SELECT {', '.join(REPLAY_COLUMNS)} FROM replay_jobs"
+        clauses, params = [], []
+        if job_id is not None:
+            clauses.append("id = ?")
+            params.append(job_id)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(zip(REPLAY_COLUMNS, row)) for row in rows]
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def compact(self):
+        """Fold the WAL back into the database and release freed pages."""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("PRAGMA incremental_vacuum")
+            self._last_sync = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            self._conn.close()
+
+    def _maybe_sync(self):
+        if time.monotonic() - self._last_sync >= self.sync_interval:
+            self._sync()
+
+    def _sync(self):
+        self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        self._last_sync = time.monotonic()
+
+    def _to_record(self, row):
+        record = dict(zip(COLUMNS, row))
+        record["rcpt_tos"] = json.loads(record["rcpt_tos"])
+        record["directives"] = json.loads(record["directives"])
+        record["content"] = decompress(record["content"], record.pop("codec"))
+        image = record["image"]
+        if image is not None:
+            record["image"] = unpack_image(image, record["content"]) if image else None
+        else:
+            record["image"] = False  # written before image locations were stored
+        return record
+
+
+_spools = {}
+_spools_lock = threading.Lock()
+
+def open_spool(queue_dir, compression="zlib"):
+    """Return the process-wide spool for ``queue_dir``, creating it on first use."""
+    path = os.path.abspath(os.path.join(queue_dir, SPOOL_FILE))
+    with _spools_lock:
+        spool = _spools.get(path)
+        if spool is None:
+            os.makedirs(queue_dir, exist_ok=True)
+            spool = Spool(path, compression=compression)
+            _import_legacy(queue_dir, spool)
+            _spools[path] = spool
+        return spool
+
+def _import_legacy(queue_dir, spool):
+    path = os.path.join(queue_dir, LEGACY_FILE)
+    # Worker processes open the spool at the same time; only the one whose
+    # rename succeeds imports the file.
+    claimed = path + ".importing"
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
         return
-    with open(path) as f:
+    count = 0
+    with open(claimed) as f:
         for line in f:
+            if not line.strip():
+                continue
             record = json.loads(line)
-            send_func(
-                record["rcpt_tos"],
-                record["content"],
-                record["directives"]
-            )
+            spool.enqueue(record["rcpt_tos"], record.get("mail_from"), record["content"],
+                          record.get("directives"))
+            count += 1
+    os.replace(claimed, path + ".imported")
+    log_event(logging.INFO, "queue_imported", path=path, records=count)
+
+def persist_failed_send(queue_dir, envelope, directives, **fields):
+    return open_spool(queue_dir).enqueue(
+        envelope.rcpt_tos, envelope.mail_from, envelope.content, directives, **fields
+    )
@@ -0,0 +1,127 @@
+"""Queue state for the admin UI, kept in the ``QueueRecord`` table.
+
+A delivery gets a row once its first send attempt fails (or it has to
+wait for the quota), keyed by :func:`record_key`: the message id plus the
+user key and device it goes to, so each recipient of a fanned-out message
+(and each digest) has its own row. The row is updated through
+retries and replays until it ends as delivered, failed or rejected, and
+then stays as history.
+
+Updates must never slow the delivery path, so :class:`QueueRecorder`
+only merges them in memory, one entry per row. A writer thread
+upserts the merged entries in a single transaction every
+``flush_interval`` seconds.
+"""
+import logging
+import threading
+from datetime import datetime, timezone
+from .logs import log_event
+
+QUEUED = "queued"
+RETRYING = "retrying"
+DEFERRED = "deferred"  # waiting for the monthly quota to reset
+DELIVERED = "delivered"
+FAILED = "failed"
+REJECTED = "rejected"
+
+# Columns refreshed when a message's row already exists; timestamp keeps
+# the time it first entered the queue.
+UPDATED_COLUMNS = ("status", "attempts", "next_attempt_at", "last_error", "spool_id", "updated_at")
+
+
+def utc(ts):
+    """Naive UTC datetime for a Unix timestamp, as the admin models store them."""
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None) if ts is not None else None
+
+
+def record_key(msg_id, user_key, device=None):
+    """The ``QueueRecord.msg_id`` of one delivery of message ``msg_id``."""
+    key = f"{msg_id}:{user_key or ''}"
+    return f"{key}:{device}" if device else key
+
+
+class QueueRecorder:
+    """Buffers queue state changes and upserts them from a background thread.
+
+    If the database falls behind by more than ``max_pending`` rows,
+    changes for further rows are dropped and counted in ``dropped``, as
+    are the rows of a batch that could not be written.
+    """
+
+    def __init__(self, engine=None, flush_interval=1.0, max_pending=10000):
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._failing = False
+
+    def record(self, msg_id, rcpt_to, subject, status, attempts=0, next_attempt_at=None,
+               last_error=None, spool_id=None):
+        now = datetime.utcnow()
+        row = {
+            "msg_id": msg_id,
+            "timestamp": now,
+            "rcpt_to": rcpt_to or "",
+            "subject": subject or "",
+            "status": status,
+            "attempts": attempts,
+            "next_attempt_at": utc(next_attempt_at),
+            "last_error": last_error,
+            "spool_id": spool_id,
+            "updated_at": now,
+        }
+        with self._lock:
+            previous = self._pending.get(msg_id)
+            if previous is None and len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            if previous is not None:
+                row["timestamp"] = previous["timestamp"]
+            self._pending[msg_id] = row
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="queue-records", daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        with self._lock:
+            rows, self._pending = list(self._pending.values()), {}
+        if not rows:
+            return
+        try:
+            self._write(rows)
+        except Exception as e:
+            if not self._failing:
+                log_event(logging.WARNING, "queue_records_unavailable", error=str(e))
+            self._failing = True
+            self.dropped += len(rows)
+            return
+        self._failing = False
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def _write(self, rows):
+        from sqlalchemy.dialects.sqlite import insert
+        from .api.models import QueueRecord
+        if self.engine is None:
+            from .api.db import ENGINE
+            self.engine = ENGINE
+        stmt = insert(QueueRecord.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["msg_id"],
+            set_={name: stmt.excluded[name] for name in UPDATED_COLUMNS},
+        )
+        with self.engine.begin() as conn:
+            conn.execute(stmt, rows)
@@ -0,0 +1,156 @@
+import time
+import calendar
+from collections import OrderedDict
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate_per_minute, burst=None, now=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        return self.tokens
+
+    def idle_full(self, now):
+        """True once the bucket would have refilled completely."""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class BucketMap:
+    """Token buckets per key, evicting keys whose bucket has refilled.
+
+    A full bucket carries no state, so dropping it is lossless; ``max_keys``
+    is a hard cap for floods of distinct keys.
+    """
+
+    def __init__(self, rate_per_minute, burst=None, max_keys=10000):
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+
+    def get(self, key, now):
+        buckets = self.buckets
+        while buckets:
+            oldest = next(iter(buckets.values()))
+            if len(buckets) < self.max_keys and not oldest.idle_full(now):
+                break
+            buckets.popitem(last=False)
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(self.rate_per_minute, self.burst, now)
+        else:
+            buckets.move_to_end(key)
+        return bucket
+
+
+class RateLimiter:
+    """Hierarchical token-bucket limiter.
+
+    A message must find a token in the global bucket and, when enabled, in
+    the bucket of its routed user key and of its sender (peer IP and MAIL
+    FROM). Tokens are only taken once every level allows, so a noisy sender
+    cannot drain the global or recipient budget with rejected messages.
+    Limits of 0 disable a level.
+    """
+
+    def __init__(self, rate_per_minute, per_recipient=0, per_sender=0, max_keys=10000):
+        self.global_bucket = TokenBucket(rate_per_minute) if rate_per_minute > 0 else None
+        self.recipients = BucketMap(per_recipient, max_keys=max_keys) if per_recipient > 0 else None
+        self.senders = BucketMap(per_sender, max_keys=max_keys) if per_sender > 0 else None
+
+    def allow(self, user_key=None, sender=None, now=None):
+        return self.check(user_key, sender, now) is None
+
+    def check(self, user_key=None, sender=None, now=None):
+        """Take a token from every level, or return the name of the level that refused."""
+        now = time.monotonic() if now is None else now
+        levels = self._levels(user_key, sender, now)
+        for name, bucket in levels:
+            if bucket.refill(now) < 1:
+                return name
+        for _, bucket in levels:
+            bucket.tokens -= 1
+        return None
+
+    def reserve(self, user_key=None, now=None):
+        """Take a token from the global and ``user_key`` levels even if none is left yet.
+
+        Returns the seconds until the reserved token is due, 0 if it is
+        available now. Buckets go negative meanwhile, so each further
+        reservation waits behind the earlier ones.
+        """
+        now = time.monotonic() if now is None else now
+        wait = 0.0
+        for _, bucket in self._levels(user_key, None, now):
+            bucket.refill(now)
+            bucket.tokens -= 1
+            if bucket.tokens < 0:
+                wait = max(wait, -bucket.tokens / bucket.rate)
+        return wait
+
+    def _levels(self, user_key, sender, now):
+        levels = []
+        if self.global_bucket is not None:
+            levels.append(("global", self.global_bucket))
+        if self.recipients is not None and user_key is not None:
+            levels.append(("recipient", self.recipients.get(user_key, now)))
+        if self.senders is not None and sender is not None:
+            levels.append(("sender", self.senders.get(sender, now)))
+        return levels
+
+
+class QuotaGuard:
+    """Tracks Pushover's monthly message quota for the app token.
+
+    Sends are counted locally and corrected whenever the API reports the
+    remaining quota. Below ``reserve`` remaining messages only priority >= 1
+    alerts are let through, so routine noise cannot use up the last of the
+    month's budget and trigger 429s.
+    """
+
+    def __init__(self, monthly_limit=10000, reserve=100):
+        self.limit = monthly_limit
+        self.reserve = reserve
+        self.remaining = monthly_limit
+        self.reset_at = self._next_month(time.time())
+
+    def allow(self, priority=None, now=None):
+        if not self.limit:
+            return True
+        self._maybe_reset(time.time() if now is None else now)
+        if self.remaining > self.reserve:
+            return True
+        try:
+            urgent = int(priority) >= 1
+        except (TypeError, ValueError):
+            urgent = False
+        return urgent and self.remaining > 0
+
+    def record_sent(self, now=None):
+        self._maybe_reset(time.time() if now is None else now)
+        self.remaining = max(0, self.remaining - 1)
+
+    def update(self, remaining, reset_at=None):
+        """Apply the quota reported by the API (X-Limit-App-* headers)."""
+        self.remaining = remaining
+        if reset_at:
+            self.reset_at = reset_at
+
+    def _maybe_reset(self, now):
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = self._next_month(now)
+
+    @staticmethod
+    def _next_month(now):
+        t = time.gmtime(now)
+        year, month = (t.tm_year + 1, 1) if t.tm_mon == 12 else (t.tm_year, t.tm_mon + 1)
+        return calendar.timegm((year, month, 1, 0, 0, 0))
@@ -0,0 +1,316 @@
+"""Manual replay of the delivery spool.
+
+A replay run covers the rows that exist when it starts, whether they are
+still being retried or were given up on. It walks them in id order, one
+leased batch at a time:
+- Rows are sent through the handler under a token-bucket rate and an AIMD
+  concurrency limit.
+- Delivered rows are acked (deleted).
+- Rows Pushover rejects outright (4xx) are dropped too; their history
+  stays in the QueueRecord table.
+- Other failures go back to the spool with their error.
+
+After each batch the counters and the highest id done are checkpointed to
+the spool's ``replay_jobs`` table. If the process dies, the run is resumed
+from that point once the leases it held have expired. A 429 from Pushover,
+or reaching the quota reserve, ends the run early; nothing is lost, and a
+later run picks the rest up.
+
+``python -m signalhub.replay`` runs one pass to completion from the
+command line.
+"""
+import sys
+import time
+import asyncio
+import logging
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+from .delivery import AdaptiveConcurrency
+from .logs import log_event
+from .pushover import PERMANENT, QUOTA, RETRY
+from .queuestate import DELIVERED, FAILED as RECORD_FAILED, REJECTED
+from .ratelimit import TokenBucket
+
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+QUOTA_EXHAUSTED = "quota"
+FAILED = "failed"
+
+
+@dataclass
+class ReplayJob:
+    upto_id: int
+    total: int
+    id: Optional[int] = None
+    status: str = RUNNING
+    checkpoint: int = 0  # every row up to this id has been handled
+    sent: int = 0
+    failed: int = 0
+    rejected: int = 0
+    started_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+    def progress(self):
+        """The job as plain data, with derived remaining count and send rate."""
+        data = asdict(self)
+        done = self.sent + self.failed + self.rejected
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        data["remaining"] = max(0, self.total - done)
+        data["per_second"] = round(done / elapsed, 1) if elapsed > 0 else 0.0
+        return data
+
+
+class ReplayEngine:
+    """Runs at most one replay job at a time as a background task.
+
+    ``job_from_record`` turns a spool record into a DeliveryJob, and
+    ``send`` posts a DeliveryJob once and returns the PushoverResponse.
+    ``track(delivery_job, status, next_attempt_at=None, error=None)``, if
+    given, records each outcome for the Queue page. The handler provides
+    all three.
+    """
+
+    def __init__(self, spool, job_from_record, send, concurrency=8, rate_per_minute=1800,
+                 batch_size=200, lease_seconds=60, retry_delay=300, quota_reserve=0, track=None):
+        self.spool = spool
+        self.job_from_record = job_from_record
+        self.send = send
+        self.track = track
+        self.concurrency = AdaptiveConcurrency(concurrency)
+        self.bucket = TokenBucket(rate_per_minute, burst=concurrency) if rate_per_minute > 0 else None
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self.quota_reserve = quota_reserve
+        self.job: Optional[ReplayJob] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> ReplayJob:
+        """Start a run over everything spooled now, or return the run in progress."""
+        if self.running():
+            return self.job
+        upto = self.spool.last_id()
+        job = ReplayJob(upto_id=upto, total=self.spool.count_range(0, upto))
+        job.id = self.spool.save_replay(asdict(job))
+        log_event(logging.INFO, "replay_started", job_id=job.id, total=job.total)
+        return self._launch(job)
+
+    def resume(self) -> Optional[ReplayJob]:
+        """Continue the newest run left ``running`` by a previous process, if any."""
+        if self.running():
+            return self.job
+        rows = self.spool.replay_jobs(status=RUNNING)
+        if not rows:
+            return None
+        for stale in rows[1:]:
+            self.spool.save_replay({**stale, "status": CANCELLED, "error": "superseded"})
+        job = ReplayJob(**rows[0])
+        # Rows the dead process had leased are skipped until their lease expires
+        delay = max(0.0, job.updated_at + self.lease_seconds - time.time())
+        log_event(logging.INFO, "replay_resumed", job_id=job.id, checkpoint=job.checkpoint, delay=round(delay, 1))
+        return self._launch(job, delay)
+
+    def cancel(self):
+        """Stop the running job for good; returns it, or None if none was running."""
+        if not self.running():
+            return None
+        self.job.status = CANCELLED
+        self._task.cancel()
+        return self.job
+
+    async def stop(self):
+        """Interrupt the running job at shutdown, leaving it to ``resume``."""
+        if self.running():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def wait(self):
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+        return self.job
+
+    def progress(self, job_id=None):
+        """Progress of ``job_id`` (default: the latest job), or None if unknown."""
+        if self.job is not None and job_id in (None, self.job.id):
+            return self.job.progress()
+        rows = self.spool.replay_jobs(job_id=job_id, limit=1)
+        return ReplayJob(**rows[0]).progress() if rows else None
+
+    def _launch(self, job, delay=0.0):
+        self.job = job
+        self._task = asyncio.get_running_loop().create_task(self._run(job, delay))
+        return job
+
+    async def _run(self, job, delay):
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            while job.status == RUNNING:
+                batch = await asyncio.to_thread(
+                    self.spool.lease_range, job.checkpoint, job.upto_id, self.batch_size, self.lease_seconds)
+                if not batch:
+                    job.status = DONE
+                    break
+                if await self._send_batch(job, batch):
+                    job.checkpoint = batch[-1]["id"]
+                await asyncio.to_thread(self._checkpoint, job)
+        except asyncio.CancelledError:
+            # cancel() marked the job cancelled; otherwise it stays running
+            # and is resumed by the next process.
+            self._finish(job)
+            raise
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            log_event(logging.ERROR, "replay_error", job_id=job.id, exc_info=True)
+        self._finish(job)
+
+    async def _send_batch(self, job, batch):
+        """Send one leased batch; True if every record in it was handled."""
+        tasks = []
+        try:
+            for record in batch:
+                if job.status != RUNNING:
+                    break
+                await self._take_token()
+                await self.concurrency.acquire()
+                if job.status != RUNNING:
+                    self.concurrency.release()
+                    break
+                tasks.append(asyncio.create_task(self._replay(job, record)))
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        # Hand back what was never sent, e.g. after a 429
+        for record in batch[len(tasks):]:
+            await asyncio.to_thread(self.spool.release, record["id"])
+        return len(tasks) == len(batch)
+
+    async def _replay(self, job, record):
+        try:
+            await self._replay_one(job, record)
+        finally:
+            self.concurrency.release()
+
+    async def _replay_one(self, job, record):
+        resp, error, delivery = None, None, None
+        started = time.perf_counter()
+        try:
+            delivery = self.job_from_record(record)
+            resp = await self.send(delivery)
+        except Exception as e:  # one broken record must not end the run
+            error = str(e)
+        if resp is not None:
+            self.concurrency.record(time.perf_counter() - started, congested=resp.outcome in (RETRY, QUOTA))
+        if resp is not None and resp.ok:
+            await asyncio.to_thread(self.spool.ack, record["id"])
+            job.sent += 1
+            if self.track and delivery is not None:
+                self.track(delivery, DELIVERED)
+            if resp.app_remaining is not None and resp.app_remaining <= self.quota_reserve:
+                self._stop_for_quota(job, f"{resp.app_remaining} messages left this month")
+            return
+        if resp is not None and resp.outcome == QUOTA:
+            await asyncio.to_thread(self.spool.release, record["id"])
+            self._stop_for_quota(job, "Pushover quota exhausted")
+            return
+        if resp is not None:
+            error = str(resp.body)
+        track = self.track if delivery is not None else None
+        if track:
+            delivery.attempts = record["attempts"] + 1
+        if resp is not None and resp.outcome == PERMANENT:
+            # Sending it again cannot succeed; drop it from the spool so no
+            # later replay repeats it. Its history stays in QueueRecord.
+            job.rejected += 1
+            await asyncio.to_thread(self.spool.ack, record["id"])
+            if track:
+                track(delivery, REJECTED, error=error)
+        else:
+            job.failed += 1
+            due = time.time() + self.retry_delay
+            await asyncio.to_thread(self.spool.nack, record["id"], due, error)
+            if track:
+                track(delivery, RECORD_FAILED, due, error)
+        log_event(logging.INFO, "replay_send_failed", job_id=job.id, record_id=record["id"],
+                  status=resp.status if resp is not None else 0, error=error)
+
+    def _stop_for_quota(self, job, reason):
+        if job.status == RUNNING:
+            job.status = QUOTA_EXHAUSTED
+            job.error = reason
+
+    async def _take_token(self):
+        bucket = self.bucket
+        if bucket is None:
+            return
+        while bucket.refill(time.monotonic()) < 1:
+            await asyncio.sleep((1 - bucket.tokens) / bucket.rate)
+        bucket.tokens -= 1
+
+    def _checkpoint(self, job):
+        job.updated_at = time.time()
+        self.spool.save_replay(asdict(job))
+
+    def _finish(self, job):
+        if job.status != RUNNING and job.finished_at is None:
+            job.finished_at = time.time()
+            log_event(logging.INFO, "replay_finished", job_id=job.id, status=job.status,
+                      sent=job.sent, failed=job.failed, rejected=job.rejected)
+        self._checkpoint(job)
+
+
+def engine_for(handler):
+    """A ReplayEngine that sends through ``handler`` with its configured limits."""
+    config = handler.config
+    return ReplayEngine(
+        handler.spool,
+        handler._job_from_record,
+        handler.push,
+        concurrency=config.replay_concurrency,
+        rate_per_minute=config.replay_rate_per_minute,
+        batch_size=config.replay_batch_size,
+        retry_delay=config.retry_delay,
+        quota_reserve=config.pushover_quota_reserve,
+        track=handler._track,
+    )
+
+
+def main():
+    """Replay the whole spool once and print the final progress."""
+    from .config import load_config
+    from .handler import Handler
+    from .logs import dumps, setup_logging
+    from .routing import load_mappings
+    from .templating import load_templates
+
+    config = load_config()
+    setup_logging(config)
+    if not config.queue_dir:
+        sys.exit("QUEUE_DIR is not set")
+
+    async def run():
+        handler = Handler(config, mappings=load_mappings(), templates=load_templates())
+        engine = engine_for(handler)
+        try:
+            engine.resume() or engine.start()
+            return await engine.wait()
+        finally:
+            await engine.stop()
+            await handler.stop()
+
+    job = asyncio.run(run())
+    print(dumps(job.progress()))
+    sys.exit(0 if job.status in (DONE, QUOTA_EXHAUSTED) else 1)
+
+
+if __name__ == "__main__":
+    main()
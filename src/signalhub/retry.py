@@ -0,0 +1,177 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from .logs import log_event
+
+MAX_BACKOFF = 3600
+
+
+def backoff_delay(attempt, base, cap=MAX_BACKOFF, rand=random.random):
+    """Exponential backoff with equal jitter for the ``attempt``-th retry."""
+    delay = min(cap, base * 2 ** max(0, attempt - 1))
+    return delay / 2 + rand() * delay / 2
+
+
+class RetryScheduler:
+    """Re-submits failed deliveries when their backoff expires.
+
+    Pending retries sit in a min-heap keyed by due time, so scheduling and
+    popping cost O(log n) and the loop sleeps until the earliest one is due
+    instead of rescanning the spool. Entries are spool record ids when a
+    spool is configured (the record holds the payload) or the job itself
+    otherwise. Spool reads and writes run in worker threads, so waiting on
+    another process's write lock never stalls the event loop.
+
+    With a spool, a second task checkpoints its WAL every
+    ``spool.sync_interval`` seconds, so the last writes before an idle
+    period are synced too. It compacts the spool once no retries are left
+    (after starting, and whenever they drain) and at least every
+    ``compact_interval`` seconds.
+    """
+
+    def __init__(self, resubmit, spool=None, job_from_record=None, saturated=None, batch=100,
+                 compact_interval=3600):
+        self.resubmit = resubmit
+        self.spool = spool
+        self.job_from_record = job_from_record
+        self.saturated = saturated or (lambda: False)
+        self.batch = batch
+        self.compact_interval = compact_interval
+        self._heap = []
+        self._seq = itertools.count()
+        self._wake = None
+        self._task = None
+        self._maintenance = None
+        self._max_attempts = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def start(self, max_attempts=None):
+        if self._task:
+            return
+        self._wake = asyncio.Event()
+        self._max_attempts = max_attempts
+        if self.spool is not None:
+            for record_id, due in self.spool.due_entries(max_attempts):
+                self._push(due, record_id)
+        loop = asyncio.get_running_loop()
+        self._task = loop.create_task(self._run())
+        if self.spool is not None:
+            self._maintenance = loop.create_task(self._maintain())
+
+    async def stop(self):
+        tasks = [task for task in (self._task, self._maintenance) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = self._maintenance = None
+
+    async def schedule(self, job, due, error=None):
+        if self.spool is None:
+            self._push(due, job)
+            return
+        await asyncio.to_thread(self.persist, job, due, error)
+        self._push(due, job.spool_id)
+
+    def persist(self, job, due, error=None):
+        """Write ``job`` to the spool without scheduling it in this process."""
+        if job.spool_id is None:
+            job.spool_id = self.spool.enqueue(
+                job.envelope.rcpt_tos if job.envelope is not None else [job.rcpt_to],
+                job.envelope.mail_from if job.envelope is not None else None,
+                job.envelope.content if job.envelope is not None else None,
+                job.directives,
+                title=job.title,
+                message=job.message,
+                user_key=job.user_key,
+                device=job.device,
+                next_attempt_at=due,
+                attempts=job.attempts,
+                last_error=error,
+                trace_id=job.trace_id,
+                parent_span=job.parent_span,
+                image=job.attachment,
+            )
+        else:
+            self.spool.nack(job.spool_id, due, error, attempts=job.attempts)
+        return job.spool_id
+
+    def _push(self, due, entry):
+        seq = next(self._seq)
+        heapq.heappush(self._heap, (due, seq, entry))
+        if self._wake is not None and self._heap[0][1] == seq:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            timeout = None
+            if self._heap:
+                timeout = self._heap[0][0] - time.time()
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if self.saturated():
+                await asyncio.sleep(1)
+                continue
+            try:
+                await self._fire_due()
+            except Exception:
+                log_event(logging.ERROR, "retry_scheduler_error", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def _maintain(self):
+        last_compact = time.monotonic()
+        had_retries = True  # compact once the spool resumed at start is idle
+        while True:
+            await asyncio.sleep(self.spool.sync_interval)
+            drained = had_retries and not self._heap
+            had_retries = bool(self._heap)
+            try:
+                if drained or time.monotonic() - last_compact >= self.compact_interval:
+                    await asyncio.to_thread(self.spool.compact)
+                    last_compact = time.monotonic()
+                else:
+                    await asyncio.to_thread(self.spool.sync)
+            except Exception:
+                log_event(logging.ERROR, "spool_maintenance_error", exc_info=True)
+
+    async def _fire_due(self):
+        now = time.time()
+        ids = []
+        while self._heap and self._heap[0][0] <= now and len(ids) < self.batch:
+            _, _, entry = heapq.heappop(self._heap)
+            if isinstance(entry, int):
+                ids.append(entry)
+            else:
+                await self._resubmit(entry)
+        if ids:
+            leased = set()
+            records = await asyncio.to_thread(self.spool.lease, ids=ids, now=now, lease_seconds=300)
+            for record in records:
+                leased.add(record["id"])
+                await self._resubmit(self.job_from_record(record))
+            # Rows leased or rescheduled elsewhere (e.g. by a manual replay)
+            # come back when their lease or new due time is up; acked rows
+            # and rows past max_attempts are gone from the schedule.
+            missing = [id_ for id_ in ids if id_ not in leased]
+            if missing:
+                entries = await asyncio.to_thread(self.spool.due_entries, self._max_attempts, ids=missing)
+                for record_id, due in entries:
+                    self._push(max(due, now + 1), record_id)
+
+    async def _resubmit(self, job):
+        if not self.resubmit(job):
+            log_event(logging.INFO, "retry_deferred", rcpt_to=job.rcpt_to)
+            if job.spool_id is None:
+                self._push(time.time() + 1, job)
+            else:
+                await asyncio.to_thread(self.spool.release, job.spool_id)
+                self._push(time.time() + 1, job.spool_id)
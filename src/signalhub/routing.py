@@ -0,0 +1,226 @@
+import re
+import asyncio
+import fnmatch
+import logging
+from typing import NamedTuple, Optional
+from .logs import log_event
+
+_END = object()
+# Group numbers shift once a regex is wrapped into the combined alternation
+_NUMERIC_BACKREF = re.compile(r'\\[1-9]')
+
+
+class Route(NamedTuple):
+    user_key: str
+    device: Optional[str] = None
+    template_id: Optional[int] = None
+
+
+class _Trie:
+    """Character trie returning the value of the longest stored prefix."""
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, key, value):
+        node = self.root
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node[_END] = value
+
+    def longest(self, text):
+        node = self.root
+        found = node.get(_END)
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            found = node.get(_END, found)
+        return found
+
+
+class Router:
+    """Recipient routing index compiled once from recipient_map and Mappings.
+
+    Pattern forms, in order of precedence:
+
+    * ``alerts@home.local`` -- exact address, one dict lookup
+    * ``unifi-*`` / ``*@home.local`` -- single leading or trailing ``*``,
+      longest match wins via a prefix or (reversed) suffix trie
+    * other globs and ``re:<regex>`` -- combined into one alternation that
+      must match the whole address, first defined rule wins; a regex that
+      cannot be embedded (inline global flags, numeric backreferences) is
+      matched on its own at its place in that order
+
+    Several rules with the same pattern fan out to all their routes.
+    Matching is case-insensitive. ``match`` also names the rule that
+    matched (its pattern, or ``default``) for use as a metrics label.
+    """
+
+    def __init__(self, rules=(), default=None):
+        self.default = ("default", (default,) if default else ())
+        self.exact = {}
+        self.prefixes = _Trie()
+        self.suffixes = _Trie()
+        self._has_prefix = self._has_suffix = False
+        self.patterns = []
+        grouped = {}
+        for pattern, route in rules:
+            grouped.setdefault(pattern.strip(), []).append(route)
+        for pattern, routes in grouped.items():
+            # Rules with an empty user key fall back to the default route
+            self._add(pattern, (pattern, tuple(r for r in routes if r.user_key)))
+        # (compiled, pattern indexes) tried in order
+        self.segments = []
+        run = []
+        for n, (regex, _) in enumerate(self.patterns):
+            if _combinable(regex):
+                run.append(n)
+                continue
+            self._add_segment(run)
+            self._add_segment([n])
+            run = []
+        self._add_segment(run)
+
+    def _add_segment(self, indexes):
+        if len(indexes) == 1:
+            self.segments.append((re.compile(self.patterns[indexes[0]][0], re.IGNORECASE), indexes))
+        elif indexes:
+            try:
+                combined = re.compile(
+                    "|".join(f"(?P<r{n}>{self.patterns[n][0]})" for n in indexes), re.IGNORECASE)
+            except re.error:
+                # e.g. a user group named like one of the wrappers
+                for n in indexes:
+                    self._add_segment([n])
+                return
+            self.segments.append((combined, indexes))
+
+    @classmethod
+    def from_config(cls, config, mappings=()):
+        rules = []
+        for pattern, value in config.recipient_map.items():
+            keys = value if isinstance(value, (list, tuple)) else [value]
+            rules.extend((pattern, Route(key, None)) for key in keys)
+        for m in mappings:
+            rules.append((m.rcpt_pattern, Route(m.user_key, m.device, getattr(m, "template_id", None))))
+        return cls(rules, Route(config.default_user_key, config.pushover_device))
+
+    def _add(self, pattern, routes):
+        if pattern.startswith("re:"):
+            regex = pattern[3:]
+        elif "*" not in pattern and "?" not in pattern and "[" not in pattern:
+            self.exact[pattern.lower()] = routes
+            return
+        elif pattern != "*" and pattern.count("*") == 1 and pattern.endswith("*") and "?" not in pattern and "[" not in pattern:
+            self.prefixes.add(pattern[:-1].lower(), routes)
+            self._has_prefix = True
+            return
+        elif pattern.count("*") == 1 and pattern.startswith("*") and "?" not in pattern and "[" not in pattern:
+            self.suffixes.add(pattern[:0:-1].lower(), routes)
+            self._has_suffix = True
+            return
+        else:
+            regex = fnmatch.translate(pattern)
+        try:
+            re.compile(regex, re.IGNORECASE)
+        except re.error as e:
+            log_event(logging.WARNING, "bad_route_pattern", pattern=pattern, error=str(e))
+            return
+        self.patterns.append((regex, routes))
+
+    def route(self, rcpt_to):
+        """Return the routes for ``rcpt_to``, falling back to the default."""
+        return self.match(rcpt_to)[1]
+
+    def match(self, rcpt_to):
+        """Return ``(rule, routes)`` for ``rcpt_to``."""
+        if not rcpt_to:
+            return self.default
+        addr = rcpt_to.lower()
+        found = self.exact.get(addr)
+        if found is None and self._has_prefix:
+            found = self.prefixes.longest(addr)
+        if found is None and self._has_suffix:
+            found = self.suffixes.longest(addr[::-1])
+        if found is None:
+            for compiled, indexes in self.segments:
+                m = compiled.fullmatch(addr)
+                if m:
+                    # lastgroup is the outermost group that matched, i.e. r<n>
+                    n = indexes[0] if len(indexes) == 1 else int(m.lastgroup[1:])
+                    found = self.patterns[n][1]
+                    break
+        if found is None or not found[1]:
+            return self.default
+        return found
+
+
+def load_mappings():
+    """Read Mapping rows from the admin database, oldest first."""
+    try:
+        return _read_mappings()
+    except Exception as e:
+        log_event(logging.WARNING, "mappings_unavailable", error=str(e))
+        return []
+
+
+def _read_mappings():
+    from sqlmodel import select
+    from .api.db import get_session
+    from .api.models import Mapping
+    with get_session() as s:
+        return list(s.exec(select(Mapping).order_by(Mapping.id)))
+
+
+def _signature(mappings):
+    return tuple((getattr(m, "id", None), m.rcpt_pattern, m.user_key, m.device, getattr(m, "template_id", None))
+                 for m in mappings)
+
+
+class MappingWatcher:
+    """Polls the Mapping table and rebuilds the Router off the loop when it changes.
+
+    ``current_config()`` returns the config to build against, and
+    ``on_change(mappings, router, config)`` receives the result, for the
+    caller to swap in on its own loop. ``mappings`` are the rows the
+    current router was built from.
+    """
+
+    def __init__(self, current_config, on_change, interval=5.0, mappings=()):
+        self.current_config = current_config
+        self.on_change = on_change
+        self.interval = interval
+        self._signature = _signature(mappings)
+
+    def poll(self):
+        try:
+            mappings = _read_mappings()
+        except Exception as e:
+            log_event(logging.WARNING, "mappings_unavailable", error=str(e))
+            return False
+        signature = _signature(mappings)
+        if signature == self._signature:
+            return False
+        config = self.current_config()
+        self.on_change(mappings, Router.from_config(config, mappings), config)
+        self._signature = signature
+        return True
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if await loop.run_in_executor(None, self.poll):
+                log_event(logging.INFO, "mappings_reloaded")
+            await asyncio.sleep(self.interval)
+
+
+def _combinable(regex):
+    """True if ``regex`` keeps its meaning inside a ``(?P<rN>...)`` alternation."""
+    if _NUMERIC_BACKREF.search(regex):
+        return False
+    try:
+        re.compile(f"(?P<r0>{regex})")
+    except re.error:
+        return False
+    return True
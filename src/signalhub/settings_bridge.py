@@ -1,136 +1,212 @@
 """
 Settings bridge for original signalhub code to read from database
+
+Settings are read with one bulk query into an immutable snapshot that is
+swapped atomically when the ``Setting.updated_at`` watermark changes, so
+lookups never open a database session.
 """
 import os
+import asyncio
 import logging
-from typing import Optional, Dict, Any
-from sqlmodel import Session, create_engine
-from .api.settings_service import SettingsService
+import threading
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Callable, List
+from sqlalchemy import func
+from sqlmodel import Session, select
+from .api.db import ENGINE as engine
 from .api.models import Setting
+from .logs import log_event
+
+# Map common setting keys to database settings
+SETTING_MAP = {
+    'SMTP_HOST': 'smtp.host',
+    'SMTP_PORT': 'smtp.port',
+    'SMTP_USERNAME': 'smtp.username',
+    'SMTP_PASSWORD': 'smtp.password',
+    'SMTP_USE_TLS': 'smtp.use_tls',
+    'SMTP_USE_SSL': 'smtp.use_ssl',
+    'PUSHOVER_TOKEN': 'pushover.api_token',
+    'PUSHOVER_USER_KEY': 'pushover.default_user_key',
+    'PUSHOVER_DEVICE': 'pushover.default_device',
+    'QUEUE_DIR': 'app.queue_dir',
+    'MAX_RETRIES': 'app.max_retries',
+    'RETRY_DELAY': 'app.retry_delay',
+}
+
+
+class SettingsSnapshot:
+    """Immutable, already-decrypted view of the Setting table."""
+
+    __slots__ = ('values', 'watermark')
+
+    def __init__(self, values: Dict[str, str], watermark=None):
+        self.values = MappingProxyType(dict(values))
+        self.watermark = watermark
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        return self.values.get(key, default)
+
+
+_snapshot: Optional[SettingsSnapshot] = None
+_lock = threading.Lock()
+_listeners: List[Callable[[SettingsSnapshot], None]] = []
+
+def _read_watermark(session):
+    return tuple(session.exec(select(func.max(Setting.updated_at), func.count(Setting.key))).one())
+
+def load_snapshot() -> SettingsSnapshot:
+    """Read every setting with one query and decrypt encrypted values once."""
+    from .api.settings_crypto import decrypt_value
+    values = {}
+    with Session(engine) as session:
+        watermark = _read_watermark(session)
+        for setting in session.exec(select(Setting)):
+            value = setting.value
+            if setting.is_encrypted:
+                try:
+                    value = decrypt_value(value)
+                except Exception as e:
+                    logging.warning(f"Failed to decrypt setting {setting.key}: {e}")
+                    continue
+            values[setting.key] = value
+    return SettingsSnapshot(values, watermark)
+
+def current_settings() -> SettingsSnapshot:
+    """Return the active snapshot, loading it on first use."""
+    snapshot = _snapshot
+    if snapshot is None:
+        refresh_settings()
+        snapshot = _snapshot
+    return snapshot
+
+def refresh_settings(force: bool = False) -> bool:
+    """Reload the snapshot if the watermark moved; returns True when swapped."""
+    global _snapshot
+    with _lock:
+        try:
+            if not force and _snapshot is not None:
+                with Session(engine) as session:
+                    if _read_watermark(session) == _snapshot.watermark:
+                        return False
+            snapshot = load_snapshot()
+        except Exception as e:
+            logging.warning(f"Failed to read settings from database: {e}")
+            if _snapshot is None:
+                _snapshot = SettingsSnapshot({})
+            return False
+        _snapshot = snapshot
+    for listener in list(_listeners):
+        try:
+            listener(snapshot)
+        except Exception:
+            logging.exception("Settings listener failed")
+    return True
+
+def subscribe(listener: Callable[[SettingsSnapshot], None]):
+    """Call ``listener`` with each new snapshot after it is swapped in."""
+    _listeners.append(listener)
 
-# Database connection (same as API)
-DATABASE_URL = "sqlite:///./signalhub.db"
-engine = create_engine(DATABASE_URL)
+class SettingsWatcher:
+    """Polls the settings watermark off the event loop and swaps snapshots."""
+
+    def __init__(self, interval: float = 5.0):
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            if await loop.run_in_executor(None, refresh_settings):
+                log_event(logging.INFO, "settings_reloaded")
 
 def get_db_settings() -> Dict[str, Any]:
     """Get all settings from database for use by original signalhub code"""
-    try:
-        with Session(engine) as session:
-            service = SettingsService(session)
-            
-            # Get all settings
-            smtp_settings = service.get_smtp_settings()
-            pushover_settings = service.get_pushover_settings()
-            app_settings = service.get_app_settings()
-            
-            return {
-                # SMTP settings
-                'smtp_host': smtp_settings.host,
-                'smtp_port': smtp_settings.port,
-                'smtp_username': smtp_settings.username,
-                'smtp_password': smtp_settings.password,
-                'smtp_use_tls': smtp_settings.use_tls,
-                'smtp_use_ssl': smtp_settings.use_ssl,
-                
-                # Pushover settings
-                'pushover_token': pushover_settings.api_token if pushover_settings else None,
-                'pushover_user': pushover_settings.default_user_key if pushover_settings else None,
-                'pushover_device': pushover_settings.default_device if pushover_settings else None,
-                
-                # App settings
-                'queue_dir': app_settings.queue_dir,
-                'max_retries': app_settings.max_retries,
-                'retry_delay': app_settings.retry_delay,
-            }
-    except Exception as e:
-        logging.warning(f"Failed to read settings from database: {e}")
+    snapshot = current_settings()
+    if not snapshot.values:
         return {}
+    smtp = get_smtp_config()
+    pushover = get_pushover_config()
+    return {
+        # SMTP settings
+        'smtp_host': smtp['host'],
+        'smtp_port': smtp['port'],
+        'smtp_username': smtp['username'],
+        'smtp_password': smtp['password'],
+        'smtp_use_tls': smtp['use_tls'],
+        'smtp_use_ssl': smtp['use_ssl'],
+
+        # Pushover settings
+        'pushover_token': pushover['token'],
+        'pushover_user': pushover['user'],
+        'pushover_device': pushover['device'],
+
+        # App settings
+        'queue_dir': snapshot.get('app.queue_dir', './queue'),
+        'max_retries': int(snapshot.get('app.max_retries', '3')),
+        'retry_delay': int(snapshot.get('app.retry_delay', '300')),
+    }
 
 def get_setting(key: str, default: Optional[str] = None) -> Optional[str]:
     """Get a single setting, fallback to environment variable, then default"""
-    try:
-        with Session(engine) as session:
-            service = SettingsService(session)
-            
-            # Map common setting keys to database settings
-            setting_map = {
-                'SMTP_HOST': 'smtp.host',
-                'SMTP_PORT': 'smtp.port', 
-                'SMTP_USERNAME': 'smtp.username',
-                'SMTP_PASSWORD': 'smtp.password',
-                'SMTP_USE_TLS': 'smtp.use_tls',
-                'SMTP_USE_SSL': 'smtp.use_ssl',
-                'PUSHOVER_TOKEN': 'pushover.api_token',
-                'PUSHOVER_USER_KEY': 'pushover.default_user_key',
-                'PUSHOVER_DEVICE': 'pushover.default_device',
-                'QUEUE_DIR': 'app.queue_dir',
-                'MAX_RETRIES': 'app.max_retries',
-                'RETRY_DELAY': 'app.retry_delay',
-            }
-            
-            db_key = setting_map.get(key)
-            if db_key:
-                from .api.settings_crypto import get_setting as db_get_setting
-                value = db_get_setting(session, db_key)
-                if value is not None:
-                    return value
-            
-    except Exception as e:
-        logging.debug(f"Failed to get setting {key} from database: {e}")
-    
+    db_key = SETTING_MAP.get(key)
+    if db_key:
+        value = current_settings().get(db_key)
+        if value is not None:
+            return value
+
     # Fallback to environment variable
     env_value = os.getenv(key)
     if env_value is not None:
         return env_value
-    
+
     return default
 
 def get_smtp_config() -> Dict[str, Any]:
     """Get SMTP configuration for email sending"""
-    try:
-        with Session(engine) as session:
-            service = SettingsService(session)
-            settings = service.get_smtp_settings()
-            
-            return {
-                'host': settings.host,
-                'port': settings.port,
-                'username': settings.username,
-                'password': settings.password,
-                'use_tls': settings.use_tls,
-                'use_ssl': settings.use_ssl,
-            }
-    except Exception as e:
-        logging.warning(f"Failed to get SMTP config from database: {e}")
-        # Fallback to environment variables
+    snapshot = current_settings()
+    if snapshot.values:
         return {
-            'host': os.getenv('SMTP_HOST', 'localhost'),
-            'port': int(os.getenv('SMTP_PORT', '587')),
-            'username': os.getenv('SMTP_USERNAME'),
-            'password': os.getenv('SMTP_PASSWORD'),
-            'use_tls': os.getenv('SMTP_USE_TLS', 'true').lower() == 'true',
-            'use_ssl': os.getenv('SMTP_USE_SSL', 'false').lower() == 'true',
+            'host': snapshot.get('smtp.host', 'localhost'),
+            'port': int(snapshot.get('smtp.port', '587')),
+            'username': snapshot.get('smtp.username'),
+            'password': snapshot.get('smtp.password'),
+            'use_tls': snapshot.get('smtp.use_tls', 'true').lower() == 'true',
+            'use_ssl': snapshot.get('smtp.use_ssl', 'false').lower() == 'true',
         }
+    # Fallback to environment variables
+    return {
+        'host': os.getenv('SMTP_HOST', 'localhost'),
+        'port': int(os.getenv('SMTP_PORT', '587')),
+        'username': os.getenv('SMTP_USERNAME'),
+        'password': os.getenv('SMTP_PASSWORD'),
+        'use_tls': os.getenv('SMTP_USE_TLS', 'true').lower() == 'true',
+        'use_ssl': os.getenv('SMTP_USE_SSL', 'false').lower() == 'true',
+    }
 
 def get_pushover_config() -> Dict[str, Any]:
     """Get Pushover configuration for notifications"""
-    try:
-        with Session(engine) as session:
-            service = SettingsService(session)
-            settings = service.get_pushover_settings()
-            
-            if settings:
-                return {
-                    'token': settings.api_token,
-                    'user': settings.default_user_key,
-                    'device': settings.default_device,
-                }
-    except Exception as e:
-        logging.warning(f"Failed to get Pushover config from database: {e}")
-    
+    snapshot = current_settings()
+    token = snapshot.get('pushover.api_token')
+    if token:
+        return {
+            'token': token,
+            'user': snapshot.get('pushover.default_user_key'),
+            'device': snapshot.get('pushover.default_device'),
+        }
+
     # Fallback to environment variables
     return {
         'token': os.getenv('PUSHOVER_TOKEN'),
         'user': os.getenv('PUSHOVER_USER_KEY'),
         'device': os.getenv('PUSHOVER_DEVICE'),
-    }
\ No newline at end of file
+    }
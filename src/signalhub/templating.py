@@ -0,0 +1,149 @@
+"""Compiled notification templates.
+
+Template content uses ``{{name}}`` placeholders (the variables offered by
+the admin UI: sender, recipient, subject, body, timestamp, plus the
+subject directives prio, sound, url and urltitle). Each template is
+compiled once into a ``str.format_map`` call and cached by id and
+``updated_at``, so rendering a message is a single C-level format even
+with hundreds of templates; recompiling happens on a watcher thread.
+"""
+import re
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, NamedTuple, Optional
+from .logs import log_event
+
+_PLACEHOLDER_RE = re.compile(r'\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}')
+
+
+class Fields(dict):
+    """Render context; unknown placeholders render as empty strings."""
+
+    def __missing__(self, key):
+        return ""
+
+
+def compile_template(source: str) -> Callable[[Fields], str]:
+    """Compile ``source`` into a function taking :class:`Fields`."""
+    pieces = []
+    pos = 0
+    for m in _PLACEHOLDER_RE.finditer(source):
+        pieces.append(source[pos:m.start()].replace("{", "{{").replace("}", "}}"))
+        pieces.append("{" + m.group(1) + "}")
+        pos = m.end()
+    if not pieces:
+        return lambda fields: source
+    pieces.append(source[pos:].replace("{", "{{").replace("}", "}}"))
+    return "".join(pieces).format_map
+
+
+class CompiledTemplate(NamedTuple):
+    version: object
+    title: Optional[Callable[[Fields], str]]
+    message: Callable[[Fields], str]
+
+
+def message_fields(mail_from, rcpt_to, subject, body, directives) -> Fields:
+    fields = Fields(directives)
+    fields.update(
+        sender=mail_from or "",
+        recipient=rcpt_to or "",
+        subject=subject,
+        body=body,
+        timestamp=time.strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    return fields
+
+
+class TemplateCache:
+    """Compiled templates by id; ``refresh`` only recompiles changed rows."""
+
+    def __init__(self, templates=()):
+        self._compiled: Dict[int, CompiledTemplate] = {}
+        self.refresh(templates)
+
+    def refresh(self, templates):
+        """Recompile templates whose ``updated_at`` moved and drop deleted ones."""
+        old = self._compiled
+        compiled = {}
+        for t in templates:
+            version = getattr(t, "updated_at", None)
+            current = old.get(t.id)
+            if current is None or current.version != version:
+                title = getattr(t, "title", None)
+                current = CompiledTemplate(
+                    version,
+                    compile_template(title) if title else None,
+                    compile_template(t.content),
+                )
+            compiled[t.id] = current
+        # One reference swap, so readers see either the old or the new set
+        self._compiled = compiled
+
+    def __len__(self):
+        return len(self._compiled)
+
+    def get(self, template_id) -> Optional[CompiledTemplate]:
+        return self._compiled.get(template_id)
+
+    def render(self, template_id, fields: Fields):
+        """Return ``(title, message)`` or None when the template is unknown.
+
+        ``title`` is None when the template only formats the message.
+        """
+        template = self._compiled.get(template_id)
+        if template is None:
+            return None
+        title = template.title(fields) if template.title else None
+        return title, template.message(fields)
+
+
+def _read_watermark(session):
+    from sqlalchemy import func
+    from sqlmodel import select
+    from .api.models import Template
+    return tuple(session.exec(select(func.max(Template.updated_at), func.count(Template.id))).one())
+
+
+def load_templates():
+    """Read Template rows from the admin database."""
+    from sqlmodel import select
+    from .api.db import get_session
+    from .api.models import Template
+    try:
+        with get_session() as s:
+            return list(s.exec(select(Template)))
+    except Exception as e:
+        log_event(logging.WARNING, "templates_unavailable", error=str(e))
+        return []
+
+
+class TemplateWatcher:
+    """Polls the Template table and recompiles changed templates off the loop."""
+
+    def __init__(self, cache: TemplateCache, interval: float = 5.0):
+        self.cache = cache
+        self.interval = interval
+        self._watermark = None
+
+    def poll(self) -> bool:
+        from .api.db import get_session
+        try:
+            with get_session() as s:
+                watermark = _read_watermark(s)
+        except Exception as e:
+            log_event(logging.WARNING, "templates_unavailable", error=str(e))
+            return False
+        if watermark == self._watermark:
+            return False
+        self.cache.refresh(load_templates())
+        self._watermark = watermark
+        return True
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if await loop.run_in_executor(None, self.poll):
+                log_event(logging.INFO, "templates_reloaded", count=len(self.cache))
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,245 @@
+"""Per-message tracing.
+
+Each message gets a trace id at DATA. Pipeline stages and every Pushover
+attempt are recorded as spans in the OTLP span shape (hex ids, unix-nano
+timestamps), handed to a background thread and exported in batches to a
+JSON-lines file or posted as OTLP/HTTP JSON to a collector. The default
+tracer is a no-op whose ``span`` returns one shared do-nothing context
+manager, so a disabled tracer costs a method call per stage.
+"""
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import urllib.request
+from .logs import log_event
+
+SERVICE_NAME = "signalhub"
+
+
+def new_trace_id():
+    return os.urandom(16).hex()
+
+
+def new_span_id():
+    return os.urandom(8).hex()
+
+
+class _NoopSpan:
+    span_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, key, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class NoopTracer:
+    enabled = False
+
+    def sampled(self):
+        return False
+
+    def span(self, name, trace_id, parent_id=None, **attributes):
+        return _NOOP_SPAN
+
+    def close(self):
+        pass
+
+
+class Span:
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id", "attributes", "start", "error")
+
+    def __init__(self, tracer, name, trace_id, parent_id, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error = None
+
+    def __enter__(self):
+        self.start = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.error = repr(exc)
+        self.tracer.record(self, time.time_ns())
+        return False
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+
+class Tracer:
+    """Records spans and exports them from a background thread.
+
+    Spans are dropped, not queued without bound, when the exporter falls
+    behind. ``sample_rate`` decides per message whether it is traced.
+    """
+
+    enabled = True
+
+    def __init__(self, exporter, sample_rate=1.0, max_queue=10000, batch_size=512, flush_interval=2.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def span(self, name, trace_id, parent_id=None, **attributes):
+        if trace_id is None:
+            return _NOOP_SPAN
+        return Span(self, name, trace_id, parent_id, attributes)
+
+    def record(self, span, end):
+        item = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id or "",
+            "name": span.name,
+            "startTimeUnixNano": span.start,
+            "endTimeUnixNano": end,
+            "attributes": span.attributes,
+        }
+        if span.error:
+            item["status"] = {"code": 2, "message": span.error}
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _export_loop(self):
+        try:
+            self._export_batches()
+        finally:
+            self.exporter.close()
+
+    def _export_batches(self):
+        while True:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            batch.append(item)
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self.exporter.export(batch)
+            except Exception as e:
+                log_event(logging.WARNING, "trace_export_failed", error=str(e), spans=len(batch))
+            if stop:
+                return
+
+    def close(self, timeout=5):
+        """Flush queued spans and stop the exporter thread, which then closes the exporter."""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+
+class FileExporter:
+    """Appends spans as JSON lines to a local file.
+
+    Each batch is one unbuffered append, so several SMTP worker processes
+    can share the file without interleaving lines. The file stays open
+    until ``close``, which the tracer's exporter thread calls on its way out.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "ab", buffering=0)  # noqa: SIM115 - closed by close()
+
+    def export(self, spans):
+        self._file.write("".join(json.dumps(s, separators=(",", ":")) + "\n" for s in spans).encode())
+
+    def close(self):
+        self._file.close()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPHttpExporter:
+    """Posts spans to an OTLP/HTTP JSON endpoint (e.g. a collector's /v1/traces)."""
+
+    def __init__(self, endpoint, timeout=5):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def payload(self, spans):
+        otlp_spans = []
+        for s in spans:
+            span = dict(s)
+            span["kind"] = 1
+            span["startTimeUnixNano"] = str(s["startTimeUnixNano"])
+            span["endTimeUnixNano"] = str(s["endTimeUnixNano"])
+            span["attributes"] = [{"key": k, "value": _otlp_value(v)} for k, v in s["attributes"].items()]
+            otlp_spans.append(span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": otlp_spans}],
+        }]}
+
+    def export(self, spans):
+        req = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(self.payload(spans)).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            resp.read()
+
+    def close(self):
+        pass
+
+
+def tracer_from_config(config):
+    """Build the tracer selected by ``config.tracing_exporter`` (off by default)."""
+    if config.tracing_exporter == "file":
+        exporter = FileExporter(config.tracing_file)
+    elif config.tracing_exporter == "otlp":
+        exporter = OTLPHttpExporter(config.tracing_endpoint)
+    else:
+        if config.tracing_exporter:
+            log_event(logging.WARNING, "unknown_tracing_exporter", exporter=config.tracing_exporter)
+        return NoopTracer()
+    return Tracer(exporter, sample_rate=config.tracing_sample_rate)
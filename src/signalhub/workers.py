@@ -0,0 +1,175 @@
+"""Multi-process SMTP front end.
+
+With ``smtp_workers > 1`` the parent process only supervises: it starts
+that many worker processes, each running its own event loop, Handler and
+aiosmtpd controller bound to the same port with ``SO_REUSEPORT`` so the
+kernel spreads incoming connections across them. Workers share the
+durable SQLite spool (leases keep them from sending a record twice) and
+publish metric snapshots to the parent, which serves them merged.
+"""
+import os
+import time
+import asyncio
+import queue
+import signal
+import logging
+import threading
+import multiprocessing
+from dataclasses import replace
+from aiosmtpd.controller import Controller
+from .logs import log_event, setup_logging
+from .metrics import merge
+
+METRICS_INTERVAL = 1.0
+RESTART_DELAY = 1.0
+
+
+class ReusePortController(Controller):
+    """Controller whose listening socket can be shared by sibling processes."""
+
+    def _create_server(self):
+        return self.loop.create_server(
+            self._factory_invoker,
+            host=self.hostname,
+            port=self.port,
+            ssl=self.ssl_context,
+            reuse_port=True,
+        )
+
+    def _trigger_server(self):
+        # A probe connection may be accepted by a sibling worker, so build
+        # the SMTP factory in-process instead of connecting to the port.
+        self.loop.call_soon_threadsafe(self._factory_invoker)
+
+
+def worker_config(config, workers):
+    """Split the rate limits and the memory budget across ``workers``.
+
+    The Pushover quota settings are left whole: every worker reads the
+    app-wide remaining count from the API's ``X-Limit-App-Remaining``.
+    """
+    if workers <= 1:
+        return config
+    return replace(
+        config,
+        rate_limit_per_minute=max(1, config.rate_limit_per_minute // workers),
+        rate_limit_per_recipient=_split(config.rate_limit_per_recipient, workers),
+        rate_limit_per_sender=_split(config.rate_limit_per_sender, workers),
+        inflight_bytes_limit=config.inflight_bytes_limit // workers,
+    )
+
+
+def _split(limit, workers):
+    """Each worker's share of ``limit``; 0 (no limit) stays 0."""
+    return max(1, limit // workers) if limit else 0
+
+
+class MetricsAggregator:
+    """Merges the latest metrics snapshot published by each worker."""
+
+    def __init__(self, metrics_queue):
+        self.queue = metrics_queue
+        self.latest = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._drain, name="metrics-aggregator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _drain(self):
+        while not self._stopped.is_set():
+            try:
+                worker_id, snap = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                self.latest[worker_id] = snap
+
+    def forget(self, worker_id):
+        with self._lock:
+            self.latest.pop(worker_id, None)
+
+    def totals(self):
+        with self._lock:
+            snapshots = list(self.latest.values())
+        merged = merge(snapshots)
+        merged["gauges"]["smtp_workers"] = len(snapshots)
+        return merged
+
+
+async def publish_metrics(handler, worker_id, metrics_queue, interval=METRICS_INTERVAL):
+    """Send the handler's metrics snapshot to the parent every ``interval``."""
+    while True:
+        try:
+            metrics_queue.put_nowait((worker_id, handler.metrics_snapshot()))
+        except queue.Full:
+            pass
+        await asyncio.sleep(interval)
+
+
+def _worker_main(worker_id, config, metrics_queue):
+    from .app import serve
+    setup_logging(config)
+    serve(config, worker_id=worker_id, metrics_queue=metrics_queue)
+
+
+class WorkerPool:
+    """Starts ``count`` SMTP worker processes and restarts any that die."""
+
+    def __init__(self, config, count):
+        self.config = worker_config(config, count)
+        self.count = count
+        # Spawn rather than fork: the parent holds SQLAlchemy connections
+        # and threads that must not be shared with the children.
+        self.ctx = multiprocessing.get_context("spawn")
+        self.metrics_queue = self.ctx.Queue(maxsize=count * 16)
+        self.aggregator = MetricsAggregator(self.metrics_queue)
+        self.procs = {}
+        self._stopping = threading.Event()
+
+    def _spawn(self, worker_id):
+        proc = self.ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.config, self.metrics_queue),
+            name=f"signalhub-smtp-{worker_id}",
+        )
+        proc.start()
+        self.procs[worker_id] = proc
+        log_event(logging.INFO, "smtp_worker_started", worker=worker_id, pid=proc.pid)
+
+    def start(self):
+        self.aggregator.start()
+        for worker_id in range(self.count):
+            self._spawn(worker_id)
+
+    async def supervise(self):
+        """Restart workers that exit unexpectedly until ``stop`` is called."""
+        while not self._stopping.is_set():
+            await asyncio.sleep(RESTART_DELAY)
+            for worker_id, proc in list(self.procs.items()):
+                if proc.is_alive() or self._stopping.is_set():
+                    continue
+                log_event(logging.ERROR, "smtp_worker_exited", worker=worker_id, exitcode=proc.exitcode)
+                self.aggregator.forget(worker_id)
+                self._spawn(worker_id)
+
+    def stop(self, timeout=15):
+        """Ask every worker to drain (SIGTERM) and wait for them to exit."""
+        self._stopping.set()
+        for proc in self.procs.values():
+            if proc.is_alive():
+                os.kill(proc.pid, signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        for proc in self.procs.values():
+            proc.join(max(0, deadline - time.monotonic()))
+            if proc.is_alive():
+                proc.kill()
+                proc.join()
+        self.aggregator.stop()
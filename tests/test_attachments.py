@@ -0,0 +1,79 @@
+import io
+import os
+import pytest
+from email.message import EmailMessage
+from signalhub.attachments import MemoryBudget, decode, prepare, shrink
+from signalhub.config import Config
+from signalhub.handler import Handler
+from signalhub.mimeparse import find_image
+from signalhub.pushover import OK, PushoverResponse
+
+def camera_alert(snapshot, cte=None):
+    msg = EmailMessage()
+    msg["Subject"] = "Motion at Front Door"
+    msg.set_content("Motion detected")
+    if cte:
+        msg.add_attachment(snapshot, maintype="image", subtype="jpeg", filename="snap.jpg", cte=cte)
+    else:
+        msg.add_attachment(snapshot, maintype="image", subtype="jpeg", filename="snap.jpg")
+    return msg.as_bytes()
+
+def noise_jpeg(width, height):
+    Image = pytest.importorskip("PIL.Image")
+    out = io.BytesIO()
+    Image.frombytes("RGB", (width, height), os.urandom(width * height * 3)).save(out, "JPEG", quality=95)
+    return out.getvalue()
+
+def test_find_and_decode_first_image():
+    snapshot = b"\xff\xd8" + os.urandom(50000)
+    part = find_image(camera_alert(snapshot))
+    assert (part.content_type, part.filename, part.encoding) == ("image/jpeg", "snap.jpg", "base64")
+    assert bytes(decode(part)) == snapshot
+    assert find_image(b"Subject: text only\n\nbody") is None
+
+def test_small_image_passes_through_unchanged():
+    snapshot = b"\xff\xd8" + os.urandom(1000)
+    attachment = prepare(find_image(camera_alert(snapshot)), max_bytes=5000)
+    assert attachment.filename == "snap.jpg" and bytes(attachment.data) == snapshot
+
+def test_large_image_is_downsized():
+    original = noise_jpeg(600, 600)
+    attachment = prepare(find_image(camera_alert(original)), max_bytes=len(original) // 4)
+    assert attachment.content_type == "image/jpeg"
+    assert 0 < len(attachment.data) <= len(original) // 4
+    assert shrink(b"not an image", 100) is None
+
+def test_memory_budget():
+    budget = MemoryBudget(100)
+    assert budget.acquire(60)
+    assert not budget.acquire(50)
+    budget.release(60)
+    assert budget.acquire(100)
+
+@pytest.mark.asyncio
+async def test_handler_forwards_image_and_respects_budget():
+    snapshot = b"\xff\xd8" + os.urandom(30000)
+    h = Handler(Config(default_user_key="U0", attachment_memory_budget=40000, dedup_window=0))
+    sent = []
+
+    async def post(*args, attachment=None, **kwargs):
+        sent.append(attachment)
+        return PushoverResponse(True, 200, '{"status":1}', OK)
+    h.pushover.post = post
+    jobs = []
+    h.delivery.submit = lambda job: jobs.append(job) or True
+
+    class Envelope:
+        rcpt_tos = ["cam@home.local"]
+        mail_from = "cam@lab"
+        content = camera_alert(snapshot)
+    assert (await h.handle_DATA(None, None, Envelope())).startswith("250")
+    assert (await h.handle_DATA(None, None, Envelope())).startswith("250")
+    # The first send holds its decoded image, so the second goes without one
+    h.attachment_budget.acquire(30000)
+    await h._deliver(jobs[1])
+    h.attachment_budget.release(30000)
+    await h._deliver(jobs[0])
+    assert sent[0] is None and bytes(sent[1].data) == snapshot
+    assert h.metrics['attachments_skipped'] == 1 and h.metrics['attachments_sent'] == 1
+    assert h.attachment_budget.used == 0
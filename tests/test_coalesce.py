@@ -0,0 +1,99 @@
+import asyncio
+import time
+import pytest
+from signalhub.coalesce import Coalescer, build_digest
+from signalhub.config import Config
+from signalhub.delivery import DeliveryJob
+from signalhub.handler import Handler
+from signalhub.pushover import OK, PushoverResponse
+
+class DummyEnvelope:
+    def __init__(self, rcpt_tos, content):
+        self.rcpt_tos = rcpt_tos
+        self.content = content
+        self.mail_from = "from@x"
+
+def make_job(title, user_key="U1", prio=None):
+    directives = {"prio": prio} if prio else {}
+    return DeliveryJob(rcpt_to="cams@home.local", title=title, message="m", directives=directives, user_key=user_key)
+
+def test_digest_summarizes_counts_and_subjects():
+    jobs = [make_job("Motion front"), make_job("Motion back", prio="1"), make_job("Motion front")]
+    digest = build_digest(jobs)
+    assert digest.title.startswith("3 alerts (2 distinct)")
+    assert digest.message.splitlines() == ["2x Motion front", "1x Motion back"]
+    assert digest.directives["prio"] == "1"
+    assert build_digest(jobs[:1] * 4).title == "[4x] Motion front"
+
+@pytest.mark.asyncio
+async def test_coalescer_batches_per_user_key():
+    emitted = []
+    c = Coalescer(lambda job, count: emitted.append((job.user_key, count)), window=0.05, max_batch=3)
+    for n in range(4):
+        c.add(make_job(f"a{n}", "U1"))
+    c.add(make_job("b", "U2"))
+    # max_batch flushes U1 immediately
+    assert emitted == [("U1", 3)]
+    await asyncio.sleep(0.1)
+    assert sorted(emitted) == [("U1", 1), ("U1", 3), ("U2", 1)]
+    assert c.pending() == 0
+
+@pytest.mark.asyncio
+async def test_handler_sends_one_digest_for_a_burst():
+    h = Handler(Config(default_user_key="U0", coalesce_window=0.05))
+    sent = []
+
+    async def send(user_key, title, message, token, **kwargs):
+        sent.append(title)
+        return PushoverResponse(True, 200, '{"status":1}', OK)
+
+    h.pushover.post = send
+    for n in range(20):
+        env = DummyEnvelope(["ups@home.local"], f"Subject: UPS flapping {n % 2}\n\nevent {n}".encode())
+        assert (await h.handle_DATA(None, None, env)).startswith("250")
+    await asyncio.sleep(0.1)
+    await h.delivery.join()
+    await h.stop()
+    assert sent == ["20 alerts (2 distinct): UPS flapping 0"]
+    assert h.metrics['coalesced'] == 20
+
+@pytest.mark.asyncio
+async def test_storm_of_identical_alerts_is_folded_not_refused():
+    h = Handler(Config(default_user_key="U0", coalesce_window=0.05, coalesce_max_batch=500))
+    sent = []
+
+    async def send(user_key, title, message, token, **kwargs):
+        sent.append(title)
+        return PushoverResponse(True, 200, '{"status":1}', OK)
+
+    h.pushover.post = send
+    replies = set()
+    for n in range(300):  # well past the default 120/min rate limit
+        env = DummyEnvelope(["cams@home.local"], b"Subject: Motion front door\n\nmotion detected")
+        replies.add(await h.handle_DATA(None, None, env))
+    await asyncio.sleep(0.1)
+    await h.delivery.join()
+    await h.stop()
+    assert replies == {"250 Message accepted for delivery"}
+    assert sent == ["[300x] Motion front door"]
+    assert h.metrics.get('dedup_dropped', 0) == 0 and h.metrics.get('rate_limited', 0) == 0
+
+@pytest.mark.asyncio
+async def test_rate_limited_digests_are_delayed():
+    h = Handler(Config(default_user_key="U0", coalesce_window=0.05, coalesce_max_batch=1,
+                       rate_limit_per_minute=60))
+    h.ratelimiter.global_bucket.tokens = 1
+    scheduled = []
+    h.delivery.submit = lambda job: True
+
+    async def schedule(job, due, error=None):
+        scheduled.append(due - time.time())
+
+    h.retries.schedule = schedule
+    for n in range(3):
+        env = DummyEnvelope(["cams@home.local"], f"Subject: Motion {n}\n\nm".encode())
+        assert (await h.handle_DATA(None, None, env)).startswith("250")
+    await asyncio.sleep(0)
+    assert [round(d) for d in scheduled] == [1, 2]
+    assert h.metrics['rate_limited'] == 2
+    await h.stop()
@@ -30,3 +30,26 @@ def test_recipient_lookup():
     h = Handler(cfg)
     assert h._route_recipient("alerts@home.local") == "U2"
     assert h._route_recipient("unknown@x") == "U0"
+
+def test_sections_and_env_casting(tmp_path):
+    config_yaml = tmp_path / "signalhub.yaml"
+    config_yaml.write_text("""
+pushover:
+  default_device: "phone"
+server:
+  listen_port: 2526
+delivery_workers: 8
+""")
+    cfg = load_config(str(config_yaml), environ={
+        "SMTP_ALLOW_NOAUTH": "false",
+        "SMTP_WORKERS": "2",
+        "DEDUP_WINDOW": "2.5",
+        "HTTP_HEALTH_PORT": "",
+    })
+    assert cfg.pushover_device == "phone"
+    assert cfg.listen_port == 2526
+    assert cfg.delivery_workers == 8
+    assert cfg.allow_nonauth is False
+    assert cfg.smtp_workers == 2
+    assert cfg.dedup_window == 2.5
+    assert cfg.health_port == 8080
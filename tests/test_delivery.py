@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+from signalhub.delivery import AdaptiveConcurrency, DeliveryJob, DeliveryQueue
+
+def make_job(n):
+    return DeliveryJob(rcpt_to="a@x", title=f"t{n}", message="m", directives={}, user_key="U")
+
+@pytest.mark.asyncio
+async def test_workers_drain_queue_concurrently():
+    active = 0
+    peak = 0
+    done = []
+
+    async def deliver(job):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        done.append(job.title)
+
+    q = DeliveryQueue(deliver, workers=3, maxsize=10)
+    for n in range(6):
+        assert q.submit(make_job(n))
+    await asyncio.wait_for(q.join(), 2)
+    assert sorted(done) == [f"t{n}" for n in range(6)]
+    assert peak == 3
+    assert await q.stop() == []
+
+@pytest.mark.asyncio
+async def test_stop_returns_undelivered_jobs():
+    async def deliver(job):
+        await asyncio.sleep(10)
+
+    q = DeliveryQueue(deliver, workers=1, maxsize=10)
+    for n in range(3):
+        q.submit(make_job(n))
+    await asyncio.sleep(0)
+    pending = await q.stop()
+    assert sorted(j.title for j in pending) == ["t0", "t1", "t2"]
+
+@pytest.mark.asyncio
+async def test_adaptive_concurrency_gates_and_adjusts():
+    limiter = AdaptiveConcurrency(4, latency_target=1.0, cooldown=10)
+    limiter.record(0.1, congested=True, now=100)
+    assert limiter.limit == 2
+    limiter.record(0.1, congested=True, now=101)  # same outage, within cooldown
+    assert limiter.limit == 2
+    limiter.record(5.0, now=111)  # slow round trip
+    assert limiter.limit == 1
+
+    active = 0
+    peak = 0
+
+    async def send():
+        nonlocal active, peak
+        await limiter.acquire()
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        limiter.release()
+    await asyncio.gather(*(send() for _ in range(5)))
+    assert peak == 1
+
+    for _ in range(3):
+        limiter.record(0.1)
+    assert 2 <= limiter.limit < 3
+    limiter.record(0.1, congested=False)
+    assert limiter.limit <= 4
@@ -1,7 +1,9 @@
+import asyncio
 import pytest
 import time
 from signalhub.handler import Handler, RateLimiter, Dedup
 from signalhub.config import Config
+from signalhub.pushover import OK, PushoverResponse
 
 class DummyEnvelope:
     def __init__(self, rcpt_tos, content):
@@ -13,7 +15,6 @@ class DummyEnvelope:
 async def test_ratelimit():
     cfg = Config(rate_limit_per_minute=2)
     h = Handler(cfg)
-    h.ratelimiter.window.clear()
     assert h.ratelimiter.allow()
     assert h.ratelimiter.allow()
     assert not h.ratelimiter.allow()
@@ -24,9 +25,29 @@ async def test_dedup(monkeypatch):
     key = "abc"
     assert not d.is_dup(key)
     assert d.is_dup(key)
-    monkeypatch.setattr(time, "time", lambda: time.time() + 6)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 6)
     assert not d.is_dup(key)
 
+def test_dedup_is_bounded(monkeypatch):
+    d = Dedup(capacity=3)
+    for n in range(10):
+        assert not d.is_dup(f"alert {n}")
+    assert len(d.last) == 3
+    assert all(len(fp) == 16 for fp in d.last)
+    # The oldest keys were evicted
+    assert not d.is_dup("alert 0")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 6)
+    d.is_dup("fresh")
+    assert len(d.last) == 1
+
+def test_dedup_normalize_ignores_numbers():
+    d = Dedup(normalize=True)
+    assert not d.is_dup("Backup failed at 2024-05-01 02:00:13")
+    assert d.is_dup("Backup failed at 2024-05-02  02:00:14")
+    assert not d.is_dup("Backup finished at 2024-05-02 02:00:14")
+
 @pytest.mark.asyncio
 async def test_parse_message():
     cfg = Config()
@@ -37,3 +58,51 @@ async def test_parse_message():
     assert body.startswith("Body")
     assert directives["prio"] == "1"
     assert directives["sound"] == "ping"
+
+class DummySession:
+    peer = ("127.0.0.1", 12345)
+
+@pytest.mark.asyncio
+async def test_handle_data_accepts_before_delivery(monkeypatch):
+    sent = []
+
+    async def slow_send(user_key, title, message, token, **kwargs):
+        await asyncio.sleep(0.2)
+        sent.append((title, kwargs["priority"]))
+        return PushoverResponse(True, 200, '{"status":1}', OK)
+
+    h = Handler(Config(default_user_key="U0"))
+    monkeypatch.setattr(h.pushover, "post", slow_send)
+    env = DummyEnvelope(["alerts@home.local"], b"Subject: Disk full [PRIO=1]\n\nvolume1 at 99%")
+    start = time.monotonic()
+    assert await h.handle_DATA(None, DummySession(), env) == '250 Message accepted for delivery'
+    assert time.monotonic() - start < 0.1
+    await asyncio.wait_for(h.delivery.join(), 2)
+    assert sent == [("Disk full [PRIO=1]", "1")]
+    assert h.metrics['pushed_ok'] == 1
+    await h.stop()
+
+@pytest.mark.asyncio
+async def test_handle_data_sheds_load_at_high_water():
+    h = Handler(Config(delivery_workers=1, delivery_queue_size=4, delivery_high_water=2))
+    h.delivery.deliver = lambda job: asyncio.sleep(10)
+    replies = []
+    for i in range(5):
+        env = DummyEnvelope(["a@x"], f"Subject: alert {i}\n\nbody {i}".encode())
+        replies.append(await h.handle_DATA(None, DummySession(), env))
+    assert replies.count('250 Message accepted for delivery') == 2
+    assert replies[-1].startswith('451')
+    assert h.metrics['load_shed'] >= 1
+    await h.stop()
+
+@pytest.mark.asyncio
+async def test_refused_message_is_not_deduplicated_on_retry():
+    h = Handler(Config(default_user_key="U0", pushover_monthly_quota=10, pushover_quota_reserve=10))
+    h.delivery.submit = lambda job: True
+    content = b"Subject: Disk full\n\nvolume1 at 99%"
+    assert (await h.handle_DATA(None, DummySession(), DummyEnvelope(["a@x"], content))).startswith("451")
+    h.quota.reserve = 0
+    reply = await h.handle_DATA(None, DummySession(), DummyEnvelope(["a@x"], content))
+    assert reply == '250 Message accepted for delivery'
+    assert h.metrics.get('dedup_dropped', 0) == 0
+    await h.stop()
@@ -0,0 +1,26 @@
+from signalhub.htmltext import html_to_text
+
+
+def test_drops_script_and_style():
+    html = "<html><head><style>p{color:red}</style></head><body><script>alert(1)</script><p>Disk full</p></body></html>"
+    assert html_to_text(html) == "Disk full"
+
+
+def test_decodes_entities_and_collapses_whitespace():
+    html = "<p>Temp&nbsp;&gt;   80&deg;C\n\n on   <b>NAS&amp;01</b></p>"
+    assert html_to_text(html) == "Temp > 80\xb0C on NAS&01"
+
+
+def test_blocks_become_lines():
+    html = "<div>AP offline</div><br/><table><tr><td>Site</td><td>Home</td></tr></table>"
+    assert html_to_text(html) == "AP offline\nSite Home"
+
+
+def test_stops_at_budget():
+    html = "<p>" + "x" * 50 + "</p>" + "<p>never parsed</p>" * 10000
+    assert html_to_text(html, limit=20) == "x" * 20
+
+
+def test_comments_doctype_and_stray_brackets():
+    html = "<!DOCTYPE html><!-- hidden --><p>CPU < 5% on <i>nas</i></p>"
+    assert html_to_text(html) == "CPU < 5% on nas"
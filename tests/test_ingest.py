@@ -0,0 +1,77 @@
+import asyncio
+import gc
+import mmap
+import pytest
+from signalhub.config import Config
+from signalhub.handler import Handler
+from signalhub.ingest import IngestBudget, declared_size, spill
+from signalhub.pushover import OK, PushoverResponse
+
+class Session:
+    peer = ("127.0.0.1", 2525)
+
+class Envelope:
+    def __init__(self, content=b""):
+        self.rcpt_tos = ["alerts@home.local"]
+        self.mail_from = None
+        self.mail_options = []
+        self.content = content
+        self.original_content = content
+
+def test_declared_size():
+    assert declared_size(["BODY=8BITMIME", "SIZE=2048"]) == 2048
+    assert declared_size(["size=12"]) == 12
+    assert declared_size(["SIZE=junk"]) == 0
+    assert declared_size([]) == 0
+
+def test_budget_releases_with_envelope():
+    budget = IngestBudget(global_limit=100, per_connection_limit=60)
+    a, b = Session(), Session()
+    env = Envelope()
+    assert budget.admit(a, 50) is None
+    budget.hold(a, env, 50)
+    assert budget.admit(a, 20).startswith("452")  # connection budget
+    assert budget.admit(b, 20) is None
+    budget.hold(b, Envelope(), 20)  # collected right away
+    gc.collect()
+    assert budget.used == 50
+    assert budget.admit(b, 60).startswith("452")  # global budget
+    del env
+    gc.collect()
+    assert budget.used == 0 and budget.session_used(a) == 0
+
+def test_spill_maps_content_without_a_name(tmp_path):
+    mapped = spill(b"x" * 4096, str(tmp_path))
+    assert isinstance(mapped, mmap.mmap)
+    assert mapped[:4] == b"xxxx" and len(mapped) == 4096
+    assert list(tmp_path.iterdir()) == []
+    mapped.close()
+
+@pytest.mark.asyncio
+async def test_handle_mail_refuses_when_budget_is_full():
+    h = Handler(Config(inflight_bytes_limit=1000, spill_threshold=0))
+    env = Envelope()
+    reply = await h.handle_MAIL(None, Session(), env, "a@x", ["SIZE=2000"])
+    assert reply.startswith("452") and h.metrics["ingest_refused"] == 1
+    assert await h.handle_MAIL(None, Session(), env, "a@x", ["SIZE=500"]) == "250 OK"
+    assert env.mail_from == "a@x" and env.mail_options == ["SIZE=500"]
+    await h.stop()
+
+@pytest.mark.asyncio
+async def test_large_bodies_are_spilled(tmp_path):
+    sent = []
+
+    async def post(user_key, title, message, token, **kwargs):
+        sent.append(message)
+        return PushoverResponse(True, 200, '{"status":1}', OK)
+
+    h = Handler(Config(default_user_key="U0", queue_dir=str(tmp_path), spill_threshold=1024,
+                       inflight_bytes_limit=4096))
+    h.pushover.post = post
+    env = Envelope(b"Subject: big\n\n" + b"line of log output\n" * 1000)
+    assert await h.handle_DATA(None, Session(), env) == "250 Message accepted for delivery"
+    assert isinstance(env.content, mmap.mmap)
+    assert h.metrics["bodies_spilled"] == 1 and h.ingest.used == 0
+    await asyncio.wait_for(h.delivery.join(), 2)
+    assert sent[0].startswith("line of log output")
+    await h.stop()
@@ -0,0 +1,53 @@
+import io
+import sys
+import json
+import queue
+import logging
+from signalhub.logs import BoundedQueueHandler, Event, EventSampler, JSONFormatter
+
+def _record(msg, exc_info=None):
+    return logging.LogRecord("signalhub", logging.INFO, __file__, 1, msg, None, exc_info)
+
+def test_event_quotes_stay_valid_json():
+    line = JSONFormatter().format(_record(Event(event="dedup", subject='Disk "sda" \\ failing')))
+    assert json.loads(line) == {"event": "dedup", "subject": 'Disk "sda" \\ failing'}
+    assert JSONFormatter().format(_record("plain text")) == "plain text"
+
+def test_exception_attached_to_event():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = _record(Event(event="delivery_error"), sys.exc_info())
+    handler = BoundedQueueHandler(queue.Queue())
+    prepared = handler.prepare(record)
+    assert prepared.exc_info is None
+    assert "ValueError: boom" in json.loads(JSONFormatter().format(prepared))["exc"]
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = BoundedQueueHandler(queue.Queue(2))
+    for _ in range(5):
+        handler.handle(_record(Event(event="push_ok")))
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+def test_sampler_limits_storm_events_and_reports_suppressed():
+    sampler = EventSampler(2)
+    passed = [sampler.filter(_record(Event(event="dedup"))) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert sampler.filter(_record(Event(event="push_ok")))
+    sampler.windows["dedup"][0] -= 1.0  # next second
+    record = _record(Event(event="dedup"))
+    assert sampler.filter(record)
+    assert record.msg["suppressed"] == 3
+
+def test_listener_writes_json_lines():
+    from logging.handlers import QueueListener
+    out = io.StringIO()
+    stream = logging.StreamHandler(out)
+    stream.setFormatter(JSONFormatter())
+    handler = BoundedQueueHandler(queue.Queue(10))
+    listener = QueueListener(handler.queue, stream)
+    listener.start()
+    handler.handle(_record(Event(event="push_ok", status=200)))
+    listener.stop()
+    assert json.loads(out.getvalue()) == {"event": "push_ok", "status": 200}
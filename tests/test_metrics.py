@@ -0,0 +1,57 @@
+import asyncio
+import socket
+import pytest
+from signalhub.config import Config
+from signalhub.handler import Handler
+from signalhub.health import start_health_server
+from signalhub.metrics import Histogram, render, snapshot
+from signalhub.pushover import OK, PushoverResponse
+
+def test_histogram_rendering():
+    h = Histogram("pushover_rtt_seconds", "RTT", (0.1, 1), ("mapping",))
+    h.observe(0.05, "*@cams")
+    h.observe(0.1, "*@cams")
+    h.observe(3, "*@cams")
+    text = render(snapshot({"pushed_ok": 2}, {"delivery_queue_jobs": 0}, [h]))
+    assert "# TYPE signalhub_pushed_ok_total counter\nsignalhub_pushed_ok_total 2\n" in text
+    assert 'signalhub_pushover_rtt_seconds_bucket{mapping="*@cams",le="0.1"} 2\n' in text
+    assert 'signalhub_pushover_rtt_seconds_bucket{mapping="*@cams",le="1"} 2\n' in text
+    assert 'signalhub_pushover_rtt_seconds_bucket{mapping="*@cams",le="+Inf"} 3\n' in text
+    assert 'signalhub_pushover_rtt_seconds_sum{mapping="*@cams"} 3.15\n' in text
+    assert 'signalhub_pushover_rtt_seconds_count{mapping="*@cams"} 3\n' in text
+    assert ("# HELP signalhub_delivery_queue_jobs Jobs waiting in the delivery queue\n"
+            "# TYPE signalhub_delivery_queue_jobs gauge\nsignalhub_delivery_queue_jobs 0\n") in text
+
+@pytest.mark.asyncio
+async def test_handler_records_timings_by_mapping():
+    class Envelope:
+        rcpt_tos = ["alerts@home.local"]
+        mail_from = "nas@home.local"
+        content = b"Subject: Disk\n\nfull"
+    h = Handler(Config(recipient_map={"alerts@home.local": "U1"}, default_user_key="U0"))
+
+    async def send(*args, **kwargs):
+        return PushoverResponse(True, 200, '{"status":1}', OK)
+    h.pushover.post = send
+    jobs = []
+    h.delivery.submit = lambda job: jobs.append(job) or True
+    assert (await h.handle_DATA(None, None, Envelope())).startswith("250")
+    await h._deliver(jobs[0])
+    snap = h.metrics_snapshot()
+    assert snap["counters"]["pushed_ok"] == 1
+    assert list(snap["histograms"]["parse_seconds"]["series"]) == [()]
+    assert list(snap["histograms"]["delivery_latency_seconds"]["series"]) == [("alerts@home.local",)]
+    assert snap["histograms"]["delivery_attempts"]["series"][("alerts@home.local", "delivered")][0] == 1
+    assert "signalhub_route_seconds_count 1" in render(snap)
+
+@pytest.mark.asyncio
+async def test_cancelled_health_server_releases_its_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    task = asyncio.create_task(start_health_server(Config(health_port=port)))
+    await asyncio.sleep(0.1)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    with socket.socket() as again:
+        again.bind(("0.0.0.0", port))  # nothing is listening any more
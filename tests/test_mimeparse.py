@@ -0,0 +1,59 @@
+import base64
+from email.message import EmailMessage
+from signalhub import mimeparse
+from signalhub.mimeparse import parse_message
+
+def camera_alert(body="Motion detected at Front Door", html=None, snapshot=b"\xff\xd8" + b"\x00" * 300000):
+    msg = EmailMessage()
+    msg["Subject"] = "=?utf-8?q?Kamera_=C3=9Cberwachung?= [PRIO=1]"
+    msg["From"] = "cam@home.local"
+    msg.set_content(body, cte="quoted-printable")
+    if html:
+        msg.add_alternative(html, subtype="html")
+    msg.add_attachment(snapshot, maintype="image", subtype="jpeg", filename="snap.jpg")
+    return msg.as_bytes()
+
+def test_plain_single_part():
+    subject, body, directives = parse_message(b"Subject: Test [PRIO=1] [SOUND=ping]\n\nBody line\n")
+    assert subject == "Test [PRIO=1] [SOUND=ping]"
+    assert body == "Body line"
+    assert directives == {"prio": "1", "sound": "ping"}
+
+def test_multipart_with_attachment_decodes_only_text(monkeypatch):
+    decoded = []
+    real = mimeparse._decode
+    monkeypatch.setattr(mimeparse, "_decode", lambda c, part, limit: decoded.append(part[0].get_content_type()) or real(c, part, limit))
+    subject, body, directives = parse_message(camera_alert(html="<p>Motion</p>"))
+    assert subject == "Kamera Überwachung [PRIO=1]"
+    assert body == "Motion detected at Front Door"
+    assert directives == {"prio": "1"}
+    assert decoded == ["text/plain"]
+
+def test_html_fallback_when_no_plain_part():
+    msg = EmailMessage()
+    msg["Subject"] = "UniFi alert"
+    msg.set_content("<html><body><b>AP</b> disconnected</body></html>", subtype="html", cte="base64")
+    subject, body, directives = parse_message(msg.as_bytes())
+    assert body.strip() == "AP disconnected"
+
+def test_long_body_is_bounded():
+    text = "é" * 5000
+    msg = EmailMessage()
+    msg["Subject"] = "long"
+    msg.set_content(text, cte="base64")
+    _, body, _ = parse_message(msg.as_bytes())
+    assert body == text[:1024]
+    raw = b"Subject: qp\nContent-Transfer-Encoding: quoted-printable\n\n" + b"=C3=A9" * 5000
+    assert parse_message(raw)[1] == text[:1024]
+
+def test_text_part_after_attachment_and_nested():
+    boundary, inner = "outer", "inner"
+    payload = base64.b64encode(b"not decoded").decode()
+    raw = (
+        f"Subject: nas\nContent-Type: multipart/mixed; boundary={boundary}\n\npreamble\n"
+        f"--{boundary}\nContent-Type: application/pdf\nContent-Transfer-Encoding: base64\n\n{payload}\n"
+        f"--{boundary}\nContent-Type: multipart/alternative; boundary={inner}\n\n"
+        f"--{inner}\nContent-Type: text/plain; charset=latin-1\n\nVolume degraded \xe9\n"
+        f"--{inner}--\n--{boundary}--\n"
+    ).encode("latin-1")
+    assert parse_message(raw)[1] == "Volume degraded é"
@@ -1,4 +1,8 @@
-from signalhub.pushover import send_message
+from contextlib import asynccontextmanager
+import pytest
+from aiohttp import web
+from signalhub.attachments import Attachment
+from signalhub.pushover import OK, PERMANENT, QUOTA, RETRY, PushoverClient, classify, send_message
 
 def test_payload_truncation():
     ok, status, body = send_message(
@@ -22,3 +26,88 @@ def test_directives():
         url_title="Go",
     )
     assert status in (0, 200)
+
+@asynccontextmanager
+async def stub_pushover(messages):
+    """A PushoverClient talking to a local server that answers with ``messages``."""
+    app = web.Application()
+    app.router.add_post("/1/messages.json", messages)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    client = PushoverClient(endpoint=f"http://127.0.0.1:{port}/1/messages.json")
+    try:
+        yield client
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_client_reuses_connection():
+    peers = []
+    forms = []
+
+    async def messages(request):
+        peers.append(request.transport.get_extra_info("peername"))
+        forms.append(dict(await request.post()))
+        return web.json_response({"status": 1, "request": "r"})
+
+    async with stub_pushover(messages) as client:
+        for n in range(3):
+            ok, status, body = await client.send("U", f"T{n}", "M" * 2000, "TKN", priority=1)
+            assert ok and status == 200
+    assert len(set(peers)) == 1
+    assert forms[0]["priority"] == "1"
+    assert len(forms[0]["message"]) == 1024
+
+@pytest.mark.asyncio
+async def test_client_reports_connection_errors():
+    client = PushoverClient(endpoint="http://127.0.0.1:9/1/messages.json", timeout=2)
+    ok, status, body = await client.send("U", "T", "M", "TKN")
+    await client.close()
+    assert not ok and status == 0 and body
+
+def test_classify_responses():
+    assert classify(200, '{"status":1}') == OK
+    assert classify(200, "not json") == RETRY
+    assert classify(400, '{"status":0,"errors":["user identifier is invalid"]}') == PERMANENT
+    assert classify(429, "") == QUOTA
+    assert classify(500, "") == RETRY
+    assert classify(0, "timeout") == RETRY
+
+@pytest.mark.asyncio
+async def test_post_reads_limit_headers():
+    async def messages(request):
+        form = await request.post()
+        if form["user"] == "bad":
+            return web.json_response({"status": 0, "errors": ["user identifier is invalid"]}, status=400)
+        return web.json_response({"status": 1}, headers={
+            "X-Limit-App-Limit": "10000", "X-Limit-App-Remaining": "7496", "X-Limit-App-Reset": "1393653600"})
+
+    async with stub_pushover(messages) as client:
+        ok = await client.post("U", "T", "M", "TKN")
+        bad = await client.post("bad", "T", "M", "TKN")
+    assert ok.ok and (ok.app_limit, ok.app_remaining, ok.app_reset) == (10000, 7496, 1393653600)
+    assert not bad.ok and bad.outcome == PERMANENT and bad.app_remaining is None
+
+@pytest.mark.asyncio
+async def test_post_streams_attachment_as_multipart():
+    received = {}
+
+    async def messages(request):
+        form = await request.post()
+        received.update(form)
+        received["data"] = form["attachment"].file.read()
+        return web.json_response({"status": 1})
+
+    image = b"\xff\xd8" + bytes(range(256)) * 100
+    async with stub_pushover(messages) as client:
+        resp = await client.post("U", "T", "M", "TKN", priority=1,
+                                 attachment=Attachment("snap.jpg", "image/jpeg", memoryview(image)))
+    assert resp.ok
+    assert received["priority"] == "1"
+    assert received["attachment"].filename == "snap.jpg"
+    assert received["attachment"].content_type == "image/jpeg"
+    assert received["data"] == image
@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+from signalhub.queue import Spool, _import_legacy, open_spool, persist_failed_send
+
+class DummyEnvelope:
+    def __init__(self, rcpt_tos, content):
+        self.rcpt_tos = rcpt_tos
+        self.content = content
+        self.mail_from = "from@x"
+
+def test_lease_ack_nack(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"))
+    first = spool.enqueue(["a@x"], "from@x", b"raw", {"prio": "1"}, title="T", user_key="U")
+    second = spool.enqueue(["b@x"], "from@x", b"raw", {})
+    leased = spool.lease(limit=10)
+    assert [r["id"] for r in leased] == [first, second]
+    assert leased[0]["directives"] == {"prio": "1"}
+    assert leased[0]["title"] == "T"
+    # Leased records are not handed out twice
+    assert spool.lease(limit=10) == []
+    spool.ack(first)
+    spool.nack(second, time.time() + 60, "timeout")
+    assert spool.lease(limit=10) == []
+    later = spool.lease(limit=10, now=time.time() + 61)
+    assert [(r["id"], r["attempts"], r["last_error"]) for r in later] == [(second, 1, "timeout")]
+    assert spool.pending_count() == 1
+
+def test_spool_survives_reopen(tmp_path):
+    path = str(tmp_path / "spool.db")
+    spool = Spool(path)
+    spool.enqueue(["a@x"], "from@x", b"raw", {})
+    spool.close()
+    reopened = Spool(path)
+    assert [r["rcpt_tos"] for r in reopened.lease()] == [["a@x"]]
+    reopened.compact()
+
+def test_lease_range_walks_ids_regardless_of_due_time(tmp_path):
+    qdir = str(tmp_path / "q")
+    ids = [persist_failed_send(qdir, DummyEnvelope([f"{n}@x"], b"Subject: a\n\nb"), {},
+                               next_attempt_at=time.time() + 3600) for n in range(5)]
+    spool = open_spool(qdir)
+    assert spool.lease() == []
+    spool.lease(ids=[ids[1]], now=time.time() + 3601)  # held elsewhere
+    first = spool.lease_range(0, ids[3], limit=2)
+    assert [r["id"] for r in first] == [ids[0], ids[2]]
+    assert [r["id"] for r in spool.lease_range(ids[2], ids[3])] == [ids[3]]
+    assert spool.count_range(0, ids[3]) == 4 and spool.last_id() == ids[4]
+
+def test_legacy_jsonl_is_imported(tmp_path):
+    qdir = tmp_path / "legacy"
+    qdir.mkdir()
+    (qdir / "queue.jsonl").write_text(json.dumps({
+        "timestamp": 0, "rcpt_tos": ["a@x"], "mail_from": "f@x",
+        "content": "Subject: old\n\nbody", "directives": {},
+    }) + "\n")
+    spool = open_spool(str(qdir))
+    assert [r["content"] for r in spool.lease()] == [b"Subject: old\n\nbody"]
+    assert (qdir / "queue.jsonl.imported").exists()
+
+def test_legacy_jsonl_is_imported_once_by_concurrent_workers(tmp_path):
+    line = json.dumps({"rcpt_tos": ["a@x"], "content": "Subject: old\n\nbody"}) + "\n"
+    (tmp_path / "queue.jsonl").write_text(line * 500)
+    path = str(tmp_path / "spool.db")
+    spools = [Spool(path, sync_interval=60), Spool(path, sync_interval=60)]
+    start = threading.Barrier(2)
+
+    def worker(spool):
+        start.wait()
+        _import_legacy(str(tmp_path), spool)
+
+    threads = [threading.Thread(target=worker, args=(spool,)) for spool in spools]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert spools[0].pending_count() == 500
+    assert [p.name for p in tmp_path.glob("queue.jsonl*")] == ["queue.jsonl.imported"]
+
+def test_content_is_compressed_and_image_location_kept(tmp_path):
+    from signalhub.mimeparse import ImagePart
+    spool = Spool(str(tmp_path / "spool.db"))
+    raw = b"Subject: cam\n\n" + b"motion detected on front door\n" * 100
+    part = ImagePart(raw, 20, 80, "image/jpeg", "snap.jpg", "base64")
+    spool.enqueue(["a@x"], "from@x", raw, {}, title="cam", image=part)
+    spool.enqueue(["b@x"], "from@x", raw, {}, title="cam", image=None)
+    spool.enqueue(["c@x"], "from@x", b"short", {})
+    stored = spool._conn.execute("SELECT codec, length(content) FROM spool ORDER BY id").fetchall()
+    assert stored[0][0] == "zlib" and stored[0][1] < len(raw) // 10
+    assert stored[2] == (None, 5)
+    first, second, third = spool.lease(limit=10)
+    assert first["content"] == raw and "codec" not in first
+    assert first["image"] == part
+    assert second["image"] is None
+    # Not recorded: the reader has to look for it itself
+    assert third["content"] == b"short" and third["image"] is False
@@ -0,0 +1,116 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+from sqlmodel import SQLModel, Session, create_engine, select
+from signalhub.api import db as api_db
+from signalhub.api.models import QueueRecord
+from signalhub.api.routes.queue import list_queue, queue_stats
+from signalhub.config import Config
+from signalhub.handler import Handler
+from signalhub.pushover import PERMANENT, RETRY, PushoverResponse
+from signalhub.queuestate import DELIVERED, FAILED, REJECTED, RETRYING, QueueRecorder
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    eng = create_engine(f"sqlite:///{tmp_path / 'admin.db'}")
+    SQLModel.metadata.create_all(eng)
+    monkeypatch.setattr(api_db, "ENGINE", eng)
+    return eng
+
+def rows(engine):
+    with Session(engine) as s:
+        return list(s.exec(select(QueueRecord).order_by(QueueRecord.id)))
+
+def test_updates_are_merged_and_upserted(engine):
+    recorder = QueueRecorder(engine, flush_interval=60)
+    recorder.record("m1", "a@x", "Disk full", RETRYING, 1, time.time() + 60, "HTTP 500", spool_id=7)
+    recorder.record("m1", "a@x", "Disk full", RETRYING, 2, time.time() + 120, "HTTP 502", spool_id=7)
+    recorder.record("m2", "b@x", "Backup", RETRYING, 1, time.time() + 60, "timeout")
+    recorder.flush()
+    first = rows(engine)
+    assert [(r.msg_id, r.attempts, r.status) for r in first] == [("m1", 2, RETRYING), ("m2", 1, RETRYING)]
+    assert first[0].last_error == "HTTP 502" and first[0].spool_id == 7 and first[0].next_attempt_at
+    recorder.record("m1", "a@x", "Disk full", DELIVERED, 3)
+    recorder.close()
+    again = rows(engine)
+    assert len(again) == 2
+    assert (again[0].status, again[0].attempts, again[0].next_attempt_at) == (DELIVERED, 3, None)
+    assert again[0].timestamp == first[0].timestamp
+
+def test_pending_changes_are_bounded(engine):
+    recorder = QueueRecorder(engine, flush_interval=60, max_pending=2)
+    for n in range(4):
+        recorder.record(f"m{n}", "a@x", "T", RETRYING)
+    recorder.record("m0", "a@x", "T", FAILED)  # known message, still merged
+    recorder.close()
+    assert recorder.dropped == 2
+    assert [(r.msg_id, r.status) for r in rows(engine)] == [("m0", FAILED), ("m1", RETRYING)]
+
+def test_failed_flush_counts_dropped_rows(tmp_path):
+    recorder = QueueRecorder(create_engine(f"sqlite:///{tmp_path / 'missing.db'}"), flush_interval=60)
+    recorder.record("m1", "a@x", "T", RETRYING)
+    recorder.record("m2", "a@x", "T", RETRYING)
+    recorder.close()  # no QueueRecord table
+    assert recorder.dropped == 2
+
+def test_queue_api_pages_by_cursor(engine):
+    recorder = QueueRecorder(engine)
+    for n in range(7):
+        recorder.record(f"m{n}", "a@x", f"alert {n}", FAILED if n % 2 else DELIVERED, 1)
+    recorder.close()
+    params = dict(status=None, rcpt_to=None, since=None, until=None, user=None)
+    page = list_queue(before=None, limit=3, **params)
+    assert [r.subject for r in page["items"]] == ["alert 6", "alert 5", "alert 4"]
+    page = list_queue(before=page["next_cursor"], limit=3, **params)
+    assert [r.subject for r in page["items"]] == ["alert 3", "alert 2", "alert 1"]
+    last = list_queue(before=page["next_cursor"], limit=3, **params)
+    assert [r.subject for r in last["items"]] == ["alert 0"] and last["next_cursor"] is None
+    failed = list_queue(before=None, limit=50, **{**params, "status": FAILED})
+    assert [r.subject for r in failed["items"]] == ["alert 5", "alert 3", "alert 1"]
+    assert queue_stats(user=None) == {DELIVERED: 4, FAILED: 3}
+
+@pytest.mark.asyncio
+async def test_failed_send_is_recorded(engine):
+    async def post(*args, **kwargs):
+        return PushoverResponse(False, 500, "server error", RETRY)
+
+    class Envelope:
+        rcpt_tos = ["alerts@home.local"]
+        mail_from = "nas@home.local"
+        content = b"Subject: Disk full\n\nvolume1 at 99%"
+
+    h = Handler(Config(default_user_key="U0"))
+    h.queue_records.engine = engine
+    h.pushover.post = post
+    assert (await h.handle_DATA(None, None, Envelope())).startswith("250")
+    await asyncio.wait_for(h.delivery.join(), 2)
+    await h.stop()
+    [record] = rows(engine)
+    assert (record.status, record.attempts, record.rcpt_to, record.subject) == (
+        RETRYING, 1, "alerts@home.local", "Disk full")
+    assert record.last_error == "server error" and record.next_attempt_at
+
+@pytest.mark.asyncio
+async def test_fanned_out_deliveries_get_their_own_rows(engine, tmp_path):
+    async def post(*args, **kwargs):
+        return PushoverResponse(False, 400, "invalid user", PERMANENT)
+
+    class Envelope:
+        rcpt_tos = ["critical@home.local"]
+        mail_from = "nas@home.local"
+        content = b"Subject: UPS on battery\n\nruntime 12 min"
+
+    mappings = [SimpleNamespace(rcpt_pattern="critical@home.local", user_key=key, device=device)
+                for key, device in (("UADMIN", "oncall"), ("UFAMILY", None))]
+    h = Handler(Config(queue_dir=str(tmp_path), max_retries=3), mappings=mappings)
+    h.queue_records.engine = engine
+    h.pushover.post = post
+    assert (await h.handle_DATA(None, None, Envelope())).startswith("250")
+    await asyncio.wait_for(h.delivery.join(), 2)
+    await h.stop()
+    records = rows(engine)
+    assert sorted(r.msg_id.split(":", 1)[1] for r in records) == ["UADMIN:oncall", "UFAMILY"]
+    # The spool marks them exhausted; the record keeps the real attempt count
+    assert [(r.status, r.attempts) for r in records] == [(REJECTED, 1), (REJECTED, 1)]
+    assert all(r.spool_id for r in records)
@@ -0,0 +1,58 @@
+import calendar
+from signalhub.ratelimit import BucketMap, QuotaGuard, RateLimiter, TokenBucket
+
+def test_token_bucket_refills_over_time():
+    b = TokenBucket(60, burst=2, now=0)
+    assert b.refill(0) == 2
+    b.tokens = 0
+    assert b.refill(0.5) == 0.5
+    assert b.refill(10) == 2
+
+def test_noisy_sender_does_not_starve_others():
+    rl = RateLimiter(100, per_sender=2)
+    nas = ("10.0.0.5", "nas@home")
+    assert rl.allow("U1", nas, now=0)
+    assert rl.allow("U1", nas, now=0)
+    assert rl.check("U1", nas, now=0) == "sender"
+    assert rl.allow("U1", ("10.0.0.6", "cam@home"), now=0)
+    # Refused messages did not take global tokens
+    assert rl.global_bucket.tokens == 97
+
+def test_per_recipient_limit():
+    rl = RateLimiter(0, per_recipient=1)
+    assert rl.allow("U1", now=0)
+    assert not rl.allow("U1", now=0)
+    assert rl.allow("U2", now=0)
+    assert rl.allow("U1", now=60)
+
+def test_reservations_queue_behind_each_other():
+    rl = RateLimiter(60, per_recipient=30)
+    rl.global_bucket = TokenBucket(60, burst=1, now=0)
+    assert rl.reserve("U1", now=0) == 0
+    assert rl.reserve("U1", now=0) == 1  # global: one token a second
+    assert rl.reserve("U1", now=0) == 2
+    assert not rl.allow("U2", now=2.5)
+
+def test_idle_buckets_are_evicted():
+    m = BucketMap(60, max_keys=3)
+    for n in range(3):
+        m.get(n, now=0).tokens = 0
+    m.get("new", now=0)
+    assert len(m.buckets) == 3 and 0 not in m.buckets
+    # Buckets that have fully refilled carry no state and are dropped
+    m.get("later", now=120)
+    assert list(m.buckets) == ["later"]
+
+def test_quota_guard_keeps_reserve_for_urgent_alerts():
+    now = calendar.timegm((2026, 3, 15, 0, 0, 0))
+    q = QuotaGuard(monthly_limit=10, reserve=2)
+    q.reset_at = calendar.timegm((2026, 4, 1, 0, 0, 0))
+    for _ in range(8):
+        assert q.allow(now=now)
+        q.record_sent(now=now)
+    assert not q.allow(now=now)
+    assert q.allow(priority="1", now=now)
+    q.update(0)
+    assert not q.allow(priority="2", now=now)
+    assert q.allow(now=q.reset_at)
+    assert q.reset_at == calendar.timegm((2026, 5, 1, 0, 0, 0))
@@ -0,0 +1,120 @@
+import asyncio
+import time
+import pytest
+from signalhub.pushover import OK, PERMANENT, QUOTA, PushoverResponse
+from signalhub.queue import Spool, open_spool
+from signalhub.replay import DONE, QUOTA_EXHAUSTED, RUNNING, ReplayEngine, ReplayJob
+
+def fill(spool, users):
+    return [spool.enqueue([f"{u}@x"], "f@x", b"raw", {}, title="T", message="M", user_key=u,
+                          next_attempt_at=time.time() + 3600) for u in users]
+
+def engine(spool, send, **kwargs):
+    kwargs.setdefault("rate_per_minute", 0)
+    return ReplayEngine(spool, lambda record: record, send, **kwargs)
+
+@pytest.mark.asyncio
+async def test_replay_acks_delivered_and_keeps_failures(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"))
+    ids = fill(spool, ["ok"] * 5 + ["bad"])
+    active, peak = 0, 0
+
+    async def send(record):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if record["user_key"] == "bad":
+            return PushoverResponse(False, 400, '{"errors":["user identifier is invalid"]}', PERMANENT)
+        return PushoverResponse(True, 200, '{"status":1}', OK)
+
+    replayer = engine(spool, send, concurrency=2, batch_size=4)
+    job = replayer.start()
+    await replayer.wait()
+    assert (job.status, job.sent, job.rejected, job.checkpoint) == (DONE, 5, 1, ids[-1])
+    assert peak == 2
+    # The rejected row is dropped, so later runs do not send it again
+    assert spool.pending_count() == 0
+    stored = spool.replay_jobs(job.id)[0]
+    assert stored["status"] == DONE and stored["sent"] == 5 and stored["finished_at"]
+    assert replayer.progress(job.id)["remaining"] == 0
+
+@pytest.mark.asyncio
+async def test_replay_stops_at_quota_and_releases_the_rest(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"))
+    fill(spool, ["u"] * 6)
+    calls = []
+
+    async def send(record):
+        calls.append(record["id"])
+        if len(calls) == 3:
+            return PushoverResponse(False, 429, "", QUOTA)
+        return PushoverResponse(True, 200, '{"status":1}', OK)
+
+    replayer = engine(spool, send, concurrency=1)
+    job = replayer.start()
+    await replayer.wait()
+    assert (job.status, job.sent, len(calls)) == (QUOTA_EXHAUSTED, 2, 3)
+    assert len(spool.lease_range(0, job.upto_id)) == 4
+
+@pytest.mark.asyncio
+async def test_replay_is_rate_limited(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"))
+    fill(spool, ["u"] * 4)
+
+    async def send(record):
+        return PushoverResponse(True, 200, '{"status":1}', OK)
+
+    # burst of 2, then one send every 0.1 s
+    replayer = engine(spool, send, concurrency=2, rate_per_minute=600)
+    started = time.monotonic()
+    replayer.start()
+    await replayer.wait()
+    assert time.monotonic() - started >= 0.18
+
+@pytest.mark.asyncio
+async def test_interrupted_replay_resumes_from_checkpoint(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"))
+    ids = fill(spool, ["u"] * 4)
+    crashed = ReplayJob(upto_id=ids[-1], total=4, checkpoint=ids[1], sent=2, updated_at=time.time() - 120)
+    crashed.id = spool.save_replay(crashed.__dict__)
+    sent = []
+
+    async def send(record):
+        sent.append(record["id"])
+        return PushoverResponse(True, 200, '{"status":1}', OK)
+
+    replayer = engine(spool, send)
+    job = replayer.resume()
+    assert job.id == crashed.id and job.status == RUNNING
+    await replayer.wait()
+    assert sent == ids[2:]
+    assert (job.status, job.sent) == (DONE, 4)
+    assert engine(spool, send).resume() is None
+
+@pytest.mark.asyncio
+async def test_api_resumes_from_configured_queue_dir_and_stops_handler(tmp_path, monkeypatch):
+    from signalhub import config as config_module
+    from signalhub.api.routes import queue as routes
+    from signalhub.config import Config
+    qdir = str(tmp_path / "configured")
+    monkeypatch.setattr(config_module, "load_config", lambda: Config(queue_dir=qdir, queue_records=False))
+    monkeypatch.setenv("QUEUE_DIR", str(tmp_path / "elsewhere"))
+    spool = open_spool(qdir)
+    crashed = ReplayJob(upto_id=0, total=0, updated_at=time.time() - 120)
+    spool.save_replay(crashed.__dict__)
+    await routes.resume_replay()
+    engine = routes._engine
+    assert engine is not None and engine.spool is spool
+    await engine.wait()
+    handler, stopped = routes._handler, []
+    real_stop = handler.stop
+
+    async def stop():
+        stopped.append(True)
+        await real_stop()
+
+    handler.stop = stop
+    await routes.stop_replay()
+    assert stopped and routes._engine is None
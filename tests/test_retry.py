@@ -0,0 +1,180 @@
+import asyncio
+import time
+import pytest
+from signalhub.config import Config
+from signalhub.delivery import DeliveryJob
+from signalhub.handler import Handler
+from signalhub.queue import Spool
+from signalhub.retry import RetryScheduler, backoff_delay
+from signalhub.pushover import OK, PERMANENT, QUOTA, RETRY, PushoverResponse, classify
+
+class DummyEnvelope:
+    def __init__(self, rcpt_tos, content):
+        self.rcpt_tos = rcpt_tos
+        self.content = content
+        self.mail_from = "from@x"
+
+class DummySession:
+    peer = ("127.0.0.1", 12345)
+
+def test_backoff_delay_is_jittered_and_capped():
+    assert backoff_delay(1, 10, rand=lambda: 0) == 5
+    assert backoff_delay(1, 10, rand=lambda: 1) == 10
+    assert backoff_delay(3, 10, rand=lambda: 1) == 40
+    assert backoff_delay(30, 10, cap=60, rand=lambda: 1) == 60
+
+@pytest.mark.asyncio
+async def test_scheduler_fires_in_due_order():
+    fired = []
+    sched = RetryScheduler(lambda job: fired.append(job.title) or True)
+    sched.start()
+    now = time.time()
+    for title, delay in [("late", 0.06), ("early", 0.02), ("mid", 0.04)]:
+        job = DeliveryJob(rcpt_to="a@x", title=title, message="m", directives={}, user_key="U")
+        await sched.schedule(job, now + delay)
+    await asyncio.sleep(0.15)
+    await sched.stop()
+    assert fired == ["early", "mid", "late"]
+    assert len(sched) == 0
+
+@pytest.mark.asyncio
+async def test_ids_held_elsewhere_are_rescheduled(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"))
+    fired = []
+    sched = RetryScheduler(lambda job: fired.append(job) or True, spool=spool,
+                           job_from_record=lambda record: record)
+    now = time.time()
+    held, gone = (spool.enqueue(["a@x"], "f@x", b"raw", {}, next_attempt_at=now) for _ in range(2))
+    sched._push(now, held)
+    sched._push(now, gone)
+    # a manual replay leased one row, failed and pushed it back; the other was delivered
+    spool.lease_range(0, gone)
+    spool.nack(held, now + 60, "down")
+    spool.ack(gone)
+    await sched._fire_due()
+    assert fired == []
+    [(due, _, entry)] = sched._heap
+    assert entry == held and due == pytest.approx(now + 60)
+
+@pytest.mark.asyncio
+async def test_spool_is_synced_on_a_timer_and_compacted_when_drained(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"), sync_interval=0.01)
+    calls = []
+    spool.sync = lambda: calls.append("sync")
+    spool.compact = lambda: calls.append("compact")
+    fired = []
+    sched = RetryScheduler(lambda job: fired.append(job["id"]) or True, spool=spool,
+                           job_from_record=lambda record: record)
+    record_id = spool.enqueue(["a@x"], "f@x", b"raw", {}, next_attempt_at=time.time() + 0.05)
+    sched.start()
+    await asyncio.sleep(0.15)
+    await sched.stop()
+    assert fired == [record_id]
+    assert calls[0] == "sync" and calls.count("compact") == 1
+    assert calls[-1] == "sync"  # idle again, but nothing new to compact
+
+@pytest.mark.asyncio
+async def test_failed_push_is_retried_from_spool(tmp_path):
+    h = Handler(Config(queue_dir=str(tmp_path), retry_delay=0.02, max_retries=3))
+    results = [(False, 500, "down"), (False, 0, "timeout"), (True, 200, '{"status":1}')]
+
+    async def send(*args, **kwargs):
+        ok, status, body = results.pop(0)
+        return PushoverResponse(ok, status, body, classify(status, body))
+
+    h.pushover.post = send
+    await h.start()
+    env = DummyEnvelope(["a@x"], b"Subject: UPS on battery\n\nload 40%")
+    assert (await h.handle_DATA(None, DummySession(), env)).startswith("250")
+    for _ in range(50):
+        if h.metrics['pushed_ok']:
+            break
+        await asyncio.sleep(0.02)
+    await h.stop()
+    assert h.metrics['pushed_ok'] == 1
+    assert h.metrics['retries_scheduled'] == 2
+    assert h.spool.pending_count() == 0
+
+@pytest.mark.asyncio
+async def test_exhausted_job_stays_spooled(tmp_path):
+    h = Handler(Config(queue_dir=str(tmp_path), retry_delay=0.01, max_retries=1))
+
+    async def send(*args, **kwargs):
+        return PushoverResponse(False, 500, "down", RETRY)
+
+    h.pushover.post = send
+    await h.start()
+    env = DummyEnvelope(["a@x"], b"Subject: fan failure\n\nfan 2")
+    await h.handle_DATA(None, DummySession(), env)
+    for _ in range(50):
+        if h.metrics['pushed_failed']:
+            break
+        await asyncio.sleep(0.02)
+    await h.stop()
+    assert h.metrics['pushed_failed'] == 1
+    assert [id_ for id_, _ in h.spool.due_entries()] != []
+    assert h.spool.due_entries(max_attempts=1) == []
+
+@pytest.mark.asyncio
+async def test_rejected_push_is_not_retried(tmp_path):
+    h = Handler(Config(queue_dir=str(tmp_path), retry_delay=0.01, max_retries=3))
+    calls = []
+
+    async def send(*args, **kwargs):
+        calls.append(args)
+        return PushoverResponse(False, 400, '{"status":0,"errors":["user identifier is invalid"]}', PERMANENT)
+
+    h.pushover.post = send
+    await h.start()
+    await h.handle_DATA(None, DummySession(), DummyEnvelope(["a@x"], b"Subject: disk\n\nsda"))
+    await asyncio.wait_for(h.delivery.join(), 2)
+    await h.stop()
+    assert len(calls) == 1
+    assert h.metrics['pushed_rejected'] == 1 and h.metrics['retries_scheduled'] == 0
+    # Kept for inspection but not resumed on the next start
+    assert h.spool.pending_count() == 1
+    assert h.spool.due_entries(max_attempts=3) == []
+
+@pytest.mark.asyncio
+async def test_quota_headers_and_429(tmp_path):
+    h = Handler(Config(queue_dir=str(tmp_path), retry_delay=0.01))
+    responses = [
+        PushoverResponse(True, 200, '{"status":1}', OK, 10000, 7496, 1893456000),
+        PushoverResponse(False, 429, '{"status":0}', QUOTA, 10000, 0, 1893456000),
+    ]
+
+    async def send(*args, **kwargs):
+        return responses.pop(0)
+
+    h.pushover.post = send
+    await h.start()
+    await h.handle_DATA(None, DummySession(), DummyEnvelope(["a@x"], b"Subject: one\n\n1"))
+    await asyncio.wait_for(h.delivery.join(), 2)
+    assert h.quota.remaining == 7496 and h.quota.reset_at == 1893456000
+    await h.handle_DATA(None, DummySession(), DummyEnvelope(["a@x"], b"Subject: two\n\n2"))
+    await asyncio.wait_for(h.delivery.join(), 2)
+    await h.stop()
+    assert h.quota.remaining == 0
+    assert h.metrics['quota_deferred'] == 1 and h.metrics['pushed_failed'] == 0
+    [(record_id, due)] = h.spool.due_entries()
+    assert due == 1893456000
+
+@pytest.mark.asyncio
+async def test_spool_writes_do_not_block_the_event_loop(tmp_path):
+    async def post(*args, **kwargs):
+        return PushoverResponse(False, 500, "down", RETRY)
+
+    h = Handler(Config(queue_dir=str(tmp_path), retry_delay=60))
+    h.pushover.post = post
+    job = DeliveryJob(rcpt_to="a@x", title="t", message="m", directives={}, user_key="U")
+    h.spool._lock.acquire()  # as if another worker held the write lock
+    send = asyncio.create_task(h._send(job, None))
+    ticks = 0
+    while not send.done() and ticks < 5:
+        await asyncio.sleep(0.01)
+        ticks += 1
+    assert ticks == 5 and not send.done()
+    h.spool._lock.release()
+    await asyncio.wait_for(send, 2)
+    assert job.spool_id is not None and len(h.retries) == 1
+    await h.stop()
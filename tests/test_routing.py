@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+from sqlmodel import SQLModel, Session, create_engine, select
+from signalhub.api import db as api_db
+from signalhub.api.models import Mapping
+from signalhub.config import Config
+from signalhub.handler import Handler
+from signalhub.routing import MappingWatcher, Route, Router
+
+def mapping(pattern, user_key, device=None):
+    return SimpleNamespace(rcpt_pattern=pattern, user_key=user_key, device=device)
+
+def make_router():
+    cfg = Config(recipient_map={"alerts@home.local": "U1", "empty@home.local": ""}, default_user_key="U0")
+    return Router.from_config(cfg, [
+        mapping("*@home.local", "UHOME"),
+        mapping("*@cams.home.local", "UCAM", "ipad"),
+        mapping("unifi-*", "UNET"),
+        mapping("nas?@*", "UNAS"),
+        mapping("re:ups-\\d+@.*", "UUPS"),
+        mapping("critical@home.local", "UADMIN", "oncall"),
+        mapping("critical@home.local", "UFAMILY"),
+    ])
+
+def test_exact_beats_patterns():
+    r = make_router()
+    assert r.route("ALERTS@home.local") == (Route("U1"),)
+    assert r.route("empty@home.local") == (Route("U0"),)
+
+def test_longest_suffix_and_prefix():
+    r = make_router()
+    assert r.route("door@cams.home.local") == (Route("UCAM", "ipad"),)
+    assert r.route("door@home.local") == (Route("UHOME"),)
+    assert r.route("unifi-ap1@lan") == (Route("UNET"),)
+
+def test_globs_and_regex():
+    r = make_router()
+    assert r.route("nas1@lan") == (Route("UNAS"),)
+    assert r.route("ups-12@lan") == (Route("UUPS"),)
+    assert r.route("ups-x@lan") == (Route("U0"),)
+    assert r.route(None) == (Route("U0"),)
+
+def test_fan_out():
+    r = make_router()
+    assert r.route("critical@home.local") == (Route("UADMIN", "oncall"), Route("UFAMILY"))
+
+def test_handler_uses_mappings():
+    h = Handler(Config(default_user_key="U0"), mappings=[mapping("*@cams.local", "UCAM")])
+    assert h._route_recipient("front@cams.local") == "UCAM"
+    assert h._route_recipient("x@y") == "U0"
+
+def test_regexes_that_cannot_be_combined_still_route():
+    r = Router([
+        ("re:nas-\\d+@.*", Route("UNAS")),
+        ("re:(?i)cam.*@x", Route("UCAM")),
+        ("re:(a)\\1@x", Route("UAA")),
+        ("re:b(c)(d)\\2@.*", Route("UBCD")),
+        ("re:.*@x", Route("UX")),
+        ("re:([unclosed", Route("UBAD")),
+    ], default=Route("U0"))
+    assert r.route("nas-3@lan") == (Route("UNAS"),)
+    assert r.route("Cam1@x") == (Route("UCAM"),)
+    assert r.route("aa@x") == (Route("UAA"),)
+    assert r.route("bcdd@lan") == (Route("UBCD"),)
+    # first defined rule still wins across segments
+    assert r.route("ab@x") == (Route("UX"),)
+    assert r.match("zz@y")[0] == "default"
+
+def test_mapping_edits_are_swapped_into_the_handler(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'admin.db'}")
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(api_db, "ENGINE", engine)
+    h = Handler(Config(default_user_key="U0"))
+    watcher = MappingWatcher(lambda: h.config, h.update_mappings, mappings=h.mappings)
+    assert not watcher.poll()
+    with Session(engine) as s:
+        s.add(Mapping(rcpt_pattern="*@cams.home.local", user_key="UCAM"))
+        s.commit()
+    assert watcher.poll()
+    assert h.router.route("door@cams.home.local") == (Route("UCAM"),)
+    with Session(engine) as s:
+        row = s.exec(select(Mapping)).one()
+        row.user_key = "UCAM2"
+        s.add(row)
+        s.commit()
+    assert watcher.poll() and not watcher.poll()
+    assert h.router.route("door@cams.home.local") == (Route("UCAM2"),)
+    h.update_config(Config(default_user_key="U9"))  # keeps the edited mappings
+    assert h.router.route("door@cams.home.local") == (Route("UCAM2"),)
+    assert h.router.route("other@lan") == (Route("U9"),)
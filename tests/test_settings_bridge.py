@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlmodel import SQLModel, Session, create_engine
+from signalhub import settings_bridge
+from signalhub.api.models import Setting
+from signalhub.config import Config, apply_settings
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    eng = create_engine(f"sqlite:///{tmp_path / 'settings.db'}")
+    SQLModel.metadata.create_all(eng)
+    monkeypatch.setattr(settings_bridge, "engine", eng)
+    monkeypatch.setattr(settings_bridge, "_snapshot", None)
+    monkeypatch.setattr(settings_bridge, "_listeners", [])
+    return eng
+
+def put(engine, key, value, updated_at=None):
+    with Session(engine) as s:
+        s.merge(Setting(key=key, value=value, updated_at=updated_at or datetime.utcnow()))
+        s.commit()
+
+def test_lookups_are_served_from_snapshot(engine, monkeypatch):
+    put(engine, "pushover.api_token", "TKN")
+    put(engine, "app.max_retries", "5")
+    assert settings_bridge.get_pushover_config()["token"] == "TKN"
+
+    def no_db(*args, **kwargs):
+        raise AssertionError("database touched on lookup")
+
+    monkeypatch.setattr(settings_bridge, "Session", no_db)
+    assert settings_bridge.get_setting("MAX_RETRIES") == "5"
+    assert settings_bridge.get_db_settings()["max_retries"] == 5
+
+def test_refresh_only_on_watermark_change(engine):
+    put(engine, "pushover.api_token", "OLD")
+    seen = []
+    settings_bridge.subscribe(lambda snap: seen.append(snap.get("pushover.api_token")))
+    assert settings_bridge.current_settings().get("pushover.api_token") == "OLD"
+    assert not settings_bridge.refresh_settings()
+    put(engine, "pushover.api_token", "NEW", datetime.utcnow() + timedelta(seconds=1))
+    assert settings_bridge.refresh_settings()
+    assert settings_bridge.get_setting("PUSHOVER_TOKEN") == "NEW"
+    assert seen == ["OLD", "NEW"]
+
+def test_apply_settings_copies_config():
+    cfg = Config(pushover_token="a", max_retries=3)
+    snap = settings_bridge.SettingsSnapshot({"pushover.api_token": "b", "app.max_retries": "7"})
+    new = apply_settings(cfg, snap)
+    assert (new.pushover_token, new.max_retries) == ("b", 7)
+    assert cfg.pushover_token == "a"
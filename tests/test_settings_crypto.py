@@ -0,0 +1,54 @@
+import pytest
+from cryptography.fernet import Fernet
+from sqlmodel import SQLModel, Session, create_engine, select
+from signalhub.api import settings_crypto
+from signalhub.api.models import Setting
+
+@pytest.fixture(autouse=True)
+def fresh_manager():
+    settings_crypto.reset_key_manager()
+    yield
+    settings_crypto.reset_key_manager()
+
+def test_manager_is_created_once(monkeypatch):
+    monkeypatch.delenv("SETTINGS_ENCRYPTION_KEY", raising=False)
+    token = settings_crypto.encrypt_value("secret")
+    # An unset key used to produce a new random key on every call
+    assert settings_crypto.decrypt_value(token) == "secret"
+    assert settings_crypto.get_key_manager() is settings_crypto.get_key_manager()
+
+def test_decrypt_is_cached(monkeypatch):
+    monkeypatch.setenv("SETTINGS_ENCRYPTION_KEY", Fernet.generate_key().decode())
+    manager = settings_crypto.get_key_manager()
+    token = manager.encrypt("secret")
+    calls = []
+    real = manager.fernet.decrypt
+    monkeypatch.setattr(manager.fernet, "decrypt", lambda t: calls.append(t) or real(t))
+    assert [manager.decrypt(token) for _ in range(3)] == ["secret"] * 3
+    assert len(calls) == 1
+
+def test_cache_is_bounded():
+    manager = settings_crypto.KeyManager([Fernet.generate_key()], cache_size=2)
+    for n in range(5):
+        manager.decrypt(manager.encrypt(str(n)))
+    assert len(manager._cache) == 2
+
+def test_rotate_settings(monkeypatch, tmp_path):
+    old, new = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+    monkeypatch.setenv("SETTINGS_ENCRYPTION_KEY", old)
+    engine = create_engine(f"sqlite:///{tmp_path / 'rotate.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as s:
+        settings_crypto.set_setting(s, "pushover.api_token", "TKN", encrypt=True)
+        settings_crypto.set_setting(s, "app.queue_dir", "/queue")
+
+    monkeypatch.setenv("SETTINGS_ENCRYPTION_KEY", f"{new},{old}")
+    settings_crypto.reset_key_manager()
+    with Session(engine) as s:
+        assert settings_crypto.rotate_settings(s) == 1
+
+    monkeypatch.setenv("SETTINGS_ENCRYPTION_KEY", new)
+    settings_crypto.reset_key_manager()
+    with Session(engine) as s:
+        assert settings_crypto.get_setting(s, "pushover.api_token") == "TKN"
+        assert s.exec(select(Setting).where(Setting.key == "app.queue_dir")).one().value == "/queue"
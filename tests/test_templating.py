@@ -0,0 +1,41 @@
+import pytest
+from types import SimpleNamespace
+from datetime import datetime
+from signalhub.config import Config
+from signalhub.handler import Handler
+from signalhub.templating import Fields, TemplateCache, compile_template
+
+def template(id, content, title=None, updated_at=datetime(2024, 5, 1)):
+    return SimpleNamespace(id=id, content=content, title=title, updated_at=updated_at)
+
+def test_compile_placeholders():
+    render = compile_template("{{ subject }} on {{recipient}}: {body} {{missing}}!")
+    assert render(Fields(subject="Disk", recipient="nas@lan", body="full")) == "Disk on nas@lan: {body} !"
+    assert compile_template("static")(Fields()) == "static"
+
+def test_cache_recompiles_only_changed_versions():
+    cache = TemplateCache([template(1, "a {{body}}"), template(2, "b")])
+    first = cache.get(1)
+    cache.refresh([template(1, "a {{body}}"), template(2, "b2", updated_at=datetime(2024, 5, 2))])
+    assert cache.get(1) is first
+    assert cache.render(2, Fields()) == (None, "b2")
+    cache.refresh([template(2, "b2", updated_at=datetime(2024, 5, 2))])
+    assert cache.get(1) is None
+    assert cache.render(1, Fields()) is None
+
+@pytest.mark.asyncio
+async def test_handler_renders_mapping_template():
+    class Envelope:
+        rcpt_tos = ["cam@home.local"]
+        mail_from = "nvr@home.local"
+        content = b"Subject: Motion [PRIO=1]\n\nFront door"
+    h = Handler(
+        Config(default_user_key="U0"),
+        mappings=[SimpleNamespace(rcpt_pattern="cam@home.local", user_key="UCAM", device=None, template_id=7)],
+        templates=[template(7, "{{body}} ({{sender}}, prio {{prio}})", title="Camera: {{subject}}")],
+    )
+    jobs = []
+    h.delivery.submit = lambda job: jobs.append(job) or True
+    assert (await h.handle_DATA(None, None, Envelope())).startswith("250")
+    assert jobs[0].title == "Camera: Motion [PRIO=1]"
+    assert jobs[0].message == "Front door (nvr@home.local, prio 1)"
@@ -0,0 +1,87 @@
+import json
+import pytest
+from signalhub.config import Config
+from signalhub.handler import Handler
+from signalhub.queue import open_spool
+from signalhub.tracing import FileExporter, NoopTracer, OTLPHttpExporter, Tracer, tracer_from_config
+from signalhub.pushover import OK, PushoverResponse
+
+class Envelope:
+    rcpt_tos = ["alerts@home.local"]
+    mail_from = "nas@home.local"
+    content = b"Subject: Disk\n\nfull"
+
+def test_tracing_off_by_default():
+    tracer = tracer_from_config(Config())
+    assert isinstance(tracer, NoopTracer)
+    assert not tracer.sampled()
+    with tracer.span("parse", "abc") as span:
+        span.set("ignored", 1)
+    assert span.span_id is None
+
+@pytest.mark.asyncio
+async def test_message_spans_written_to_file(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(FileExporter(str(path)))
+    h = Handler(Config(recipient_map={"alerts@home.local": "U1"}, default_user_key="U0"), tracer=tracer)
+
+    async def send(*args, **kwargs):
+        return PushoverResponse(True, 200, '{"status":1}', OK)
+    h.pushover.post = send
+    jobs = []
+    h.delivery.submit = lambda job: jobs.append(job) or True
+    assert (await h.handle_DATA(None, None, Envelope())).startswith("250")
+    await h._deliver(jobs[0])
+    await h.stop()
+    assert tracer.exporter._file.closed
+
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    by_name = {s["name"]: s for s in spans}
+    assert set(by_name) == {"smtp.data", "parse", "dedup", "route", "rate_limit", "enqueue", "pushover.send"}
+    root = by_name["smtp.data"]
+    assert root["traceId"] == jobs[0].trace_id
+    assert root["attributes"]["smtp.reply"] == "250"
+    assert {s["traceId"] for s in spans} == {root["traceId"]}
+    assert by_name["pushover.send"]["parentSpanId"] == root["spanId"]
+    assert by_name["pushover.send"]["attributes"] == {
+        "attempt": 1, "mapping": "alerts@home.local", "http.status": 200, "outcome": "ok"}
+    assert by_name["route"]["attributes"]["mapping"] == "alerts@home.local"
+
+@pytest.mark.asyncio
+async def test_unsampled_message_keeps_id_but_records_nothing():
+    recorded = []
+
+    class Exporter:
+        def export(self, spans):
+            recorded.extend(spans)
+
+        def close(self):
+            pass
+    tracer = Tracer(Exporter(), sample_rate=0.0)
+    h = Handler(Config(default_user_key="U0"), tracer=tracer)
+    jobs = []
+    h.delivery.submit = lambda job: jobs.append(job) or True
+    assert (await h.handle_DATA(None, None, Envelope())).startswith("250")
+    tracer.close()
+    assert len(jobs[0].trace_id) == 32 and jobs[0].parent_span is None
+    assert recorded == []
+
+def test_trace_context_survives_the_spool(tmp_path):
+    spool = open_spool(str(tmp_path))
+    spool.enqueue(["a@b"], "x@y", b"", {}, "T", "M", "U1", trace_id="ab" * 16, parent_span="cd" * 8)
+    record = spool.lease(10)[0]
+    job = Handler(Config(default_user_key="U0"))._job_from_record(record)
+    assert (job.trace_id, job.parent_span) == ("ab" * 16, "cd" * 8)
+
+def test_otlp_payload_shape():
+    span = {"traceId": "ab" * 16, "spanId": "cd" * 8, "parentSpanId": "", "name": "parse",
+            "startTimeUnixNano": 1, "endTimeUnixNano": 2, "attributes": {"attempt": 1, "ok": True}}
+    payload = OTLPHttpExporter("http://collector/v1/traces").payload([span])
+    resource = payload["resourceSpans"][0]
+    assert resource["resource"]["attributes"][0]["value"] == {"stringValue": "signalhub"}
+    otlp = resource["scopeSpans"][0]["spans"][0]
+    assert otlp["startTimeUnixNano"] == "1"
+    assert otlp["attributes"] == [
+        {"key": "attempt", "value": {"intValue": "1"}},
+        {"key": "ok", "value": {"boolValue": True}},
+    ]
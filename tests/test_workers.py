@@ -0,0 +1,71 @@
+import queue
+import smtplib
+import time
+from signalhub.config import Config
+from signalhub.metrics import merge
+from signalhub.workers import MetricsAggregator, ReusePortController, worker_config
+
+class Sink:
+    def __init__(self):
+        self.count = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.count += 1
+        return '250 OK'
+
+def test_controllers_share_port():
+    sinks = [Sink(), Sink()]
+    controllers = [ReusePortController(s, hostname="127.0.0.1", port=2727) for s in sinks]
+    for c in controllers:
+        c.start()
+    try:
+        for n in range(20):
+            with smtplib.SMTP("127.0.0.1", 2727) as client:
+                client.sendmail("a@x", ["b@y"], f"Subject: {n}\n\nbody")
+    finally:
+        for c in controllers:
+            c.stop()
+    assert sum(s.count for s in sinks) == 20
+
+def snap(received, rtt_row=None):
+    hist = {"help": "h", "buckets": (0.1, 1), "labelnames": ("mapping",),
+            "series": {("default",): rtt_row} if rtt_row else {}}
+    return {"counters": {"emails_received": received}, "gauges": {"delivery_queue_jobs": 1},
+            "histograms": {"pushover_rtt_seconds": hist}}
+
+def test_metrics_aggregator_merges_latest_snapshots():
+    q = queue.Queue()
+    agg = MetricsAggregator(q)
+    agg.start()
+    q.put((0, snap(3)))
+    q.put((1, snap(5, [1, 0, 0, 0.05])))
+    q.put((0, snap(4, [0, 2, 1, 4.0])))
+    deadline = time.time() + 2
+    while agg.totals()["counters"].get("emails_received") != 9 and time.time() < deadline:
+        time.sleep(0.01)
+    agg.stop()
+    totals = agg.totals()
+    assert totals["counters"] == {"emails_received": 9}
+    assert totals["gauges"] == {"delivery_queue_jobs": 2, "smtp_workers": 2}
+    assert totals["histograms"]["pushover_rtt_seconds"]["series"][("default",)] == [1, 2, 1, 4.05]
+    agg.forget(1)
+    assert agg.totals()["counters"]["emails_received"] == 4
+
+def test_global_gauges_are_not_summed():
+    snaps = [{"counters": {}, "gauges": {"pushover_quota_remaining": n, "delivery_queue_jobs": 1},
+              "histograms": {}} for n in (480, 500, 490)]
+    assert merge(snaps)["gauges"] == {"pushover_quota_remaining": 500, "delivery_queue_jobs": 3}
+
+def test_worker_config_splits_account_limits():
+    cfg = worker_config(Config(rate_limit_per_minute=120, pushover_monthly_quota=10000), 4)
+    assert cfg.rate_limit_per_minute == 30
+    assert worker_config(cfg, 1) is cfg
+
+def test_worker_config_keeps_app_wide_quota():
+    cfg = worker_config(Config(pushover_monthly_quota=10000, pushover_quota_reserve=100), 4)
+    assert (cfg.pushover_monthly_quota, cfg.pushover_quota_reserve) == (10000, 100)
+
+def test_worker_config_splits_recipient_and_sender_limits():
+    cfg = worker_config(Config(rate_limit_per_recipient=10, rate_limit_per_sender=3), 4)
+    assert (cfg.rate_limit_per_recipient, cfg.rate_limit_per_sender) == (2, 1)
+    assert worker_config(Config(), 4).rate_limit_per_recipient == 0  # still unlimited